@@ -0,0 +1,229 @@
+'''\
+qb_abs_player provides the playing logic of the Player
+without any information about timers and sounds.
+'''
+
+
+from time import perf_counter
+from typing import Callable, Iterable, NamedTuple, Tuple
+
+from qb_abs_storage import AbstractStorageClient, AbstractSound
+from qb_core import AbstractSampleClient, CellToggled, beat_period
+from qb_engine import BeatEngine
+from qb_render import Renderer, write_wav
+from qb_telemetry import BeatTelemetry
+
+
+class AbstractPlayer(AbstractSampleClient, AbstractStorageClient):
+    '''\
+    Implement playing cycle, the timer should be implemented.
+
+    Word about timer policy:
+    Beats are played by the BeatEngine, the player only edits the sample
+    and sends changes to the engine as messages (read a "Word about threading
+    policy" in docs of the BeatEngine). Changes of the mapping come as events
+    (read a "Word about changes policy" in docs of the AbstractSampleClient):
+    toggled cells are sent as columns, other changes resend patterns.
+    'play' runs one tick of the engine and presets the single-shot timer
+    by '_start_timer' (or cancels it by '_stop_timer'), the timer should
+    call 'play' again. Beats are timed by the clock that is returned by
+    '_get_clock', so the same logic works with the real event loop, in the
+    audio thread (read about it in qb_player) and without both of them
+    (read about it in qb_headless).
+    '''
+
+    def __init__(self, /, time_sign: Tuple[int] = (4, 8), bpm: int = 90, tact_n: int = 3,
+                 lookahead: float = 0.05) -> None:
+        super().__init__(time_sign=time_sign, bpm=bpm, tact_n=tact_n)
+
+        self._volume = 0
+        self._is_turned_on = False
+        self._renderer = Renderer()
+        self._renderer.set_volume(self._volume)
+
+        self._engine = BeatEngine(beat_period(self.bpm, self.time_sign),
+                                  lookahead=lookahead, clock=self._get_clock())
+        self._engine.send('patterns', (self._masks(),), ())
+        self.subscribe(self._mapping_changed)
+        self.subscribe(self._journal_changes)
+
+    def _get_clock(self) -> Callable[[], float]:
+        '''\
+        Return the source of the time in seconds.
+        '''
+
+        return perf_counter
+
+    def _start_timer(self, delay: float) -> None:
+        '''\
+        Should be implemented.
+        '''
+
+    def _stop_timer(self) -> None:
+        '''\
+        Should be implemented.
+        '''
+
+    def _send(self, name: str, *args) -> None:
+        '''\
+        Send the message to the engine and let it apply the message.
+        '''
+
+        self._engine.send(name, *args)
+        self.play()
+
+    def _send_patterns(self) -> None:
+        '''\
+        Send all patterns and slots that should be played.
+        '''
+
+        self._engine.send('patterns', tuple(pattern.masks() for pattern in self._patterns),
+                          tuple(self._sounds),
+                          tuple(pattern.meters() for pattern in self._patterns))
+        self._send('slots', self._slots())
+
+    def _patterns_changed(self) -> None:
+        self._send_patterns()
+        # Patterns and the song are journaled by snapshots
+        self._journal_changes(())
+
+    def _mapping_changed(self, changes: Tuple[Tuple[int, NamedTuple]]) -> None:
+        '''\
+        Read a "Word about timer policy" in the class docs.
+        '''
+
+        if not all(isinstance(event, CellToggled) for _, event in changes):
+            self._send_patterns()
+            return
+        columns = {(index, event.step) for index, event in changes}
+        masks = {index: self._patterns[index].masks() for index, _ in columns}
+        for index, step in sorted(columns):
+            self._engine.send('column', index, step, masks[index][step])
+        self.play()
+
+    def _install_sound(self, sound: AbstractSound, mapping: Iterable[int]) -> None:
+        self._add_sound(sound, mapping)
+
+    def _install_config(self, config: dict) -> None:
+        if 'time_sign' in config and (config['time_sign'], config['tact_n']) != \
+                (tuple(self.time_sign), self.get_tact_n()):
+            self.resize(config['time_sign'], config['tact_n'], 'keep')
+        if 'bpm' in config:
+            self.set_bpm(config['bpm'])
+
+    def _get_view(self) -> Iterable:
+        yield self._patterns[0].view()
+        yield self._sounds
+        yield {'time_sign': self.time_sign, 'tact_n': self.get_tact_n(), 'bpm': self.bpm,
+               'patterns': tuple(pattern.array() for pattern in self._patterns[1:]),
+               'song': self.get_song(),
+               'lengths': tuple(pattern.lengths() for pattern in self._patterns)}
+
+    def play(self) -> None:
+        '''\
+        Run and implement playing cycle.
+        '''
+
+        delay = self._engine.tick()
+        if delay is None:
+            self._stop_timer()
+        else:
+            self._start_timer(delay)
+
+    def set_lookahead(self, lookahead: float) -> None:
+        '''\
+        Set how far (in seconds) beats are queued in advance.
+        '''
+
+        self._send('lookahead', lookahead)
+
+    def get_lateness(self) -> Iterable[float]:
+        '''\
+        Return how late (in seconds) recent beats were fired.
+        '''
+
+        return tuple(self._engine.telemetry.lateness().tolist())
+
+    def get_telemetry(self) -> BeatTelemetry:
+        '''\
+        Return the telemetry of beats, read about it in qb_telemetry.
+        '''
+
+        return self._engine.telemetry
+
+    def export_telemetry(self, path: str) -> None:
+        '''\
+        Write the telemetry of beats to the CSV or JSON file (by the extension).
+        '''
+
+        self._engine.telemetry.export(path)
+
+    def set_bpm(self, bpm: int) -> None:
+        '''\
+        Reuse inherited 'set_bpm' and update the beat period.
+        '''
+
+        self._set_bpm(bpm)
+        self._send('period', beat_period(self.bpm, self.time_sign))
+
+    def resize(self, time_sign: Tuple[int] = (4, 8), tact_n: int = 3,
+               mode: str = 'clear') -> None:
+        '''\
+        Reuse inherited 'resize' and update the beat period.
+        '''
+
+        self._resize(time_sign, tact_n, mode)
+        self._send('period', beat_period(self.bpm, self.time_sign))
+
+    def bounce(self, path: str, loops: int = 1) -> None:
+        '''\
+        Render 'loops' repeats of the sample to the wave file offline.
+        '''
+
+        self._renderer.set_tempo(self.bpm, self.time_sign)
+        frames = self._renderer.render(self.view(), (sound.source() for sound in self._sounds),
+                                       loops, self.get_lengths())
+        write_wav(path, frames, self._renderer.rate)
+
+    def set_volume(self, volume: float) -> None:
+        '''\
+        Update volume of all sounds.
+        '''
+
+        self._volume = volume
+        self._renderer.set_volume(volume)
+        self._send('volume', volume)
+
+    def turn(self) -> None:
+        '''\
+        Method for encapsulation play on/off logic.
+        '''
+
+        if self._is_turned_on:
+            return self.turn_off()
+        self.turn_on()
+
+    def turn_on(self) -> None:
+        '''\
+        Start playing.
+        '''
+
+        self._is_turned_on = True
+        self._send('start')
+
+    def turn_off(self) -> None:
+        '''\
+        Stop playing, beats that are queued but not played
+        will be played after the next 'turn_on'.
+        '''
+
+        self._is_turned_on = False
+        self._send('stop')
+
+    def goto_start(self) -> None:
+        '''\
+        Move the play pointer to the beginning of the sample
+        (of the song in the song mode).
+        '''
+
+        self._send('goto', 0)
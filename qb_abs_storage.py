@@ -3,7 +3,7 @@
 '''
 
 
-from typing import Callable, Iterable, List
+from typing import Callable, Dict, Iterable, List, Optional
 
 
 class AbstractSound():
@@ -58,11 +58,29 @@ class AbstractStorage():
 
     def __init__(self) -> None:
         self._install_sound = print
+        self._install_song = print
+        self._install_config = print
         self._draw_sound = print
         self._update_view = print
 
         self._display_notification = print
 
+        self._embed_sounds = False
+
+    def set_embedding(self, embed: bool) -> None:
+        '''\
+        '_embed_sounds' is used to store sound files in the project.
+        '''
+
+        self._embed_sounds = embed
+
+    def set_voices(self, voices: int, policy: str = 'round-robin') -> None:
+        '''\
+        Set how many hits of the same sound may overlap and what
+        voice plays the hit when all are busy ('round-robin' or 'oldest'),
+        it affects sounds that are loaded after.
+        '''
+
     def set_notification_callback(self, callback: Callable) -> None:
         '''\
         '_display_notification' is used to notify user about errors.
@@ -77,6 +95,24 @@ class AbstractStorage():
 
         self._install_sound = callback
 
+    def set_install_song_callback(self, callback: Callable) -> None:
+        '''\
+        '_install_song' is used to add patterns and slots of the song
+        after sounds of the project are installed, read about it in
+        docs of 'load_sounds'.
+        '''
+
+        self._install_song = callback
+
+    def set_install_config_callback(self, callback: Callable) -> None:
+        '''\
+        '_install_config' is used to apply settings of the loaded project
+        (read about them in docs of 'unload_project') before its sounds
+        are installed, only known settings are given.
+        '''
+
+        self._install_config = callback
+
     def set_draw_sound_callback(self, callback: Callable) -> None:
         '''\
         '_draw_sound' is used to display a sound representation.
@@ -91,15 +127,52 @@ class AbstractStorage():
 
         self._update_view = callback
 
+    def cache_stats(self) -> Dict[str, int]:
+        '''\
+        Return counters of the cache of loaded sounds
+        ('hits', 'misses', 'entries', 'size', 'capacity').
+        '''
+
+        return {}
+
     def upload_project(self, pjpath: str) -> None:
         '''\
         Load project from the 'pjpath'.
         '''
 
     def unload_project(self, pjpath: str, mapping: Iterable[Iterable[int]],
-                       sounds: List[AbstractSound]) -> None:
+                       sounds: List[AbstractSound], config: Optional[dict] = None) -> None:
         '''\
         Save project to the 'pjpath'.
+
+        'config' is the settings of the player that are stored
+        with the project: 'time_sign', 'tact_n', 'bpm' and the song:
+        'patterns' (mappings of patterns after the first one), 'song' (slots)
+        and 'lengths' (lengths of sounds of each pattern, the first one too).
+        '''
+
+    def open_journal(self, pjpath: str, threshold: int = 2 ** 20) -> None:
+        '''\
+        Start journaling changes next to the 'pjpath' (the autosave),
+        the journal is compacted when records pass the 'threshold' (bytes).
+        '''
+
+    def close_journal(self) -> None:
+        '''\
+        Write all journaled changes and stop journaling.
+        '''
+
+    def write_journal(self, changes: tuple, mapping: Iterable[Iterable[int]],
+                      sounds: List[AbstractSound], config: Optional[dict] = None) -> None:
+        '''\
+        Journal changes of the mapping (read a "Word about changes policy"
+        in docs of the qb_core.AbstractSampleClient), other arguments
+        are the same as the 'unload_project' gets.
+        '''
+
+    def recover_project(self, pjpath: str) -> None:
+        '''\
+        Load the project from the 'pjpath' with changes of its journal.
         '''
 
     def load_sound(self, sound_path: str, mapping: Iterable[int]) -> None:
@@ -108,6 +181,19 @@ class AbstractStorage():
         after the successful loading.
         '''
 
+    def load_sounds(self, sound_paths: Iterable[str], mappings: Iterable[Iterable[int]],
+                    song: Optional[tuple] = None) -> None:
+        '''\
+        Method that load sounds as the batch: sounds are
+        installed in the given order and the view is updated
+        once after all of them are loaded.
+
+        'song' is the triple: mappings of other patterns (2-D arrays, a row
+        per sound path), slots and lengths of sounds of each pattern (the
+        first one too, it may be empty). Rows of sounds that are not loaded
+        are dropped, then '_install_song' is called before the view is updated.
+        '''
+
 
 class AbstractStorageClient():
     '''\
@@ -121,6 +207,9 @@ class AbstractStorageClient():
     def __init__(self) -> None:
         self._storage = self._storage()
         self._storage.set_install_sound_callback(self._install_sound)
+        self._storage.set_install_song_callback(self._install_song)
+        self._storage.set_install_config_callback(self._install_config)
+        self._is_autosaved = False
         super().__init__()
 
     def add_sound(self, sound_path: str) -> None:
@@ -151,6 +240,27 @@ class AbstractStorageClient():
 
         self._storage.set_draw_sound_callback(callback)
 
+    def set_embedding(self, embed: bool) -> None:
+        '''\
+        Read about it in docs of AbstractStorage.
+        '''
+
+        self._storage.set_embedding(embed)
+
+    def set_voices(self, voices: int, policy: str = 'round-robin') -> None:
+        '''\
+        Read about it in docs of AbstractStorage.
+        '''
+
+        self._storage.set_voices(voices, policy)
+
+    def get_cache_stats(self) -> Dict[str, int]:
+        '''\
+        Read about it in docs of AbstractStorage.
+        '''
+
+        return self._storage.cache_stats()
+
     def load_pj(self, path: str) -> None:
         '''\
         Facade for the 'AbstractStorage.unload_project'.
@@ -165,6 +275,32 @@ class AbstractStorageClient():
 
         self._storage.unload_project(path, *self._get_view())
 
+    def autosave(self, pjpath: Optional[str], threshold: int = 2 ** 20) -> None:
+        '''\
+        Journal changes of the mapping next to the 'pjpath' (stop it if
+        'pjpath' is None), the player should pass its changes to
+        '_journal_changes'. The journal starts from the current project.
+        Read about 'threshold' in docs of AbstractStorage.open_journal.
+        '''
+
+        self._is_autosaved = pjpath is not None
+        if pjpath is None:
+            self._storage.close_journal()
+        else:
+            self._storage.open_journal(pjpath, threshold)
+            self._journal_changes(())
+
+    def recover_pj(self, path: str) -> None:
+        '''\
+        Facade for the 'AbstractStorage.recover_project'.
+        '''
+
+        self._storage.recover_project(path)
+
+    def _journal_changes(self, changes: tuple) -> None:
+        if self._is_autosaved:
+            self._storage.write_journal(changes, *self._get_view())
+
     def _get_view(self) -> Iterable:
         '''\
         Should be implemented.
@@ -177,3 +313,13 @@ class AbstractStorageClient():
         '''\
         Should be implemented.
         '''
+
+    def _install_song(self, mappings: Iterable, slots: Iterable, lengths: Iterable = ()) -> None:
+        '''\
+        Should be implemented.
+        '''
+
+    def _install_config(self, config: dict) -> None:
+        '''\
+        Should be implemented.
+        '''
@@ -0,0 +1,227 @@
+'''\
+qb_batch renders many projects to wave files in parallel, without ui.
+
+Run it as the script:
+    python qb_batch.py 'projects/*.qbp' -o previews
+    python qb_batch.py a.qbp b.qbp -o stems --stems --seconds 30
+'''
+
+
+import sys
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from glob import glob
+from os import cpu_count, makedirs, path as ospath
+from time import perf_counter
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from qb_cache import LRUCache
+from qb_file_storage import extract_blob
+from qb_format import Project, read_project
+from qb_render import Renderer, write_wav
+
+
+class Job(NamedTuple):
+    '''\
+    What should be rendered and how.
+    '''
+
+    pjpath: str
+    output: str
+    stems: bool = False
+    loops: int = 1
+    seconds: float = 0.0
+    volume: float = 1.0
+    rate: int = 44100
+    # The name of outputs (read about it in 'output_names'), the project name by default
+    name: str = ''
+
+
+class Result(NamedTuple):
+    '''\
+    Written files and the time of rendering, or the error.
+    '''
+
+    pjpath: str
+    outputs: Tuple[str] = ()
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+_CACHE: Optional[LRUCache] = None
+
+
+def init_worker(cache_capacity: int) -> None:
+    '''\
+    Make the cache of decoded sounds of the worker process,
+    so sounds that are shared by projects are decoded once per worker.
+    '''
+
+    global _CACHE  # pylint: disable=global-statement
+    _CACHE = LRUCache(cache_capacity, lambda frames: frames.nbytes)
+
+
+def expand(patterns: Iterable[str]) -> List[str]:
+    '''\
+    Return paths of projects: globs are expanded ('**' matches
+    subdirectories too), duplicates are dropped.
+    '''
+
+    paths = []
+    for pattern in patterns:
+        paths.extend(sorted(glob(pattern, recursive=True)) or [pattern])
+    return list(dict.fromkeys(ospath.normpath(path) for path in paths))
+
+
+def output_names(pjpaths: Iterable[str]) -> List[str]:
+    '''\
+    Return names of outputs of projects (without the extension): paths
+    relative to the common directory of projects, so projects of the
+    same name from different directories don't collide.
+    '''
+
+    pjpaths = [ospath.abspath(pjpath) for pjpath in pjpaths]
+    try:
+        root = ospath.commonpath([ospath.dirname(pjpath) for pjpath in pjpaths])
+    except ValueError:
+        # No projects or they are on different drives
+        root = ''
+    return [ospath.splitext(ospath.relpath(pjpath, root) if root
+                            else ospath.splitdrive(pjpath)[1].lstrip('\\/'))[0]
+            for pjpath in pjpaths]
+
+
+def sound_paths(pjpath: str, project: Project) -> List[str]:
+    '''\
+    Return paths of sounds as the Storage uses them, but relative paths
+    that don't exist are also looked up near the project.
+    '''
+
+    blobs = project.blobs or (None,) * len(project.paths)
+    paths = []
+    for sound_path, blob in zip(project.paths, blobs):
+        near = ospath.join(ospath.dirname(pjpath), sound_path)
+        if not ospath.exists(sound_path) and ospath.exists(near):
+            sound_path = near
+        if not ospath.exists(sound_path) and blob is not None:
+            sound_path = extract_blob(blob)
+        paths.append(sound_path)
+    return paths
+
+
+def render(job: Job) -> Result:
+    '''\
+    Render the project of the job, errors are returned, not raised.
+    '''
+
+    start = perf_counter()
+    try:
+        outputs = _render(job)
+    except Exception as error:  # pylint: disable=broad-except
+        return Result(job.pjpath, error=f'{type(error).__name__}: {error}')
+    return Result(job.pjpath, outputs, perf_counter() - start)
+
+
+def _render(job: Job) -> Tuple[str]:
+    project = read_project(job.pjpath)
+    renderer = Renderer(job.rate, cache=_CACHE)
+    renderer.set_volume(job.volume)
+    if project.bpm:
+        renderer.set_tempo(project.bpm, project.time_sign)
+
+    sources = sound_paths(job.pjpath, project)
+    patterns = (project.mapping,) + tuple(project.patterns)
+    loops = job.loops
+    if job.seconds:
+        slots = project.song or ((0, 1),)
+        song_len = sum(np.shape(patterns[index])[1] * repeats for index, repeats in slots)
+        loops = renderer.loops_for(job.seconds, song_len or 1)
+
+    name = job.name or ospath.splitext(ospath.basename(job.pjpath))[0]
+    if not job.stems:
+        output = ospath.join(job.output, name + '.wav')
+        makedirs(ospath.dirname(output) or '.', exist_ok=True)
+        write_wav(output, renderer.render_song(patterns, project.song, sources, loops,
+                                               lengths=project.lengths), renderer.rate)
+        return (output,)
+
+    makedirs(ospath.join(job.output, name), exist_ok=True)
+    outputs = []
+    for row, source in enumerate(sources):
+        sound_name = ospath.splitext(ospath.basename(source))[0]
+        output = ospath.join(job.output, name, f'{row:02}_{sound_name}.wav')
+        stems = tuple(pattern[row:row + 1] for pattern in patterns)
+        write_wav(output, renderer.render_song(
+            stems, project.song, (source,), loops,
+            lengths=tuple(lengths[row:row + 1] for lengths in project.lengths)), renderer.rate)
+        outputs.append(output)
+    return tuple(outputs)
+
+
+def run(jobs: List[Job], workers: int, cache_capacity: int) -> List[Result]:
+    '''\
+    Render jobs by the pool of processes and print the progress,
+    results are returned in the order of completion.
+    '''
+
+    results = []
+    with ProcessPoolExecutor(workers, initializer=init_worker,
+                             initargs=(cache_capacity,)) as pool:
+        futures = [pool.submit(render, job) for job in jobs]
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            results.append(result)
+            if result.error is None:
+                print(f'[{done}/{len(jobs)}] {result.pjpath} -> '
+                      f'{len(result.outputs)} file(s) in {result.seconds:.3f}s', flush=True)
+            else:
+                print(f'[{done}/{len(jobs)}] {result.pjpath} FAILED: {result.error}',
+                      flush=True)
+    return results
+
+
+def parse_args(argv: Optional[List[str]] = None) -> Namespace:
+    '''\
+    Read about arguments by the '--help'.
+    '''
+
+    parser = ArgumentParser(description='Render qbeater projects to wave files')
+    parser.add_argument('projects', nargs='+', help='project files or globs')
+    parser.add_argument('-o', '--output', default='.', help='directory of wave files')
+    parser.add_argument('--stems', action='store_true', help='one wave file per sound row')
+    parser.add_argument('--loops', type=int, default=1, help='repeats of the project')
+    parser.add_argument('--seconds', type=float, default=0.0,
+                        help='render at least this length (overrides --loops)')
+    parser.add_argument('--volume', type=float, default=1.0)
+    parser.add_argument('--rate', type=int, default=44100)
+    parser.add_argument('-j', '--jobs', type=int, default=cpu_count() or 1,
+                        help='worker processes')
+    parser.add_argument('--cache', type=int, default=256,
+                        help='decoded sounds cache of each worker (MiB)')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    '''\
+    Render all projects, return 1 if any of them failed.
+    '''
+
+    args = parse_args(argv)
+    makedirs(args.output, exist_ok=True)
+    pjpaths = expand(args.projects)
+    jobs = [Job(pjpath, args.output, args.stems, args.loops, args.seconds,
+                args.volume, args.rate, name)
+            for pjpath, name in zip(pjpaths, output_names(pjpaths))]
+
+    start = perf_counter()
+    results = run(jobs, max(args.jobs, 1), args.cache * 2 ** 20)
+    failed = [result for result in results if result.error is not None]
+    print(f'Rendered {len(results) - len(failed)} of {len(results)} project(s) '
+          f'in {perf_counter() - start:.3f}s')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
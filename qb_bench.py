@@ -0,0 +1,294 @@
+'''\
+qb_bench provides benchmarks of hot paths: the sequencer, the storage,
+the rhythm index, the ui and the timing of the playing cycle.
+
+Run it as the script:
+    python qb_bench.py --quick --compare      (fail on regressions)
+    python qb_bench.py --save bench.json      (make the baseline)
+    python qb_bench.py --compare bench.json   (compare to it)
+
+The baseline of the quick run is kept in the bench_baseline.json,
+it is used by '--compare' without the file.
+'''
+
+
+import json
+import random
+import sys
+from argparse import ArgumentParser
+from os import path as ospath
+from statistics import median
+from tempfile import TemporaryDirectory
+from timeit import Timer
+from typing import Callable, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from qb_abs_storage import AbstractSound
+from qb_core import Sample
+from qb_edit import euclidean
+from qb_engine import BeatEngine
+from qb_headless import HeadlessPlayer, SystemClock, WaveStorage
+from qb_index import Entry, RhythmIndex, fingerprints, project_fingerprint
+from qb_mapping import ArrayMapping, BytesMapping
+from qb_render import write_wav
+
+
+Results = Dict[str, float]
+
+BASELINE = ospath.join(ospath.dirname(ospath.abspath(__file__)), 'bench_baseline.json')
+
+BENCHES: List[Callable[[bool], Iterator[Tuple[str, float]]]] = []
+
+
+def bench(func: Callable) -> Callable:
+    '''\
+    Register the benchmark, it takes the 'quick' flag
+    and yields pairs (name, seconds).
+    '''
+
+    BENCHES.append(func)
+    return func
+
+
+def measure(func: Callable[[], object], repeat: int = 3) -> float:
+    '''\
+    Return the best time of the single call of 'func' in seconds,
+    the number of calls per measure is chosen by timeit.
+    '''
+
+    timer = Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def make_sample(rows: int, steps: int, mapping_type: type, density: float = 0.25) -> Sample:
+    '''\
+    Return the sample with random mapping, the seed is fixed.
+    '''
+
+    rand = random.Random(rows * steps)
+    sample = Sample([], tact_l=steps, tact_n=1, mapping_type=mapping_type)
+    for i in range(rows):
+        sample.append(i, [int(rand.random() < density) for _ in range(steps)])
+    return sample
+
+
+@bench
+def bench_beat(quick: bool) -> Iterator[Tuple[str, float]]:
+    '''\
+    'BeatEngine._next_beat' (the beat of the playing cycle) against the
+    number of rows, with rows of the full length and with meters.
+    '''
+
+    for rows in (8, 64) if quick else (8, 64, 256, 1024):
+        sample = make_sample(rows, 16, BytesMapping)
+        sounds = tuple(AbstractSound(row) for row in range(rows))
+        for name in ('beat', 'beat+metre'):
+            if name == 'beat+metre':
+                for row in range(0, rows, 2):
+                    sample.set_length(row, 12 + row % 3)
+            engine = BeatEngine(1.0)
+            engine.send('patterns', [sample.masks()], sounds, [sample.meters()])
+            # The engine is stopped, so the tick only applies messages
+            engine.tick()
+            yield (f'{name}/{rows}',
+                   measure(engine._next_beat))  # pylint: disable=protected-access
+
+
+@bench
+def bench_grid(quick: bool) -> Iterator[Tuple[str, float]]:
+    '''\
+    'Sample.switch', 'Sample.view' and the bulk edit (qb_edit.euclidean)
+    against the size of the grid.
+    '''
+
+    for mapping_type in (BytesMapping, ArrayMapping):
+        for rows, steps in ((16, 16), (64, 64)) if quick else ((16, 16), (64, 64), (256, 256)):
+            sample = make_sample(rows, steps, mapping_type)
+            size = f'{mapping_type.__name__}/{rows}x{steps}'
+            yield (f'switch/{size}',
+                   measure(lambda sample=sample, row=rows - 1, step=steps - 1:
+                           sample.switch(row, step)))
+            yield (f'view/{size}',
+                   measure(lambda sample=sample: [bytes(line) for line in sample.view()]))
+            yield (f'edit/{size}',
+                   measure(lambda sample=sample, rows=range(0, rows, 2):
+                           sample.assign(euclidean(sample.array(), 5, 16, rows=rows))))
+
+
+@bench
+def bench_storage(quick: bool) -> Iterator[Tuple[str, float]]:
+    '''\
+    'upload_project' and 'unload_project' against the number of sounds,
+    the WaveStorage is used, because the Storage loads sounds asynchronously.
+    Sounds are decoded by each upload (the cache is off), the cached upload
+    is measured aside. The project is flushed to the disk by each unload.
+    '''
+
+    with TemporaryDirectory() as tmp:
+        for rows in (8, 64) if quick else (8, 64, 256):
+            player = HeadlessPlayer(tact_n=16)
+            player.set_notification_callback(lambda message: None)
+            player.set_draw_sound_callback(lambda sound: None)
+            player.set_redraw_mapping_callback(lambda: None)
+            for i in range(rows):
+                sound_path = ospath.join(tmp, f'{i}.wav')
+                write_wav(sound_path, np.zeros((4410, 2), np.float32), 44100)
+                player.add_sound(sound_path)
+            pjpath = ospath.join(tmp, f'{rows}.qbp')
+            yield (f'unload_project+fsync/{rows}',
+                   measure(lambda player=player, pjpath=pjpath: player.store_pj(pjpath)))
+
+            storage = WaveStorage()
+            storage.set_notification_callback(lambda message: None)
+            storage.set_install_sound_callback(lambda sound, mapping: None)
+            storage.set_draw_sound_callback(lambda sound: None)
+            storage.set_update_view_callback(lambda: None)
+            storage.set_install_config_callback(lambda config: None)
+            storage.set_cache_capacity(0)
+            yield (f'upload_project/{rows}',
+                   measure(lambda storage=storage, pjpath=pjpath: storage.upload_project(pjpath)))
+            storage.set_cache_capacity(64 * 2 ** 20)
+            yield (f'upload_project+cache/{rows}',
+                   measure(lambda storage=storage, pjpath=pjpath: storage.upload_project(pjpath)))
+
+
+@bench
+def bench_index(quick: bool) -> Iterator[Tuple[str, float]]:
+    '''\
+    Querying of the rhythm index against the number of projects,
+    fingerprints are put to the index directly, files aren't read.
+    '''
+
+    sample = make_sample(16, 16, ArrayMapping)
+    for projects in (1000,) if quick else (1000, 10000):
+        index = RhythmIndex()
+        for i in range(projects):
+            mapping = make_sample(8, 16, ArrayMapping, density=(i % 7 + 1) / 10).array()
+            rows = fingerprints(mapping)
+            index.put(str(i), Entry(0, 0, project_fingerprint(rows, mapping), rows))
+        yield (f'index_query/{projects}',
+               measure(lambda index=index: index.query(sample.view(), 10)))
+
+
+@bench
+def bench_ui(quick: bool) -> Iterator[Tuple[str, float]]:
+    '''\
+    Redrawing of the mapping and reshaping of the grid for big grids,
+    it is skipped if PyQt5 is not available.
+    '''
+
+    try:
+        from PyQt5.QtWidgets import QApplication  # pylint: disable=import-outside-toplevel
+        import qb_ui  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+
+    for rows, tact_n in ((16, 4), (64, 8)) if quick else ((16, 4), (64, 8), (128, 32)):
+        sample = make_sample(rows, 4 * tact_n, ArrayMapping)
+        grid = qb_ui.PatternGrid(tact_l=4, tact_n=tact_n)
+        for _ in range(rows):
+            grid.add_row()
+
+        def redraw(grid=grid, sample=sample) -> None:
+            sample.switch(0, 0)
+            grid.show_mapping(sample.view())
+            grid.repaint()
+            app.processEvents()
+
+        def reshape(grid=grid, tact_n=tact_n) -> None:
+            grid.reshape(4, tact_n + 1)
+            grid.reshape(4, tact_n)
+            app.processEvents()
+
+        size = f'{rows}x{4 * tact_n}'
+        yield f'redraw_mapping/{size}', measure(redraw)
+        yield f'reshape/{size}', measure(reshape) / 2
+
+
+@bench
+def bench_jitter(quick: bool) -> Iterator[Tuple[str, float]]:
+    '''\
+    Lateness of beats of the playing cycle by the real clock,
+    the period is short, so thousands of steps are played fast.
+    '''
+
+    player = HeadlessPlayer(time_sign=(4, 4), bpm=6000, tact_n=4, clock=SystemClock())
+    player.set_lookahead(0.001)
+    steps = 500 if quick else 3000
+    player.turn_on()
+    player.run(steps * 0.01)
+    player.turn_off()
+
+    lateness = sorted(player.get_lateness())
+    yield 'jitter/median', median(lateness)
+    yield 'jitter/p99', lateness[int(len(lateness) * 0.99)]
+
+
+def run_benches(quick: bool = False, pattern: str = '') -> Results:
+    '''\
+    Run benchmarks whose function names contain 'pattern' and print them.
+    '''
+
+    results = {}
+    for func in BENCHES:
+        if pattern not in func.__name__:
+            continue
+        for name, seconds in func(quick):
+            results[name] = seconds
+            print(f'{name:40} {seconds * 1e6:12.2f} us')
+    return results
+
+
+def compare(results: Results, baseline: Results, threshold: float) -> List[str]:
+    '''\
+    Return names of results that are slower than the baseline
+    by more than 'threshold' (relative), and print the comparison.
+    '''
+
+    regressions = []
+    for name, seconds in results.items():
+        if name not in baseline:
+            continue
+        ratio = seconds / baseline[name] if baseline[name] else 1.0
+        mark = ''
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            mark = '  <-- regression'
+        print(f'{name:40} {ratio:8.2f}x{mark}')
+    return regressions
+
+
+def main() -> int:
+    '''\
+    Parse arguments, run benchmarks, save or compare the baseline.
+    '''
+
+    parser = ArgumentParser(description='Benchmarks of qbeater hot paths')
+    parser.add_argument('--quick', action='store_true', help='smaller sizes')
+    parser.add_argument('--filter', default='',
+                        help='run groups containing it (beat, grid, storage, ui, jitter)')
+    parser.add_argument('--save', metavar='JSON', help='save results as the baseline')
+    parser.add_argument('--compare', metavar='JSON', nargs='?', const=BASELINE,
+                        help='compare results to the baseline (bench_baseline.json by default)')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed relative slowdown (default: 0.25)')
+    args = parser.parse_args()
+
+    results = run_benches(args.quick, args.filter)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            baseline = json.load(file)
+        print()
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
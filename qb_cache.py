@@ -0,0 +1,108 @@
+'''\
+qb_cache provides caching of loaded sounds.
+'''
+
+
+from collections import OrderedDict
+from os import path as ospath, stat
+from typing import Callable, Dict, Hashable, Iterator, Optional, Tuple
+
+
+def sound_key(sound_path: str) -> Tuple[str, int, int]:
+    '''\
+    Return the key of the sound file: canonical path, time of
+    the last modification and size, so a changed file is a new key.
+    '''
+
+    real_path = ospath.realpath(sound_path)
+    info = stat(real_path)
+    return real_path, info.st_mtime_ns, info.st_size
+
+
+class LRUCache():
+    '''\
+    Store values with sizes, when the total size exceeds the
+    capacity, the least recently used values are evicted.
+    '''
+
+    def __init__(self, capacity: int, sizeof: Callable[[object], int] = len) -> None:
+        '''\
+        'capacity' - limit of the total size (bytes)
+        'sizeof' - used when the size is not given to 'put'
+        '''
+
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+
+        self._sizeof = sizeof
+        self._size = 0
+        self._entries: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(tuple(self._entries))
+
+    def get(self, key: Hashable, default: object = None) -> object:
+        '''\
+        Return the value and mark it as recently used.
+        '''
+
+        if key not in self._entries:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return self._entries[key][0]
+
+    def put(self, key: Hashable, value: object, size: Optional[int] = None) -> None:
+        '''\
+        Store the value, a value that is larger than
+        the capacity is not stored.
+        '''
+
+        self.discard(key)
+        size = self._sizeof(value) if size is None else size
+        if size > self.capacity:
+            return
+        self._entries[key] = (value, size)
+        self._size += size
+        self.set_capacity(self.capacity)
+
+    def discard(self, key: Hashable) -> None:
+        '''\
+        Remove the value if it is stored.
+        '''
+
+        if key in self._entries:
+            self._size -= self._entries.pop(key)[1]
+
+    def clear(self) -> None:
+        '''\
+        Remove all values, counters are kept.
+        '''
+
+        self._entries.clear()
+        self._size = 0
+
+    def set_capacity(self, capacity: int) -> None:
+        '''\
+        Change the capacity and evict values that don't fit.
+        '''
+
+        self.capacity = capacity
+        while self._size > self.capacity:
+            self._size -= self._entries.popitem(last=False)[1][1]
+
+    def stats(self) -> Dict[str, int]:
+        '''\
+        Return counters and sizes of the cache.
+        '''
+
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries),
+                'size': self._size, 'capacity': self.capacity}
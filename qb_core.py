@@ -3,107 +3,392 @@ qb_core provides tools for sounds's mapping.
 '''
 
 
-from typing import Iterable, Tuple, List
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Tuple
 
+import numpy as np
 
-class Sample():
+from qb_mapping import BytesMapping
+
+
+def beat_period(bpm: int, time_sign: Tuple[int]) -> float:
+    '''\
+    Return the duration of the one beat in seconds,
+    the note length is taken from the time signature.
+    '''
+
+    return 60 / bpm / (time_sign[1] / 4)
+
+
+class CellToggled(NamedTuple):
+    '''\
+    The cell of the sound (row) at the beat (step) is turned on (1) or off (0).
+    '''
+
+    row: int
+    step: int
+    value: int
+
+
+class RowAdded(NamedTuple):
+    '''\
+    The sound is added to the end, its mapping may have turned on cells.
+    '''
+
+    row: int
+
+
+class RowRemoved(NamedTuple):
+    '''\
+    The sound is removed, rows below are moved up.
+    '''
+
+    row: int
+
+
+class Cleared(NamedTuple):
+    '''\
+    All cells are turned off.
+    '''
+
+
+class Resized(NamedTuple):
+    '''\
+    The size of the sample is changed, the whole mapping may be changed.
+    '''
+
+    tact_l: int
+    tact_n: int
+
+
+class Assigned(NamedTuple):
+    '''\
+    The whole mapping is replaced.
+    '''
+
+
+class LengthChanged(NamedTuple):
+    '''\
+    The length of the sound (row) is changed, its cells after it are turned off.
+    '''
+
+    row: int
+    length: int
+
+
+class Observable():
+    '''\
+    Collect events and pass them to observers once per the transaction,
+    read a "Word about events policy" in docs of the Sample.
+    '''
+
+    def __init__(self) -> None:
+        self._observers: List[Callable] = []
+        self._events: list = []
+        self._depth = 0
+        super().__init__()
+
+    def subscribe(self, observer: Callable) -> None:
+        '''\
+        Pass events to the 'observer' after each transaction.
+        '''
+
+        self._observers.append(observer)
+
+    def unsubscribe(self, observer: Callable) -> None:
+        '''\
+        Stop passing events to the 'observer'.
+        '''
+
+        self._observers.remove(observer)
+
+    @contextmanager
+    def transaction(self) -> Iterator['Observable']:
+        '''\
+        Collect events until the outer transaction is closed.
+        '''
+
+        self._depth += 1
+        try:
+            yield self
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                self._flush()
+
+    def _emit(self, event: object) -> None:
+        if self._observers:
+            self._events.append(event)
+            if self._depth == 0:
+                self._flush()
+
+    def _flush(self) -> None:
+        if not self._events:
+            return
+        events, self._events = tuple(self._events), []
+        for observer in tuple(self._observers):
+            self._deliver(observer, events)
+
+    def _deliver(self, observer: Callable, events: tuple) -> None:
+        observer(events)
+
+
+class Sample(Observable):
     '''\
     Sample provides managing for list of sounds
     without any information about what sound is.
+
+    The list of sounds may be shared by several samples
+    (patterns of the song), a sound is added to the list or
+    removed from it only by the first sample that does it.
+
+    Word about events policy:
+    Each change of the mapping is described by the event (CellToggled,
+    RowAdded, RowRemoved, Cleared, Resized, Assigned, LengthChanged). Events
+    are collected while the 'transaction' is open (transactions may be nested)
+    and passed to observers once, when the outer transaction is closed:
+    observer(sample, events). A change outside of transactions is passed at
+    once. Events are not collected if there are no observers, so they cost
+    nothing.
+
+    Word about metre policy:
+    Each sound has its own length (the length of the sample by default),
+    cells after it are always turned off. The sound of the length 'n' is
+    played at the cell 'beats % n', where 'beats' is the number of beats
+    since the start, so rows of 3, 4 and 5 steps go against each other and
+    the mapping is never expanded to their common multiple. Rows are grouped
+    by lengths (read about it in 'meters'), so the beat costs one lookup
+    per length, not per sound. The sample is played by qb_engine.BeatEngine
+    from 'masks' and 'meters'.
     '''
 
-    def __init__(self, sounds: list, /, tact_l: int = 3, tact_n: int = 4) -> None:
+    def __init__(self, sounds: list, /, tact_l: int = 3, tact_n: int = 4,
+                 mapping_type: type = BytesMapping) -> None:
 
         '''\
         'tact_l' - length of tact (metre)
         'tact_n' - number of tacts in sample
+        'mapping_type' - storage of the mapping, read about it in qb_mapping
 
         '_mapping' is used to remind what beat
         what sound should be played.
+
+        '_columns' is an index of the mapping by beats,
+        bit 'i' of the column is set if the sound 'i'
+        should be played at that beat. So the beat costs
+        only the sounds that are played.
         '''
 
         self.tact_l = tact_l
         self.tact_n = tact_n
 
         self._sounds = sounds
-        self._mapping: List[bytearray] = []
+        self._columns: List[int] = [0] * (tact_l * tact_n)
 
-        self._actual_beat_num = 0
         self._sample_len = tact_l * tact_n
         self._sounds_len = len(sounds)
+        self._lengths: List[int] = [self._sample_len] * self._sounds_len
+
+        self._mapping = mapping_type()
+        self._mapping.reset(self._sounds_len, self._sample_len)
+
+        super().__init__()
+
+    def _deliver(self, observer: Callable, events: Tuple[NamedTuple]) -> None:
+        observer(self, events)
 
     def view(self) -> Iterable[Iterable[int]]:
         '''\
-        'view' maskes representation of the mapping.
+        'view' maskes representation of the mapping,
+        lines are read-only views, not copies.
         '''
 
-        for map_line in self._mapping:
-            yield bytes(map_line)
+        yield from self._mapping.rows()
 
+    def hits(self, sound_index: int) -> Iterable[int]:
+        '''\
+        Return beats at which the sound is played.
+        '''
 
-    def switch(self, sound_index: int, beat_index: int) -> None:
+        return self._mapping.hits(sound_index)
+
+    def column(self, beat_index: int) -> Iterable[int]:
         '''\
-        Turn on/off defined sound at defined beat.
+        Return indexes of sounds that are played at the beat.
         '''
 
-        if 0 <= sound_index < self._sounds_len and 0 <= beat_index < self._sample_len:
-            self._mapping[sound_index][beat_index] ^= 1
+        return self._mapping.column(beat_index)
 
-    def beat(self) -> Iterable:
+    def array(self) -> np.ndarray:
         '''\
-        'beat' yields all sounds that should be played
-        at that beat for playing them.
+        Return the mapping as the read-only 2-D array (sounds x beats).
         '''
 
-        for sound_index, sound in enumerate(self._sounds):
-            if self._mapping[sound_index][self._actual_beat_num]:
-                yield sound
+        return self._mapping.array()
 
-        self._actual_beat_num += 1
-        self._actual_beat_num %= self._sample_len
+    def masks(self) -> Tuple[int]:
+        '''\
+        Return the copy of '_columns', read about it in __init__.
+        '''
 
-    def goto_start(self) -> None:
+        return tuple(self._columns)
+
+    def lengths(self) -> Tuple[int]:
+        '''\
+        Return lengths of sounds, read a "Word about metre policy".
+        '''
+
+        return tuple(self._lengths)
+
+    def meters(self) -> Tuple[Tuple[int, int]]:
+        '''\
+        Return groups of sounds that are shorter than the sample: pairs
+        (length, bits of sounds), read a "Word about metre policy".
+        '''
+
+        groups: Dict[int, int] = {}
+        for sound_index, length in enumerate(self._lengths):
+            if length < self._sample_len:
+                groups[length] = groups.get(length, 0) | 1 << sound_index
+        return tuple(sorted(groups.items()))
+
+    def switch(self, sound_index: int, beat_index: int) -> None:
         '''\
-        Turn back play pointer to the beginning of the sample.
+        Turn on/off defined sound at defined beat.
         '''
 
-        self._actual_beat_num = 0
+        if 0 <= sound_index < self._sounds_len and 0 <= beat_index < self._lengths[sound_index]:
+            self._mapping.switch(sound_index, beat_index)
+            self._columns[beat_index] ^= 1 << sound_index
+            self._emit(CellToggled(sound_index, beat_index,
+                                   self._columns[beat_index] >> sound_index & 1))
 
     def clear(self) -> None:
         '''\
         Fill the mapping to the empty state.
         '''
 
-        self._mapping.clear()
-        self._mapping.extend(bytearray(self._sample_len) for _ in range(self._sounds_len))
+        self._mapping.reset(self._sounds_len, self._sample_len)
+        self._columns = [0] * self._sample_len
+        self._emit(Cleared())
 
-    def resize(self, tact_l: int, tact_n: int) -> None:
+    def resize(self, tact_l: int, tact_n: int, mode: str = 'clear') -> None:
         '''\
         Change:
             <*> The time signature. But only metre, because
                 sample don't save note length.
             <*> The 'track' size (amount of tacts in the sample)
 
-        With resizing the mapping will be cleaned
-        by the 'clear' method.
+        'mode' is what happens with the mapping:
+            <*> 'clear' - the mapping is cleaned by the 'clear' method.
+            <*> 'keep' - tacts and beats in tacts are truncated or padded.
+            <*> 'quantize' - beats are moved to the nearest beat of
+                the new metre, tacts are truncated or padded.
+        '''
+
+        if mode == 'clear':
+            self._set_size(tact_l, tact_n)
+            with self.transaction():
+                self.clear()
+                self._emit(Resized(tact_l, tact_n))
+            return
+
+        old = self._mapping.array().reshape(self._sounds_len, self.tact_n, self.tact_l)
+        if mode == 'keep':
+            targets = np.arange(min(tact_l, self.tact_l))
+        elif mode == 'quantize':
+            targets = np.floor(np.arange(self.tact_l) * tact_l / self.tact_l + 0.5)
+            targets = np.minimum(targets, tact_l - 1).astype(np.int64)
+        else:
+            raise ValueError(f'Unknown resize mode ({mode})')
+
+        # Each old beat of the tact is projected to the new beat in one pass
+        projection = np.zeros((self.tact_l, tact_l), np.uint8)
+        projection[np.arange(len(targets)), targets] = 1
+        tacts = min(tact_n, self.tact_n)
+        new = np.zeros((self._sounds_len, tact_n, tact_l), np.uint8)
+        new[:, :tacts] = old[:, :tacts] @ projection > 0
+
+        self._set_size(tact_l, tact_n)
+        self._mapping.assign(self._cut(new.reshape(self._sounds_len, self._sample_len)))
+        self._reindex()
+        self._emit(Resized(tact_l, tact_n))
+
+    def assign(self, mapping: np.ndarray) -> None:
+        '''\
+        Replace the mapping by the 2-D array (sounds x beats),
+        beats are truncated or padded to the length of the sample.
         '''
 
+        new = np.zeros((self._sounds_len, self._sample_len), np.uint8)
+        beats = min(mapping.shape[1], self._sample_len)
+        new[:, :beats] = mapping[:, :beats] != 0
+        self._mapping.assign(self._cut(new))
+        self._reindex()
+        self._emit(Assigned())
+
+    def set_length(self, sound_index: int, length: int) -> None:
+        '''\
+        Change the length of the sound (from 1 to the length of the sample),
+        read a "Word about metre policy" in the class docs.
+        '''
+
+        if not 0 <= sound_index < self._sounds_len:
+            return
+        length = min(max(length, 1), self._sample_len)
+        if length == self._lengths[sound_index]:
+            return
+        self._lengths[sound_index] = length
+        bit = 1 << sound_index
+        for beat_index in self._mapping.hits(sound_index):
+            if beat_index >= length:
+                self._mapping.switch(sound_index, beat_index)
+                self._columns[beat_index] &= ~bit
+        self._emit(LengthChanged(sound_index, length))
+
+    def _set_size(self, tact_l: int, tact_n: int) -> None:
+        # Sounds of the full length keep it, others are truncated
+        sample_len = tact_l * tact_n
+        self._lengths = [sample_len if length == self._sample_len else min(length, sample_len)
+                         for length in self._lengths]
+
         self.tact_l = tact_l
         self.tact_n = tact_n
 
-        self._sample_len = tact_l * tact_n
-        self.clear()
+        self._sample_len = sample_len
+
+    def _cut(self, mapping: np.ndarray) -> np.ndarray:
+        '''\
+        Turn off cells after lengths of sounds in the writable 'mapping'.
+        '''
+
+        mapping[np.arange(mapping.shape[1]) >= np.array(self._lengths)[:, None]] = 0
+        return mapping
+
+    def _reindex(self) -> None:
+        '''\
+        Build '_columns' from the mapping, bits of each column
+        are packed at once (little-endian: bit 'i' is the sound 'i').
+        '''
+
+        packed = np.packbits(self._mapping.array() != 0, axis=0, bitorder='little')
+        packed = np.ascontiguousarray(packed.T)
+        self._columns = [int.from_bytes(column, 'little') for column in packed]
 
     def append(self, sound: object, mapping: Iterable[int]) -> None:
         '''\
         Add new sound and make mapping for it.
         '''
 
-        self._sounds.append(sound)
-        self._mapping.append(bytearray(self._sample_len))
-        for i, (flag, _) in enumerate(zip(mapping, self._mapping[-1])):
-            self._mapping[-1][i] = flag
+        if len(self._sounds) == self._sounds_len:
+            self._sounds.append(sound)
+        self._mapping.append(mapping)
+        self._lengths.append(self._sample_len)
+        bit = 1 << self._sounds_len
+        for beat_index in self._mapping.hits(-1):
+            self._columns[beat_index] |= bit
         self._sounds_len += 1
+        self._emit(RowAdded(self._sounds_len - 1))
 
     def remove(self, sound_index: int) -> None:
         '''\
@@ -111,17 +396,48 @@ class Sample():
         '''
 
         if 0 <= sound_index < self._sounds_len:
-            del self._sounds[sound_index]
-            del self._mapping[sound_index]
+            if len(self._sounds) == self._sounds_len:
+                del self._sounds[sound_index]
+            self._mapping.remove(sound_index)
+            del self._lengths[sound_index]
             self._sounds_len -= 1
 
+            # Drop the bit of the sound and shift higher bits down
+            low_bits = (1 << sound_index) - 1
+            self._columns = [column & low_bits | column >> (sound_index + 1) << sound_index
+                             for column in self._columns]
+            self._emit(RowRemoved(sound_index))
+
 
-class AbstractSampleClient():
+class AbstractSampleClient(Observable):
     '''\
     Controller that install the sample to the player and
     make facade for it.
+
+    The storage of the mapping is chosen by the 'mapping'
+    class keyword, read about it in qb_mapping.
+
+    Word about song policy:
+    The client has the list of patterns (samples that share sounds), one of
+    them is active: it is edited by facades. The song is the list of slots
+    (pattern index, repeats), many slots may refer to the same pattern, so
+    the song costs only unique patterns. If the song mode is off or the song
+    is empty, only the active pattern is played. '_patterns_changed' is called
+    after changes of patterns and slots and changes that affect what is played.
+
+    Word about changes policy:
+    The client observes all patterns (read a "Word about events policy" in
+    docs of the Sample) and passes their events to its observers as pairs
+    (pattern index, event), once per the 'transaction' of the client. Each
+    facade that changes the mapping is the transaction, so the sound that is
+    added to all patterns is reported once. '_patterns_changed' is not an
+    event: it is called when patterns or slots are changed, not the mapping.
     '''
 
+    def __init_subclass__(cls, mapping: type = BytesMapping, **kwargs) -> None:
+        cls._mapping_type = mapping
+        super().__init_subclass__(**kwargs)
+
     def __init__(self, /, time_sign: Tuple[int] = (4, 8),
                  bpm: int = 90, tact_n: int = 3,) -> None:
         '''\
@@ -134,10 +450,27 @@ class AbstractSampleClient():
         self.bpm = bpm
 
         self._sounds = []
-        self._sample = Sample(self._sounds, tact_l=self.time_sign[0], tact_n=tact_n)
+        self._sample = Sample(self._sounds, tact_l=self.time_sign[0], tact_n=tact_n,
+                              mapping_type=self._mapping_type)
         self._sample.clear()  # Super important line, clear fill the mapping of the sample
+
+        self._patterns: List[Sample] = [self._sample]
+        self._song: List[Tuple[int, int]] = []
+        self._song_mode = False
+
+        self._sample.subscribe(self._collect)
         super().__init__()
 
+    def _collect(self, sample: Sample, events: Tuple[NamedTuple]) -> None:
+        '''\
+        Receive events of the pattern, read a "Word about changes policy".
+        '''
+
+        index = next(i for i, pattern in enumerate(self._patterns) if pattern is sample)
+        with self.transaction():
+            for event in events:
+                self._emit((index, event))
+
     def set_bpm(self, bpm: int) -> None:
         '''\
         Read about bpm in __init__'s docs.
@@ -146,21 +479,26 @@ class AbstractSampleClient():
 
         self._set_bpm(bpm)
 
-    def resize(self, time_sign: Tuple[int] = (4, 8), tact_n: int = 3) -> None:
+    def resize(self, time_sign: Tuple[int] = (4, 8), tact_n: int = 3,
+               mode: str = 'clear') -> None:
         '''\
         Sample.resize, but using the time signature.
         This function probably will be reimplemented.
         '''
 
-        self._resize(time_sign, tact_n)
+        self._resize(time_sign, tact_n, mode)
 
     def _add_sound(self, sound: object, mapping: Iterable[int]) -> None:
         '''\
         Minimal implementation that probably will be used
         at 'add_widget' future implementation.
+        The sound is added to all patterns, but the mapping
+        is given only to the active one.
         '''
 
-        self._sample.append(sound, mapping)
+        with self.transaction():
+            for pattern in self._patterns:
+                pattern.append(sound, mapping if pattern is self._sample else ())
 
     def _set_bpm(self, bpm: int) -> None:
         '''\
@@ -170,21 +508,24 @@ class AbstractSampleClient():
 
         self.bpm = bpm
 
-    def _resize(self, time_sign: Tuple[int] = (4, 8), tact_n: int = 3) -> None:
+    def _resize(self, time_sign: Tuple[int] = (4, 8), tact_n: int = 3,
+                mode: str = 'clear') -> None:
         '''\
         Minimal implementation that probably will be used
         at 'resize' future implementation.
         '''
 
         self.time_sign = time_sign
-        self._sample.resize(tact_l=self.time_sign[0], tact_n=tact_n)
+        with self.transaction():
+            for pattern in self._patterns:
+                pattern.resize(tact_l=self.time_sign[0], tact_n=tact_n, mode=mode)
 
-    def _beat(self) -> Iterable:
+    def _masks(self) -> Tuple[int]:
         '''\
         Facade for the Sample.
         '''
 
-        yield from self._sample.beat()
+        return self._sample.masks()
 
     def view(self) -> Iterable[Iterable[int]]:
         '''\
@@ -200,26 +541,31 @@ class AbstractSampleClient():
 
         self._sample.switch(sound_index, beat_index)
 
-    def goto_start(self) -> None:
+    def clear(self) -> None:
         '''\
         Facade for the Sample.
         '''
 
-        self._sample.goto_start()
+        self._sample.clear()
 
-    def clear(self) -> None:
+    def edit(self, operation: Callable[..., np.ndarray], *args, **kwargs) -> None:
         '''\
-        Facade for the Sample.
+        Replace the mapping of the active pattern by the result of
+        operation(mapping, *args, lengths=lengths, **kwargs) in one pass,
+        so it is reported as the single change. Read about operations in qb_edit.
         '''
 
-        self._sample.clear()
+        self._sample.assign(operation(self._sample.array(), *args,
+                                      lengths=self._sample.lengths(), **kwargs))
 
     def rem_sound(self, sound_index: int) -> None:
         '''\
-        Facade for the Sample.
+        Facade for the Sample, the sound is removed from all patterns.
         '''
 
-        self._sample.remove(sound_index)
+        with self.transaction():
+            for pattern in self._patterns:
+                pattern.remove(sound_index)
 
     def get_tact_n(self) -> int:
         '''\
@@ -234,3 +580,138 @@ class AbstractSampleClient():
         '''
 
         return self._sample.tact_l
+
+    def set_length(self, sound_index: int, length: int) -> None:
+        '''\
+        Facade for the Sample, read a "Word about metre policy" in its docs.
+        '''
+
+        self._sample.set_length(sound_index, length)
+
+    def get_lengths(self) -> Tuple[int]:
+        '''\
+        Facade for the Sample.
+        '''
+
+        return self._sample.lengths()
+
+    def add_pattern(self) -> int:
+        '''\
+        Add the empty pattern and return its index,
+        read a "Word about song policy" in the class docs.
+        '''
+
+        pattern = Sample(self._sounds, tact_l=self._sample.tact_l, tact_n=self._sample.tact_n,
+                         mapping_type=self._mapping_type)
+        pattern.clear()
+        pattern.subscribe(self._collect)
+        self._patterns.append(pattern)
+        self._patterns_changed()
+        return len(self._patterns) - 1
+
+    def remove_pattern(self, pattern_index: int) -> None:
+        '''\
+        Remove the pattern and slots that refer to it, the last
+        pattern is never removed. If the pattern is active,
+        the next one (or the previous) becomes active.
+        '''
+
+        if len(self._patterns) == 1 or not 0 <= pattern_index < len(self._patterns):
+            return
+        self._patterns.pop(pattern_index).unsubscribe(self._collect)
+        self._song = [(index - (index > pattern_index), repeats)
+                      for index, repeats in self._song if index != pattern_index]
+        if not any(pattern is self._sample for pattern in self._patterns):
+            self._sample = self._patterns[min(pattern_index, len(self._patterns) - 1)]
+        self._patterns_changed()
+
+    def select_pattern(self, pattern_index: int) -> None:
+        '''\
+        Make the pattern active.
+        '''
+
+        self._sample = self._patterns[pattern_index]
+        self._patterns_changed()
+
+    def get_pattern(self) -> int:
+        '''\
+        Return the index of the active pattern.
+        '''
+
+        return next(i for i, pattern in enumerate(self._patterns) if pattern is self._sample)
+
+    def get_patterns_n(self) -> int:
+        '''\
+        Return the number of patterns.
+        '''
+
+        return len(self._patterns)
+
+    def set_song(self, slots: Iterable[Tuple[int, int]]) -> None:
+        '''\
+        Set slots of the song: pairs (pattern index, repeats).
+        '''
+
+        slots = [(int(index), int(repeats)) for index, repeats in slots]
+        if any(not 0 <= index < len(self._patterns) or repeats < 1 for index, repeats in slots):
+            raise ValueError('Slot should refer to the pattern and repeat it at least once')
+        self._song = slots
+        self._patterns_changed()
+
+    def get_song(self) -> Tuple[Tuple[int, int]]:
+        '''\
+        Return slots of the song.
+        '''
+
+        return tuple(self._song)
+
+    def set_song_mode(self, song_mode: bool) -> None:
+        '''\
+        Play the song (True) or loop the active pattern (False).
+        '''
+
+        self._song_mode = song_mode
+        self._patterns_changed()
+
+    def _slots(self) -> Tuple[Tuple[int, int]]:
+        '''\
+        Return slots that should be played,
+        read a "Word about song policy" in the class docs.
+        '''
+
+        if self._song_mode and self._song:
+            return tuple(self._song)
+        return ((self.get_pattern(), 1),)
+
+    def _install_song(self, mappings: Iterable[np.ndarray],
+                      slots: Iterable[Tuple[int, int]],
+                      lengths: Iterable[Iterable[int]] = ()) -> None:
+        '''\
+        Add patterns of the loaded project. The first pattern of the project
+        is the active one (its sounds were added to it), mappings of others
+        are given for the last sounds. Slots replace the song if they are given.
+        'lengths' are lengths of the last sounds in each pattern (the first
+        one too), read a "Word about metre policy" in docs of the Sample.
+        '''
+
+        indexes = [self.get_pattern()]
+        with self.transaction():
+            for mapping in mappings:
+                indexes.append(self.add_pattern())
+                full = np.zeros((len(self._sounds), mapping.shape[1]), np.uint8)
+                full[len(full) - len(mapping):] = mapping
+                self._patterns[-1].assign(full)
+            for index, pattern_lengths in zip(indexes, lengths):
+                first = len(self._sounds) - len(pattern_lengths)
+                for row, length in enumerate(pattern_lengths, first):
+                    self._patterns[index].set_length(row, int(length))
+        slots = [(indexes[index], repeats) for index, repeats in slots
+                 if 0 <= index < len(indexes) and repeats > 0]
+        if slots:
+            self._song = slots
+        self._patterns_changed()
+
+    def _patterns_changed(self) -> None:
+        '''\
+        Should be implemented.
+        '''
@@ -0,0 +1,167 @@
+'''\
+qb_edit provides bulk operations on the mapping.
+
+Each operation takes the mapping as the 2-D array (sounds x beats)
+and returns the new one, the given array is never changed. 'rows' are
+indexes of sounds that are edited, all sounds by default. 'lengths'
+are lengths of all rows (read a "Word about metre policy" in docs of
+the qb_core.Sample), the full length by default: rows are edited within
+their lengths, cells after them are turned off. Wrong arguments (indexes
+out of range, the wrong size of the tact) raise ValueError. Operations
+are applied to the pattern by AbstractSampleClient.edit at once (it
+passes lengths):
+    player.edit(qb_edit.euclidean, 3, 8, rows=[0])
+'''
+
+
+from typing import Iterable, Optional
+
+import numpy as np
+
+
+def _prepare(mapping: np.ndarray, rows: Optional[Iterable[int]],
+             lengths: Optional[Iterable[int]]) -> tuple:
+    '''\
+    Return the writable copy of the mapping, indexes of edited rows
+    and their lengths.
+    '''
+
+    new = (np.asarray(mapping) != 0).astype(np.uint8)
+    indexes = np.arange(len(new)) if rows is None else np.fromiter(rows, np.int64)
+    _check(indexes, len(new), 'Rows should be indexes of sounds')
+    if lengths is None:
+        return new, indexes, np.full(len(indexes), new.shape[1])
+    return new, indexes, np.fromiter(lengths, np.int64, len(new))[indexes]
+
+
+def _check(indexes: np.ndarray, count: int, message: str) -> None:
+    '''\
+    Raise ValueError with the message if any index is out of [0, count).
+    '''
+
+    wrong = indexes[(indexes < 0) | (indexes >= count)]
+    if len(wrong):
+        raise ValueError(f'{message} ({wrong[0]} is out of [0, {count}))')
+
+
+def _mask(width: int, lengths: np.ndarray) -> np.ndarray:
+    '''\
+    Return the mask of cells within lengths of rows.
+    '''
+
+    return (np.arange(width) < lengths[:, None]).astype(np.uint8)
+
+
+def _groups(rows: np.ndarray, lengths: np.ndarray) -> Iterable[tuple]:
+    '''\
+    Yield rows of the same length with the length, there are few of them.
+    '''
+
+    for length in np.unique(lengths):
+        yield rows[lengths == length], int(length)
+
+
+def euclid(hits: int, steps: int, rotation: int = 0) -> np.ndarray:
+    '''\
+    Return the line of 'steps' with 'hits' distributed as evenly as
+    possible (the Euclidean rhythm, the first step is always a hit),
+    rotated to the right by 'rotation'.
+    '''
+
+    hits = min(max(hits, 0), steps)
+    line = (np.arange(steps) * hits % max(steps, 1) < hits).astype(np.uint8)
+    return np.roll(line, rotation)
+
+
+def rotate(mapping: np.ndarray, shift: int, rows: Optional[Iterable[int]] = None,
+           *, lengths: Optional[Iterable[int]] = None) -> np.ndarray:
+    '''\
+    Move beats of rows to the right by 'shift' (to the left if it is negative),
+    beats that go out are moved to the other end of the row.
+    '''
+
+    new, rows, lengths = _prepare(mapping, rows, lengths)
+    new[rows] &= _mask(new.shape[1], lengths)
+    for group, length in _groups(rows, lengths):
+        new[group, :length] = np.roll(new[group, :length], shift, axis=1)
+    return new
+
+
+def invert(mapping: np.ndarray, rows: Optional[Iterable[int]] = None,
+           *, lengths: Optional[Iterable[int]] = None) -> np.ndarray:
+    '''\
+    Turn on cells that are turned off and vice versa.
+    '''
+
+    new, rows, lengths = _prepare(mapping, rows, lengths)
+    mask = _mask(new.shape[1], lengths)
+    new[rows] = (new[rows] ^ 1) & mask
+    return new
+
+
+def copy_tact(mapping: np.ndarray, tact_l: int, source: int,  # pylint: disable=too-many-arguments
+              targets: Optional[Iterable[int]] = None,
+              rows: Optional[Iterable[int]] = None,
+              *, lengths: Optional[Iterable[int]] = None) -> np.ndarray:
+    '''\
+    Copy the tact 'source' onto 'targets' (all other tacts by default).
+    '''
+
+    new, rows, lengths = _prepare(mapping, rows, lengths)
+    if tact_l < 1 or new.shape[1] % tact_l:
+        raise ValueError(f'The length of the mapping ({new.shape[1]}) '
+                         f'should be a multiple of the tact ({tact_l})')
+    tacts = new.reshape(len(new), -1, tact_l)
+    targets = (np.arange(tacts.shape[1]) if targets is None
+               else np.fromiter(targets, np.int64))
+    _check(np.array([source, *targets], np.int64), tacts.shape[1],
+           'Source and targets should be indexes of tacts')
+    tacts[rows[:, None], targets] = tacts[rows, source][:, None]
+    new[rows] &= _mask(new.shape[1], lengths)
+    return new
+
+
+def fill_every(mapping: np.ndarray, every: int, offset: int = 0,
+               rows: Optional[Iterable[int]] = None,
+               *, lengths: Optional[Iterable[int]] = None) -> np.ndarray:
+    '''\
+    Turn on each 'every' beat starting from the 'offset', other cells are kept.
+    '''
+
+    if every < 1:
+        raise ValueError(f"'every' should be positive ({every})")
+    new, rows, lengths = _prepare(mapping, rows, lengths)
+    new[rows[:, None], np.arange(offset % every, new.shape[1], every)] = 1
+    new[rows] &= _mask(new.shape[1], lengths)
+    return new
+
+
+def euclidean(mapping: np.ndarray, hits: int, steps: Optional[int] = None,  # pylint: disable=too-many-arguments
+              rotation: int = 0, rows: Optional[Iterable[int]] = None,
+              *, lengths: Optional[Iterable[int]] = None) -> np.ndarray:
+    '''\
+    Replace rows by the Euclidean rhythm (read about it in 'euclid') of
+    'steps' (the length of the row by default) repeated to its end.
+    '''
+
+    if steps is not None and steps < 0:
+        raise ValueError(f'Steps of the rhythm should not be negative ({steps})')
+    new, rows, lengths = _prepare(mapping, rows, lengths)
+    new[rows] = 0
+    for group, length in _groups(rows, lengths):
+        new[group, :length] = np.resize(euclid(hits, steps or length, rotation), length)
+    return new
+
+
+def random_fill(mapping: np.ndarray, density: float, seed: Optional[int] = None,
+                rows: Optional[Iterable[int]] = None,
+                *, lengths: Optional[Iterable[int]] = None) -> np.ndarray:
+    '''\
+    Replace rows by random cells, each cell is turned on with the
+    probability 'density'. The same 'seed' gives the same cells.
+    '''
+
+    new, rows, lengths = _prepare(mapping, rows, lengths)
+    cells = np.random.default_rng(seed).random((len(rows), new.shape[1])) < density
+    new[rows] = cells & _mask(new.shape[1], lengths)
+    return new
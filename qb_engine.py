@@ -0,0 +1,221 @@
+'''\
+qb_engine provides playing of the sample that
+may run in its own thread.
+'''
+
+
+from queue import Empty, SimpleQueue
+from time import perf_counter
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from qb_abs_storage import AbstractSound
+from qb_scheduler import BeatScheduler
+from qb_telemetry import BeatTelemetry
+
+
+class BeatEngine():
+    '''\
+    Play the copy of the sample by the BeatScheduler.
+
+    Word about threading policy:
+    The engine belongs to the thread that calls 'tick' (the audio thread).
+    Other threads talk to it only by 'send': messages are put to the queue
+    and applied at the beginning of the next 'tick', so nothing is locked.
+
+    The engine has its own copy of patterns: bitmasks of beats (read about
+    them in qb_core.Sample) and the tuple of sounds, so the edited mapping is
+    never read while playing. Changes of patterns drop queued beats,
+    so they are heard from the next beat, not after the lookahead.
+
+    Slots (pattern index, repeats) are played in the order and looped, read
+    a "Word about song policy" in docs of the qb_core.AbstractSampleClient.
+    The cursor (slot, repeat, beat) moves across patterns, so the song
+    is never expanded to the single mapping. Sounds that are shorter than
+    the pattern are played by the count of beats since the start, read
+    a "Word about metre policy" in docs of the qb_core.Sample.
+
+    Sounds and their volume are touched only by the engine after they are
+    sent. The telemetry is written only by the engine, others may read it.
+    '''
+
+    def __init__(self, period: float, /, lookahead: float = 0.05,
+                 clock: Callable[[], float] = perf_counter) -> None:
+        '''\
+        Read about arguments in docs of the BeatScheduler.
+        '''
+
+        self._scheduler = BeatScheduler(period, lookahead=lookahead, clock=clock)
+        self._clock = clock
+        self._messages: SimpleQueue = SimpleQueue()
+
+        self._patterns: List[List[int]] = [[0]]
+        self._meters: List[Tuple[Tuple[int, int]]] = [()]
+        self._slots: Tuple[Tuple[int, int]] = ((0, 1),)
+        self._sounds: Tuple[AbstractSound] = ()
+        self._volume = 0.0
+        self._is_running = False
+
+        self._slot = 0
+        self._repeat = 0
+        self._position = 0
+        self._beats = 0
+
+    @property
+    def telemetry(self) -> BeatTelemetry:
+        '''\
+        Read about it in qb_telemetry.
+        '''
+
+        return self._scheduler.telemetry
+
+    def send(self, name: str, *args) -> None:
+        '''\
+        Put the message to the queue, it may be called from any thread.
+
+        Messages:
+            <*> 'patterns', masks, sounds, meters - replace all patterns (masks
+                and meters of each, read about them in qb_core.Sample).
+            <*> 'slots', slots - replace slots: pairs (pattern index, repeats).
+            <*> 'column', pattern_index, beat_index, mask - replace
+                the mask of the beat of the pattern.
+            <*> 'period', seconds - change the duration of the beat.
+            <*> 'lookahead', seconds - read about it in the BeatScheduler.
+            <*> 'volume', volume - set the volume of all sounds.
+            <*> 'start' / 'stop' - turn playing on / off, beats that are
+                queued but not played will be played after the next 'start'.
+            <*> 'goto', slot_index - move the cursor to the start of the slot.
+        '''
+
+        self._messages.put((name, args))
+
+    def tick(self) -> Optional[float]:
+        '''\
+        Apply messages, play beats that are due and return
+        the delay before the next 'tick' (None if it is stopped).
+        '''
+
+        self._apply_messages()
+        if not self._is_running:
+            return None
+        self._scheduler.fill(self._next_beat)
+        self._play_due()
+        return self._scheduler.time_to_next()
+
+    def _apply_messages(self) -> None:
+        while True:
+            try:
+                name, args = self._messages.get_nowait()
+            except Empty:
+                return
+            getattr(self, '_on_' + name)(*args)
+
+    def _next_beat(self) -> Tuple[AbstractSound]:
+        '''\
+        Collect the sounds of the beat to queue them in advance, bits of
+        short sounds are taken from their own cells (read about meters in
+        docs of the qb_core.Sample), only bits that are set are iterated.
+        '''
+
+        pattern_index, repeats = self._slots[self._slot]
+        columns = self._patterns[pattern_index]
+        column = columns[self._position]
+        for length, bits in self._meters[pattern_index]:
+            column = column & ~bits | columns[self._beats % length] & bits
+        self._beats += 1
+        self._position += 1
+        if self._position == len(columns):
+            self._position = 0
+            self._repeat += 1
+            if self._repeat == repeats:
+                self._repeat = 0
+                self._slot = (self._slot + 1) % len(self._slots)
+        sounds = []
+        while column:
+            lowest = column & -column
+            sounds.append(self._sounds[lowest.bit_length() - 1])
+            column ^= lowest
+        return tuple(sounds)
+
+    def _play_due(self) -> None:
+        '''\
+        Play all the sounds of beats that are due
+        and record their timing in the telemetry.
+        '''
+
+        telemetry = self._scheduler.telemetry
+        for deadline, sounds in self._scheduler.pop_due():
+            fired = self._clock()
+            for sound in sounds:
+                sound.play()
+            telemetry.record(deadline, fired, self._clock() - fired)
+
+    def _drop_queued(self, beats: int) -> None:
+        '''\
+        Move the cursor back by 'beats' that were queued, but not played.
+        '''
+
+        self._beats = max(self._beats - beats, 0)
+        for _ in range(beats):
+            if self._position == 0:
+                if self._repeat == 0:
+                    self._slot = (self._slot - 1) % len(self._slots)
+                    self._repeat = self._slots[self._slot][1]
+                self._repeat -= 1
+                self._position = len(self._patterns[self._slots[self._slot][0]])
+            self._position -= 1
+
+    def _fit_cursor(self) -> None:
+        '''\
+        Keep the cursor inside of slots after they are changed.
+        '''
+
+        self._slot %= len(self._slots)
+        pattern_index, repeats = self._slots[self._slot]
+        self._repeat %= repeats
+        self._position %= len(self._patterns[pattern_index])
+
+    def _on_patterns(self, patterns: Iterable[Iterable[int]], sounds: Iterable[AbstractSound],
+                     meters: Iterable[Tuple[Tuple[int, int]]] = ()) -> None:
+        self._drop_queued(self._scheduler.rewind())
+        self._patterns = [list(masks) or [0] for masks in patterns] or [[0]]
+        meters = list(meters)[:len(self._patterns)]
+        self._meters = meters + [()] * (len(self._patterns) - len(meters))
+        self._slots = tuple((index, repeats) for index, repeats in self._slots
+                            if index < len(self._patterns)) or ((0, 1),)
+        self._sounds = tuple(sounds)
+        self._fit_cursor()
+        self._on_volume(self._volume)
+
+    def _on_slots(self, slots: Iterable[Tuple[int, int]]) -> None:
+        self._drop_queued(self._scheduler.rewind())
+        self._slots = tuple(slots) or ((0, 1),)
+        self._fit_cursor()
+
+    def _on_column(self, pattern_index: int, beat_index: int, mask: int) -> None:
+        self._drop_queued(self._scheduler.rewind())
+        self._patterns[pattern_index][beat_index] = mask
+
+    def _on_period(self, period: float) -> None:
+        self._scheduler.set_period(period)
+
+    def _on_lookahead(self, lookahead: float) -> None:
+        self._scheduler.lookahead = lookahead
+
+    def _on_volume(self, volume: float) -> None:
+        self._volume = volume
+        for sound in self._sounds:
+            sound.set_volume(volume)
+
+    def _on_start(self) -> None:
+        if not self._is_running:
+            self._is_running = True
+            self._scheduler.start()
+
+    def _on_stop(self) -> None:
+        self._is_running = False
+        self._drop_queued(self._scheduler.stop())
+
+    def _on_goto(self, slot_index: int) -> None:
+        self._scheduler.rewind()
+        self._slot = slot_index % len(self._slots)
+        self._repeat = self._position = self._beats = 0
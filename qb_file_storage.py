@@ -0,0 +1,336 @@
+'''\
+qb_file_storage implements the part of qb_abs_storage stuff
+that doesn't depend on how sounds are played: projects and caching.
+'''
+
+import struct
+from hashlib import sha1
+from os import getpid, makedirs, path as ospath, replace
+from tempfile import gettempdir
+from typing import Dict, Hashable, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from qb_abs_storage import AbstractStorage, AbstractSound
+from qb_cache import LRUCache, sound_key
+from qb_format import Project, read_project, write_project
+from qb_journal import Journal, journal_path, needs_snapshot, pack_changes, read_journal, replay
+
+
+def extract_blob(blob: bytes) -> str:
+    '''\
+    Write the embedded sound to the temp directory (once per content)
+    and return its path. The file is written aside and then renamed,
+    so processes that extract the same sound don't see a partial file.
+    '''
+
+    blob_path = ospath.join(gettempdir(), 'qbeater', sha1(blob).hexdigest() + '.wav')
+    if not ospath.exists(blob_path):
+        makedirs(ospath.dirname(blob_path), exist_ok=True)
+        part_path = f'{blob_path}.{getpid()}'
+        with open(part_path, 'wb') as file:
+            file.write(blob)
+        replace(part_path, blob_path)
+    return blob_path
+
+
+class FileStorage(AbstractStorage):
+    '''\
+    Implement projects and the cache of the 'AbstractStorage' interface,
+    'load_sounds' should be implemented.
+
+    Word about caching policy:
+    Loaded sounds are cached by the key of the file (read about it in
+    qb_cache.sound_key), so rows and projects that use the same file
+    share the decoded data. The cache is limited by the total size,
+    evicted sounds live while rows use them.
+
+    Word about saving policy:
+    The snapshot of the mapping, sounds and the config is taken when
+    'unload_project' is called, so later edits never get to the file.
+    Then '_write_project' writes it (embedded sounds are read only then)
+    by qb_format.write_project, which replaces the file atomically, and
+    the result is reported by the notification. Here it is done at once,
+    the Storage does it in the thread of saving.
+
+    Word about autosave policy:
+    After 'open_journal' changes of the mapping are appended to the journal
+    next to the project, read a "Word about journal policy" in docs of the
+    qb_journal.Journal. The journal is compacted to the snapshot: before the
+    first changes, when the size of records passes the threshold, when
+    changes can't be packed (read about it in qb_journal.needs_snapshot) and
+    when patterns or the song are changed (they are saved only by snapshots,
+    so the player calls 'write_journal' without changes after them).
+    'recover_project' loads the snapshot (or the project) and replays records
+    of the journal, changes are not journaled until that batch is finished,
+    so the old journal is kept if the loading is interrupted.
+    '''
+
+    def __init__(self, cache: LRUCache) -> None:
+        super().__init__()
+        self._cache = cache
+
+        self._journal: Optional[Journal] = None
+        self._journal_threshold = 0
+        self._journal_loading = False
+        # The snapshot is needed before records
+        self._journal_stale = True
+        # Numbers of patterns and slots of the last snapshot
+        self._journal_shape: Tuple = ()
+
+    def load_sound(self, sound_path: str, mapping: Iterable[int]) -> None:
+        '''\
+        Load the sound as the batch of one sound.
+        '''
+
+        self.load_sounds((sound_path,), (mapping,))
+
+    def _cache_key(self, sound_path: str) -> Hashable:
+        '''\
+        Read a "Word about caching policy" in the class docs.
+        '''
+
+        try:
+            return sound_key(sound_path)
+        except OSError:
+            return sound_path
+
+    def _finish_song(self, song: Optional[tuple], rows: List[int]) -> None:
+        '''\
+        Install the song of the batch, 'rows' are indexes of loaded sounds,
+        read about it in docs of the AbstractStorage.load_sounds.
+        '''
+
+        self._journal_loading = False
+        if song is None:
+            return
+        patterns, slots, lengths = song
+        self._install_song(tuple(np.asarray(pattern, np.uint8)[rows] for pattern in patterns),
+                           slots, tuple(np.asarray(pattern_lengths)[rows]
+                                        for pattern_lengths in lengths))
+
+    def _report_batch(self, total: int, failed: List[str]) -> None:
+        '''\
+        Notify about the result of the loading of the whole batch.
+        '''
+
+        if total == 1 and failed:
+            self._display_notification(f'Error of loading the sound ({failed[0]})!')
+        elif failed:
+            self._display_notification(f'Error of loading {len(failed)} of {total} '
+                                       f'sounds ({", ".join(failed)})!')
+        else:
+            self._display_notification(f'Loaded {total} sound(s)')
+
+    def cache_stats(self) -> Dict[str, int]:
+        '''\
+        Read a "Word about caching policy" in the class docs.
+        '''
+
+        return self._cache.stats()
+
+    def set_cache_capacity(self, capacity: int) -> None:
+        '''\
+        Read a "Word about caching policy" in the class docs.
+        '''
+
+        self._cache.set_capacity(capacity)
+
+    def upload_project(self, pjpath: str) -> None:
+        '''\
+        Load project from the 'path'.
+        '''
+
+        project = self._upload_data(pjpath)
+        if project is None:
+            return
+        self._apply_config(project)
+        self.load_sounds(self._sound_paths(project), project.mapping, self._song(project))
+
+    def _upload_data(self, pjpath: str) -> Optional[Project]:
+        '''\
+        Upload data that is loaded by unload and return it.
+        '''
+
+        try:
+            return read_project(pjpath)
+        except (OSError, ValueError, struct.error):
+            self._display_notification(f'Error of loading the project ({pjpath})!')
+            return None
+
+    def _apply_config(self, project: Project) -> None:
+        '''\
+        Pass settings of the project to '_install_config', settings
+        that are unknown (zeros of the text format) are skipped.
+        '''
+
+        config = {}
+        if all(project.time_sign) and project.tact_n:
+            config['time_sign'] = tuple(project.time_sign)
+            config['tact_n'] = project.tact_n
+        if project.bpm:
+            config['bpm'] = project.bpm
+        if config:
+            self._install_config(config)
+
+    def _song(self, project: Project) -> Optional[tuple]:
+        '''\
+        Return the song of the project as 'load_sounds' gets it.
+        '''
+
+        if project.patterns or project.song or project.lengths:
+            return project.patterns, project.song, project.lengths
+        return None
+
+    def _sound_paths(self, project: Project) -> Iterable[str]:
+        '''\
+        Yield paths of sounds, embedded sound is used only if
+        its path doesn't exist, it is extracted to the temp directory.
+        '''
+
+        blobs = project.blobs or (None,) * len(project.paths)
+        for sound_path, blob in zip(project.paths, blobs):
+            if blob is None or ospath.exists(sound_path):
+                yield sound_path
+            else:
+                yield extract_blob(blob)
+
+    def open_journal(self, pjpath: str, threshold: int = 2 ** 20) -> None:
+        '''\
+        Read a "Word about autosave policy" in the class docs.
+        '''
+
+        self.close_journal()
+        self._journal = Journal(journal_path(pjpath))
+        self._journal_threshold = threshold
+        self._journal_stale = True
+
+    def close_journal(self) -> None:
+        '''\
+        Write all journaled changes and stop journaling.
+        '''
+
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def write_journal(self, changes: Tuple[Tuple[int, NamedTuple]],
+                      mapping: Iterable[Iterable[int]], sounds: List[AbstractSound],
+                      config: Optional[dict] = None) -> None:
+        '''\
+        Journal changes, read about other arguments in 'unload_project'.
+        '''
+
+        journal = self._journal
+        if journal is None or self._journal_loading:
+            return
+        if journal.error is not None:
+            self._display_notification(f'Error of the autosave ({journal.error})!')
+            journal.error = None
+            self._journal_stale = True
+        config = config or {}
+        shape = (len(config.get('patterns', ())), tuple(config.get('song', ())))
+        if self._journal_stale or shape != self._journal_shape or needs_snapshot(changes):
+            journal.compact(self._make_project(mapping, sounds, config))
+            self._journal_stale = False
+            self._journal_shape = shape
+            return
+        if not changes:
+            return
+
+        patterns = [None, *config.get('patterns', ())]
+
+        def pattern(index: int) -> np.ndarray:
+            if patterns[index] is None:
+                steps = config.get('tact_n', 0) * config.get('time_sign', (0, 0))[0]
+                lines = [np.frombuffer(bytes(line), np.uint8) for _, line in zip(sounds, mapping)]
+                patterns[index] = np.array(lines, np.uint8).reshape(len(lines), steps)
+            return patterns[index]
+
+        journal.append(pack_changes(changes, [sound.source() for sound in sounds], pattern))
+        self._journal_stale = journal.size > self._journal_threshold
+
+    def recover_project(self, pjpath: str) -> None:
+        '''\
+        Load the project with changes of its journal,
+        read a "Word about autosave policy" in the class docs.
+        '''
+
+        try:
+            project = self._recover_data(pjpath)
+        except (OSError, ValueError, struct.error):
+            self._display_notification(f'Error of recovering the project ({pjpath})!')
+            return
+        self._journal_stale = True
+        self._journal_loading = bool(project.paths)
+        self._apply_config(project)
+        self.load_sounds(self._sound_paths(project), project.mapping, self._song(project))
+
+    def _recover_data(self, pjpath: str) -> Project:
+        if not ospath.exists(journal_path(pjpath)):
+            return read_project(pjpath)
+        snapshot, records = read_journal(journal_path(pjpath))
+        if snapshot is None:
+            snapshot = read_project(pjpath)
+        return replay(snapshot, records)
+
+    def unload_project(self, pjpath: str, mapping: Iterable[Iterable[int]],
+                       sounds: List[AbstractSound], config: Optional[dict] = None) -> None:
+        '''\
+        Save project to the 'path', read a "Word about saving policy" in the class docs.
+        '''
+
+        try:
+            project = self._make_project(mapping, sounds, config or {})
+        except (TypeError, ValueError):
+            self._display_notification(f'Error of saving the project ({pjpath})!')
+            return
+        self._write_project(pjpath, project, self._embed_sounds)
+
+    def _write_project(self, pjpath: str, project: Project, embed: bool) -> None:
+        '''\
+        Write the snapshot and notify about the result, it may be
+        overridden to write it in another thread.
+        '''
+
+        self._display_notification(self._save(pjpath, project, embed))
+
+    def _save(self, pjpath: str, project: Project, embed: bool) -> str:
+        '''\
+        Read embedded sounds, write the project and return the notification,
+        it doesn't touch the storage, so it may be called in any thread.
+        '''
+
+        try:
+            if embed:
+                project = project._replace(blobs=tuple(self.__read_blob(sound_path)
+                                                       for sound_path in project.paths))
+            write_project(pjpath, project)
+        except (OSError, ValueError, struct.error):
+            return f'Error of saving the project ({pjpath})!'
+        return f'Saved the project ({pjpath})'
+
+    def _make_project(self, mapping: Iterable[Iterable[int]], sounds: List[AbstractSound],
+                      config: dict) -> Project:
+        '''\
+        Collect the snapshot of the project (sounds aren't embedded),
+        read about 'config' in docs of the AbstractStorage.unload_project.
+        '''
+
+        lines = [np.frombuffer(bytes(line), np.uint8) for _, line in zip(sounds, mapping)]
+        paths = [ospath.abspath(sound.source()) for sound, _ in zip(sounds, lines)]
+        steps = config.get('tact_n', 0) * config.get('time_sign', (0, 0))[0]
+        mapping = np.array(lines, np.uint8) if lines else np.zeros((0, steps), np.uint8)
+        patterns = tuple(np.array(pattern, np.uint8)[:len(lines)]
+                         for pattern in config.get('patterns', ()))
+        lengths = tuple(tuple(pattern_lengths)[:len(lines)]
+                        for pattern_lengths in config.get('lengths', ()))
+        return Project(paths, mapping,
+                       config.get('time_sign', (0, 0)), config.get('tact_n', 0),
+                       config.get('bpm', 0), (), patterns, tuple(config.get('song', ())),
+                       lengths if any(min(item, default=steps) < steps for item in lengths)
+                       else ())
+
+    def __read_blob(self, sound_path: str) -> bytes:
+        with open(sound_path, 'rb') as file:
+            return file.read()
@@ -0,0 +1,261 @@
+'''\
+qb_format provides reading and writing of project files.
+'''
+
+
+import mmap
+import os
+import struct
+from typing import BinaryIO, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+
+MAGIC = b'QBPB'
+VERSION = 4
+
+FLAG_EMBEDDED = 1
+
+# magic, version, flags, rows, steps, tact_l, tact_n, bpm, note,
+# offsets of the path table, the mapping and the blob table
+HEADER = struct.Struct('<4sHHIIHHHHQQQ')
+# (since the version 3) offset of the song, it is 0 if there is no song
+SONG = struct.Struct('<Q')
+# (since the version 4) offset of lengths of rows, it is 0 if all rows are full
+METRE = struct.Struct('<Q')
+# numbers of other patterns and slots of the song
+COUNTS = struct.Struct('<II')
+# pattern index and repeats
+SLOT = struct.Struct('<II')
+LENGTH = struct.Struct('<I')
+BLOB = struct.Struct('<QQ')
+
+
+class Project(NamedTuple):
+    '''\
+    Content of the project file.
+
+    'mapping' is the 2-D uint8 array (rows x steps),
+    'time_sign', 'tact_n' and 'bpm' are zeros if they
+    are unknown (text format), 'blobs' are embedded wave files.
+
+    'patterns' are mappings of other patterns of the song (of the same
+    shape as the 'mapping', that is the first pattern), 'song' is slots:
+    pairs (pattern index, repeats).
+
+    'lengths' are lengths of rows of each pattern (the first one too),
+    it is empty if all rows are of the full length, read a "Word about
+    metre policy" in docs of the qb_core.Sample.
+    '''
+
+    paths: List[str]
+    mapping: np.ndarray
+    time_sign: Tuple[int] = (0, 0)
+    tact_n: int = 0
+    bpm: int = 0
+    blobs: Tuple[Optional[bytes]] = ()
+    patterns: Tuple[np.ndarray] = ()
+    song: Tuple[Tuple[int, int]] = ()
+    lengths: Tuple[Tuple[int]] = ()
+
+
+def read_project(pjpath: str) -> Project:
+    '''\
+    Read the project of any version.
+    '''
+
+    with open(pjpath, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            file.seek(0)
+            return _read_text(file)
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return read_buffer(data)
+
+
+def read_buffer(data: bytes) -> Project:
+    '''\
+    Read the project of the binary format from the buffer (bytes or mmap).
+    '''
+
+    if bytes(data[:len(MAGIC)]) != MAGIC:
+        raise ValueError('The buffer is not the binary project')
+    return _read_binary(data)
+
+
+def _read_text(file: BinaryIO) -> Project:
+    '''\
+    Read the first version: two lines per sound,
+    the path and the mapping as a string of digits.
+    '''
+
+    lines = file.read().decode('utf-8').splitlines()
+    paths = lines[0::2]
+    lines = [np.frombuffer(line.encode('ascii'), np.uint8) - ord('0') for line in lines[1::2]]
+    mapping = np.zeros((len(paths), max(map(len, lines), default=0)), np.uint8)
+    for row, line in zip(mapping, lines):
+        if (line > 9).any():
+            raise ValueError('The mapping should consist of digits')
+        row[:len(line)] = line
+    return Project(paths, mapping)
+
+
+def _read_binary(data: mmap.mmap) -> Project:
+    (_, version, flags, rows, steps, tact_l, tact_n, bpm, note,
+     paths_offset, mapping_offset, blobs_offset) = HEADER.unpack_from(data)
+    if version > VERSION:
+        raise ValueError(f'Unsupported version of the project ({version})')
+
+    blobs = _read_blobs(data, blobs_offset, rows) if flags & FLAG_EMBEDDED else ()
+    patterns, song = _read_song(data, version, rows, steps)
+    return Project(_read_paths(data, paths_offset, rows),
+                   _read_mapping(data, mapping_offset, rows, steps),
+                   (tact_l, note), tact_n, bpm, blobs, patterns, song,
+                   _read_lengths(data, version, rows, len(patterns) + 1))
+
+
+def _read_paths(data: mmap.mmap, offset: int, rows: int) -> List[str]:
+    paths = []
+    for _ in range(rows):
+        (length,) = LENGTH.unpack_from(data, offset)
+        offset += LENGTH.size
+        paths.append(data[offset:offset + length].decode('utf-8'))
+        offset += length
+    return paths
+
+
+def _read_mapping(data: mmap.mmap, offset: int, rows: int, steps: int) -> np.ndarray:
+    width = (steps + 7) // 8
+    packed = np.frombuffer(data, np.uint8, rows * width, offset)
+    # Unpacking makes a copy, so the mmap can be closed after return
+    return np.unpackbits(packed.reshape(rows, width), axis=1, count=steps)
+
+
+def _read_song(data: mmap.mmap, version: int, rows: int,
+               steps: int) -> Tuple[Tuple[np.ndarray], Tuple[Tuple[int, int]]]:
+    (offset,) = SONG.unpack_from(data, HEADER.size) if version >= 3 else (0,)
+    if not offset:
+        return (), ()
+    patterns_n, slots_n = COUNTS.unpack_from(data, offset)
+    offset += COUNTS.size
+    patterns = []
+    for _ in range(patterns_n):
+        patterns.append(_read_mapping(data, offset, rows, steps))
+        offset += rows * ((steps + 7) // 8)
+    slots = tuple(SLOT.iter_unpack(data[offset:offset + slots_n * SLOT.size]))
+    return tuple(patterns), slots
+
+
+def _read_lengths(data: mmap.mmap, version: int, rows: int,
+                  patterns_n: int) -> Tuple[Tuple[int]]:
+    (offset,) = METRE.unpack_from(data, HEADER.size + SONG.size) if version >= 4 else (0,)
+    if not offset:
+        return ()
+    lengths = np.frombuffer(data, '<u4', rows * patterns_n, offset).reshape(patterns_n, rows)
+    return tuple(tuple(pattern.tolist()) for pattern in lengths)
+
+
+def _read_blobs(data: mmap.mmap, offset: int, rows: int) -> Tuple[Optional[bytes]]:
+    table = data[offset:offset + rows * BLOB.size]
+    return tuple(bytes(data[start:start + size]) if size else None
+                 for start, size in BLOB.iter_unpack(table))
+
+
+def write_project(pjpath: str, project: Project) -> None:
+    '''\
+    Write the project in the binary format of the last version,
+    sounds are embedded if 'blobs' of the project are given.
+
+    The file is written aside, flushed to the disk and then renamed,
+    so the crash never leaves the truncated project at 'pjpath'.
+    '''
+
+    part_path = pjpath + '.part'
+    try:
+        with open(part_path, 'wb') as file:
+            write_binary(file, project)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(part_path, pjpath)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+
+def write_binary(file: BinaryIO, project: Project) -> None:
+    '''\
+    Write the project to the opened file, read about it in 'write_project'.
+    '''
+
+    mapping = np.asarray(project.mapping, np.uint8)
+    paths = b''.join(LENGTH.pack(len(path)) + path for path in
+                     (path.encode('utf-8') for path in project.paths))
+    packed = np.packbits(mapping != 0, axis=1).tobytes()
+    song = _pack_song(project, mapping.shape)
+    lengths = _pack_lengths(project, mapping.shape)
+
+    flags = FLAG_EMBEDDED if project.blobs else 0
+    paths_offset = HEADER.size + SONG.size + METRE.size
+    mapping_offset = paths_offset + len(paths)
+    song_offset = mapping_offset + len(packed) if song else 0
+    lengths_offset = mapping_offset + len(packed) + len(song) if lengths else 0
+    blobs_offset = mapping_offset + len(packed) + len(song) + len(lengths)
+
+    file.write(HEADER.pack(MAGIC, VERSION, flags, *mapping.shape,
+                           project.time_sign[0], project.tact_n, project.bpm,
+                           project.time_sign[1], paths_offset, mapping_offset, blobs_offset))
+    file.write(SONG.pack(song_offset))
+    file.write(METRE.pack(lengths_offset))
+    file.write(paths)
+    file.write(packed)
+    file.write(song)
+    file.write(lengths)
+    if flags:
+        _write_blobs(file, blobs_offset, project.blobs)
+
+
+def _pack_song(project: Project, shape: Tuple[int, int]) -> bytes:
+    '''\
+    Return the song section, patterns are packed as the mapping,
+    they are truncated or padded to its shape.
+    '''
+
+    if not project.patterns and not project.song:
+        return b''
+    packed = []
+    for pattern in project.patterns:
+        pattern = np.asarray(pattern, np.uint8)
+        fitted = np.zeros(shape, np.uint8)
+        rows, steps = min(shape[0], pattern.shape[0]), min(shape[1], pattern.shape[1])
+        fitted[:rows, :steps] = pattern[:rows, :steps]
+        packed.append(np.packbits(fitted != 0, axis=1).tobytes())
+    slots = b''.join(SLOT.pack(index, repeats) for index, repeats in project.song)
+    return COUNTS.pack(len(project.patterns), len(project.song)) + b''.join(packed) + slots
+
+
+def _pack_lengths(project: Project, shape: Tuple[int, int]) -> bytes:
+    '''\
+    Return lengths of rows of all patterns (rows of each pattern are fitted
+    to the shape of the mapping), it is empty if all rows are full.
+    '''
+
+    rows, steps = shape
+    lengths = np.full((len(project.patterns) + 1, rows), steps, np.int64)
+    for pattern, pattern_lengths in zip(lengths, project.lengths):
+        pattern_lengths = np.asarray(pattern_lengths, np.int64)[:rows]
+        pattern[:len(pattern_lengths)] = np.clip(pattern_lengths, 1, max(steps, 1))
+    if (lengths == steps).all():
+        return b''
+    return lengths.astype('<u4').tobytes()
+
+
+def _write_blobs(file: BinaryIO, offset: int, blobs: Iterable[Optional[bytes]]) -> None:
+    blobs = list(blobs)
+    start = offset + len(blobs) * BLOB.size
+    for blob in blobs:
+        size = len(blob) if blob else 0
+        file.write(BLOB.pack(start if size else 0, size))
+        start += size
+    for blob in blobs:
+        if blob:
+            file.write(blob)
@@ -0,0 +1,234 @@
+'''\
+qb_headless provides the Player that works without
+the event loop and audio device (for testing and benchmarking).
+'''
+
+
+import wave
+from time import perf_counter, sleep
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from qb_abs_player import AbstractPlayer
+from qb_abs_storage import AbstractSound
+from qb_cache import LRUCache
+from qb_file_storage import FileStorage
+from qb_mapping import ArrayMapping
+from qb_render import read_wav
+
+
+class SystemClock():
+    '''\
+    Real time: the clock is perf_counter, sleeping blocks the thread.
+    '''
+
+    def __call__(self) -> float:
+        return perf_counter()
+
+    def sleep(self, seconds: float) -> None:
+        '''\
+        Block the thread for 'seconds'.
+        '''
+
+        if seconds > 0:
+            sleep(seconds)
+
+
+class ManualClock():
+    '''\
+    Simulated time: it is changed only by sleeping,
+    so hours of playing are simulated instantly.
+    '''
+
+    def __init__(self, start: float = 0.0) -> None:
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        '''\
+        Move the time forward by 'seconds'.
+        '''
+
+        self.now += max(seconds, 0)
+
+
+class NullSink():
+    '''\
+    Sink that drops all played sounds.
+    '''
+
+    def play(self, time: float, sound: 'HeadlessSound') -> None:
+        '''\
+        Receive the sound that is played at the 'time'.
+        '''
+
+    def stop(self, time: float, sound: 'HeadlessSound') -> None:
+        '''\
+        Receive the sound that is stopped at the 'time'.
+        '''
+
+
+class RecordingSink(NullSink):
+    '''\
+    Sink that reminds played sounds as events: (time, source, volume).
+    '''
+
+    def __init__(self) -> None:
+        self.events: List[Tuple[float, str, float]] = []
+
+    def play(self, time: float, sound: 'HeadlessSound') -> None:
+        self.events.append((time, sound.source(), sound.volume))
+
+    def times(self, source: Optional[str] = None) -> List[float]:
+        '''\
+        Return times of events (of the 'source' only if it is given).
+        '''
+
+        return [time for time, event_source, _ in self.events
+                if source is None or event_source == source]
+
+    def clear(self) -> None:
+        '''\
+        Forget all events.
+        '''
+
+        self.events.clear()
+
+
+class HeadlessSound(AbstractSound):
+    '''\
+    Implement AbstractSound by sending the sound to the sink.
+    '''
+
+    def __init__(self, sound_obj: Tuple[str, int, np.ndarray], sink: NullSink,
+                 clock: Callable[[], float]) -> None:
+        '''\
+        'sound_obj' is the path, the frame rate and frames of the sound.
+        '''
+
+        self.sound_obj = sound_obj
+        self.volume = 0.0
+
+        self._sink = sink
+        self._clock = clock
+
+    def play(self) -> None:
+        self._sink.play(self._clock(), self)
+
+    def stop(self) -> None:
+        self._sink.stop(self._clock(), self)
+
+    def set_volume(self, volume: float) -> None:
+        self.volume = volume
+
+    def source(self) -> str:
+        return self.sound_obj[0]
+
+
+class WaveStorage(FileStorage):
+    '''\
+    Implement 'AbstractStorage' interface by reading wave files.
+
+    Sounds are loaded synchronously, but the batch is reported as
+    the Storage does it: sounds are installed in the order, then the
+    view is updated and the notification is displayed once.
+    Decoded frames are cached, read a "Word about caching policy"
+    in docs of the FileStorage.
+    '''
+
+    def __init__(self, cache_capacity: int = 64 * 2 ** 20) -> None:
+        super().__init__(LRUCache(cache_capacity, lambda sound: sound[1].nbytes))
+        self._sink = NullSink()
+        self._clock = perf_counter
+
+    def set_sink(self, sink: NullSink, clock: Callable[[], float]) -> None:
+        '''\
+        Set where sounds are played and the clock to mark them.
+        '''
+
+        self._sink = sink
+        self._clock = clock
+
+    def load_sounds(self, sound_paths: Iterable[str], mappings: Iterable[Iterable[int]],
+                    song: Optional[tuple] = None) -> None:
+        '''\
+        Read about it in the class docs.
+        '''
+
+        total = 0
+        failed = []
+        rows = []
+        for row, (sound_path, mapping) in enumerate(zip(sound_paths, mappings)):
+            if sound_path == '':
+                continue
+            total += 1
+            try:
+                rate, frames = self._read(sound_path)
+            except (OSError, EOFError, wave.Error, ValueError):
+                failed.append(sound_path)
+                continue
+            sound = HeadlessSound((sound_path, rate, frames), self._sink, self._clock)
+            self._install_sound(sound, mapping)
+            self._draw_sound(sound)
+            rows.append(row)
+        if total:
+            self._finish_song(song, rows)
+            self._update_view()
+            self._report_batch(total, failed)
+
+    def _read(self, sound_path: str) -> Tuple[int, np.ndarray]:
+        key = self._cache_key(sound_path)
+        sound = self._cache.get(key)
+        if sound is None:
+            sound = read_wav(sound_path)
+            self._cache.put(key, sound)
+        return sound
+
+
+class HeadlessPlayer(AbstractPlayer, storage=WaveStorage, mapping=ArrayMapping):
+    '''\
+    Implementation for tests and benchmarks.
+
+    The timer is simulated by 'run': it sleeps by the clock until
+    the deadline of the timer and calls 'play'. With the ManualClock
+    (by default) sleeping is instant, with the SystemClock it is real.
+    Read a "Word about timer policy" in docs of the AbstractPlayer.
+    '''
+
+    def __init__(self, /, *args, sink: Optional[NullSink] = None,
+                 clock: Optional[ManualClock] = None, **kwargs) -> None:
+        '''\
+        'sink' - receives played sounds, NullSink by default
+        'clock' - ManualClock or SystemClock, ManualClock by default
+        other arguments are passed to the AbstractPlayer
+        '''
+
+        self.clock = ManualClock() if clock is None else clock
+        self.sink = NullSink() if sink is None else sink
+        self._deadline: Optional[float] = None
+        super().__init__(*args, **kwargs)
+        self._storage.set_sink(self.sink, self.clock)
+
+    def _get_clock(self) -> Callable[[], float]:
+        return self.clock
+
+    def _start_timer(self, delay: float) -> None:
+        self._deadline = self.clock() + delay
+
+    def _stop_timer(self) -> None:
+        self._deadline = None
+
+    def run(self, seconds: float) -> None:
+        '''\
+        Play for 'seconds' by the clock.
+        '''
+
+        end = self.clock() + seconds
+        while self._deadline is not None and self._deadline <= end:
+            self.clock.sleep(self._deadline - self.clock())
+            self._deadline = None
+            self.play()
+        self.clock.sleep(end - self.clock())
@@ -0,0 +1,335 @@
+'''\
+qb_index finds projects with similar rhythms in a big library of projects.
+
+Each row of the mapping is described by the fingerprint that doesn't
+depend on where the row starts (read about it in 'fingerprints'), so
+the groove is found even if it is shifted. Fingerprints are kept in the
+index file, only new and changed projects are read again.
+
+Run it as the script:
+    python qb_index.py library.qbi 'library/*.qbp'             (update the index)
+    python qb_index.py library.qbi --query groove.qbp -k 5    (find similar projects)
+
+Or query it with the current mapping of the player:
+    index = RhythmIndex.load('library.qbi')
+    index.query(player.view(), lengths=player.get_lengths())
+'''
+
+
+import os
+import struct
+import sys
+from argparse import ArgumentParser, Namespace
+from glob import glob
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from qb_format import read_project
+
+
+MAGIC = b'QBPI'
+VERSION = 1
+
+# Harmonics of the fingerprint of the row
+HARMONICS = 8
+ROW_DIMS = HARMONICS + 1
+PROJECT_DIMS = 2 * ROW_DIMS
+
+# magic, version, harmonics, number of entries
+HEADER = struct.Struct('<4sHHI')
+# mtime (ns), size, length of the path, number of rows,
+# then the path (utf-8), the fingerprint of the project and of rows (float32)
+ENTRY = struct.Struct('<qqII')
+
+
+def fingerprints(mapping: Iterable[Iterable[int]], lengths: Iterable[int] = ()) -> np.ndarray:
+    '''\
+    Return fingerprints of rows (rows x ROW_DIMS): the density of hits and
+    magnitudes of first harmonics of the DFT of hits that are put on the
+    circle of the length of the row. The magnitude doesn't depend on the
+    rotation of the row, so shifted grooves have the same fingerprint, and
+    rows of different lengths are compared (read a "Word about metre policy"
+    in docs of the qb_core.Sample). 'lengths' are full by default.
+    '''
+
+    mapping = np.array([np.frombuffer(bytes(line), np.uint8) for line in mapping], np.uint8)
+    rows = len(mapping)
+    if not rows:
+        return np.zeros((0, ROW_DIMS), np.float32)
+    mapping = mapping != 0
+    steps = np.arange(mapping.shape[1])
+    lengths = np.array(tuple(lengths) or (mapping.shape[1],) * rows, np.float64).reshape(rows)
+    lengths = np.maximum(lengths, 1)
+
+    hits = mapping & (steps < lengths[:, None])
+    counts = hits.sum(axis=1)
+    phases = 2 * np.pi * steps / lengths[:, None]
+    harmonics = np.arange(1, HARMONICS + 1)[:, None, None]
+    spectrum = np.abs((np.exp(-1j * harmonics * phases) * hits).sum(axis=2)).T
+
+    result = np.zeros((rows, ROW_DIMS), np.float32)
+    result[:, 0] = counts / lengths
+    result[:, 1:] = spectrum / np.maximum(counts, 1)[:, None]
+    return result
+
+
+def project_fingerprint(rows: np.ndarray, mapping: Iterable[Iterable[int]]) -> np.ndarray:
+    '''\
+    Return the fingerprint of the whole pattern: the fingerprint of all
+    hits (any row) and the mean of fingerprints of rows that have hits.
+    'rows' are fingerprints of rows of the mapping.
+    '''
+
+    lines = [np.frombuffer(bytes(line), np.uint8) for line in mapping]
+    union = np.zeros(max(map(len, lines), default=0), np.uint8)
+    for line in lines:
+        union[:len(line)] |= line != 0
+    used = rows[rows[:, 0] > 0]
+    return np.concatenate((fingerprints((union,))[0],
+                           used.mean(axis=0) if len(used) else np.zeros(ROW_DIMS, np.float32)))
+
+
+class Entry(NamedTuple):
+    '''\
+    Fingerprints of the project and the state of its file when it was read.
+    '''
+
+    mtime: int
+    size: int
+    fingerprint: np.ndarray
+    rows: np.ndarray
+
+
+class RhythmIndex():
+    '''\
+    Index of fingerprints of projects.
+
+    Word about updating policy:
+    The entry of the project is kept while the mtime and the size of its
+    file are the same, so 'update' reads only new and changed projects and
+    drops entries of removed files. Fingerprints of all entries are stacked
+    to matrices once after changes, so the query is the single vectorized
+    pass over them. The file of the index is written aside and renamed.
+    '''
+
+    def __init__(self) -> None:
+        self.entries: Dict[str, Entry] = {}
+
+        self._paths: List[str] = []
+        self._matrix = np.zeros((0, PROJECT_DIMS), np.float32)
+        self._row_matrix = np.zeros((0, ROW_DIMS), np.float32)
+        # Entry and row of each row of the '_row_matrix'
+        self._row_owners = np.zeros((0, 2), np.int64)
+        self._is_stale = False
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def update(self, pjpaths: Iterable[str]) -> Tuple[int, int, List[str]]:
+        '''\
+        Index projects, read a "Word about updating policy" in the class docs.
+        Return numbers of read and dropped entries and paths that failed.
+        '''
+
+        pjpaths = [os.path.abspath(pjpath) for pjpath in pjpaths]
+        read = 0
+        failed = []
+        for pjpath in pjpaths:
+            try:
+                stat = os.stat(pjpath)
+                entry = self.entries.get(pjpath)
+                if entry is not None and (entry.mtime, entry.size) == (stat.st_mtime_ns,
+                                                                      stat.st_size):
+                    continue
+                self.put(pjpath, self._read_entry(pjpath, stat))
+                read += 1
+            except (OSError, ValueError, struct.error):
+                self.entries.pop(pjpath, None)
+                failed.append(pjpath)
+        dropped = [pjpath for pjpath in self.entries if not os.path.exists(pjpath)]
+        for pjpath in dropped:
+            del self.entries[pjpath]
+        self._is_stale = self._is_stale or bool(read or dropped or failed)
+        return read, len(dropped), failed
+
+    def put(self, pjpath: str, entry: Entry) -> None:
+        '''\
+        Add or replace the entry of the project.
+        '''
+
+        self.entries[pjpath] = entry
+        self._is_stale = True
+
+    def _read_entry(self, pjpath: str, stat: os.stat_result) -> Entry:
+        project = read_project(pjpath)
+        lengths = project.lengths[0] if project.lengths else ()
+        rows = fingerprints(project.mapping, lengths)
+        mapping = project.mapping
+        if lengths:
+            mapping = [line[:length] for line, length in zip(mapping, lengths)]
+        return Entry(stat.st_mtime_ns, stat.st_size, project_fingerprint(rows, mapping), rows)
+
+    def query(self, mapping: Iterable[Iterable[int]], k: int = 10,
+              lengths: Iterable[int] = ()) -> List[Tuple[float, str]]:
+        '''\
+        Return up to 'k' nearest projects to the mapping (of the Sample
+        or the project), pairs (distance, path) from the nearest.
+        '''
+
+        mapping = [bytes(line) for line in mapping]
+        lengths = tuple(lengths)
+        rows = fingerprints(mapping, lengths)
+        if lengths:
+            mapping = [line[:length] for line, length in zip(mapping, lengths)]
+        self._stack()
+        return [(distance, self._paths[index]) for distance, index in
+                _nearest(self._matrix, project_fingerprint(rows, mapping), k)]
+
+    def query_row(self, line: Iterable[int], k: int = 10,
+                  length: Optional[int] = None) -> List[Tuple[float, str, int]]:
+        '''\
+        Return up to 'k' nearest rows of all projects to the line,
+        triples (distance, path, row) from the nearest.
+        '''
+
+        line = bytes(line)
+        fingerprint = fingerprints((line,), () if length is None else (length,))[0]
+        self._stack()
+        nearest = _nearest(self._row_matrix, fingerprint, k)
+        return [(distance, self._paths[self._row_owners[index, 0]],
+                 int(self._row_owners[index, 1])) for distance, index in nearest]
+
+    def _stack(self) -> None:
+        '''\
+        Stack fingerprints to matrices, read a "Word about updating policy".
+        '''
+
+        if not self._is_stale:
+            return
+        self._paths = sorted(self.entries)
+        entries = [self.entries[pjpath] for pjpath in self._paths]
+        self._matrix = np.array([entry.fingerprint for entry in entries],
+                                np.float32).reshape(-1, PROJECT_DIMS)
+        # Rows without hits are never similar to anything
+        used = [entry.rows[:, 0] > 0 for entry in entries]
+        self._row_matrix = np.concatenate(
+            [entry.rows[mask] for entry, mask in zip(entries, used)] or [self._row_matrix[:0]])
+        self._row_owners = np.array([(index, row) for index, mask in enumerate(used)
+                                     for row in np.flatnonzero(mask)], np.int64).reshape(-1, 2)
+        self._is_stale = False
+
+    def save(self, path: str) -> None:
+        '''\
+        Write the index, read a "Word about updating policy" in the class docs.
+        '''
+
+        part_path = path + '.part'
+        with open(part_path, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, HARMONICS, len(self.entries)))
+            for pjpath, entry in self.entries.items():
+                encoded = pjpath.encode('utf-8')
+                file.write(ENTRY.pack(entry.mtime, entry.size, len(encoded), len(entry.rows)))
+                file.write(encoded)
+                file.write(entry.fingerprint.astype('<f4').tobytes())
+                file.write(entry.rows.astype('<f4').tobytes())
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(part_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'RhythmIndex':
+        '''\
+        Read the index, the empty one is returned if there is no file
+        or it was made with other fingerprints.
+        '''
+
+        index = cls()
+        if not os.path.exists(path):
+            return index
+        with open(path, 'rb') as file:
+            data = file.read()
+        magic, version, harmonics, count = HEADER.unpack_from(data)
+        if magic != MAGIC or version > VERSION:
+            raise ValueError(f'Unsupported index ({path})')
+        if harmonics != HARMONICS:
+            return index
+        index.entries = dict(_unpack_entries(data, count))
+        index._is_stale = True
+        return index
+
+
+def _unpack_entries(data: bytes, count: int) -> Iterator[Tuple[str, Entry]]:
+    '''\
+    Yield pairs (path, entry) of the index file, read about them in ENTRY.
+    '''
+
+    offset = HEADER.size
+    for _ in range(count):
+        mtime, size, path_len, rows = ENTRY.unpack_from(data, offset)
+        offset += ENTRY.size
+        pjpath = data[offset:offset + path_len].decode('utf-8')
+        offset += path_len
+        values = np.frombuffer(data, '<f4', PROJECT_DIMS + rows * ROW_DIMS, offset)
+        offset += values.nbytes
+        yield pjpath, Entry(mtime, size, values[:PROJECT_DIMS].astype(np.float32),
+                            values[PROJECT_DIMS:].reshape(rows, ROW_DIMS).astype(np.float32))
+
+
+def _nearest(matrix: np.ndarray, fingerprint: np.ndarray,
+             k: int) -> List[Tuple[float, int]]:
+    '''\
+    Return up to 'k' pairs (distance, row of the matrix) from the nearest.
+    '''
+
+    if len(matrix) == 0 or k < 1:
+        return []
+    distances = np.sqrt(((matrix - fingerprint) ** 2).sum(axis=1))
+    k = min(k, len(distances))
+    nearest = np.argpartition(distances, k - 1)[:k]
+    nearest = nearest[np.argsort(distances[nearest], kind='stable')]
+    return [(float(distances[index]), int(index)) for index in nearest]
+
+
+def parse_args(argv: Optional[List[str]] = None) -> Namespace:
+    '''\
+    Read about arguments by the '--help'.
+    '''
+
+    parser = ArgumentParser(description='Index qbeater projects by rhythm and query the index')
+    parser.add_argument('index', help='index file')
+    parser.add_argument('projects', nargs='*', help='project files or globs to index')
+    parser.add_argument('--query', help='project to find similar projects to')
+    parser.add_argument('-k', type=int, default=10, help='number of results')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    '''\
+    Update the index by projects and answer the query, return 1 if
+    any project failed.
+    '''
+
+    args = parse_args(argv)
+    index = RhythmIndex.load(args.index)
+    failed = []
+    if args.projects:
+        pjpaths = [pjpath for pattern in args.projects
+                   for pjpath in sorted(glob(pattern, recursive=True)) or [pattern]]
+        read, dropped, failed = index.update(pjpaths)
+        for pjpath in failed:
+            print(f'{pjpath} FAILED', flush=True)
+        print(f'Indexed {read} project(s), dropped {dropped}, {len(index)} in the index')
+        if read or dropped or failed:
+            index.save(args.index)
+
+    if args.query:
+        project = read_project(args.query)
+        for distance, pjpath in index.query(project.mapping, args.k,
+                                            project.lengths[0] if project.lengths else ()):
+            print(f'{distance:.4f} {pjpath}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,298 @@
+'''\
+qb_journal provides the autosave journal: edits of the project
+are appended to the sidecar file as compact records, so the autosave
+costs as much as the edit, not as the whole project.
+'''
+
+
+import os
+import struct
+import zlib
+from contextlib import suppress
+from io import BytesIO
+from queue import SimpleQueue
+from threading import Thread
+from typing import BinaryIO, Callable, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from qb_core import Assigned, CellToggled, Cleared, LengthChanged, Resized, RowAdded, RowRemoved
+from qb_format import Project, read_buffer, write_binary
+
+
+MAGIC = b'QBPJ'
+VERSION = 1
+
+# magic, version
+HEADER = struct.Struct('<4sH')
+# kind, length and crc32 of the payload
+RECORD = struct.Struct('<BII')
+
+# Kinds of records and their payloads
+SNAPSHOT = 0  # the whole project in the binary format of qb_format
+CELL = 1      # CELL_DATA: pattern, row, step, value
+SOUND = 2     # the path of the sound that is added to the end (utf-8)
+REMOVE = 3    # REMOVE_DATA: the row that is removed from all patterns
+PATTERN = 4   # PATTERN_DATA: pattern, rows, steps, then packed bits of rows
+
+CELL_DATA = struct.Struct('<HHHB')
+REMOVE_DATA = struct.Struct('<H')
+PATTERN_DATA = struct.Struct('<HII')
+
+
+def journal_path(pjpath: str) -> str:
+    '''\
+    Return the path of the journal of the project.
+    '''
+
+    return pjpath + '.journal'
+
+
+def pack_record(kind: int, payload: bytes) -> bytes:
+    '''\
+    Return the record with the header.
+    '''
+
+    return RECORD.pack(kind, len(payload), zlib.crc32(payload)) + payload
+
+
+def needs_snapshot(changes: Iterable[Tuple[int, NamedTuple]]) -> bool:
+    '''\
+    Return True if changes can't be packed by 'pack_changes': the size or
+    the length of the row is changed or rows are moved in the same batch
+    where the whole pattern (or the new row) is packed, because those are
+    packed as they are now.
+    '''
+
+    kinds = {type(event) for _, event in changes}
+    return (Resized in kinds or LengthChanged in kinds
+            or RowRemoved in kinds and bool(kinds & {RowAdded, Cleared, Assigned})
+            or RowAdded in kinds and bool(kinds & {Cleared, Assigned}))
+
+
+def pack_changes(changes: Iterable[Tuple[int, NamedTuple]], paths: List[str],
+                 pattern: Callable[[int], np.ndarray]) -> bytes:
+    '''\
+    Pack changes of the AbstractSampleClient (pairs of the pattern index and
+    the event), 'paths' are paths of sounds and 'pattern' returns the current
+    mapping of the pattern, it is called only for Cleared, Assigned and
+    RowAdded. Sounds are added and removed in all patterns, so they are
+    packed once, by events of the first pattern.
+    '''
+
+    records = []
+    for index, event in changes:
+        if isinstance(event, CellToggled):
+            records.append(pack_record(CELL, CELL_DATA.pack(index, *event)))
+        elif isinstance(event, RowAdded):
+            if index == 0:
+                records.append(pack_record(SOUND, paths[event.row].encode('utf-8')))
+            for step in np.flatnonzero(pattern(index)[event.row]):
+                records.append(pack_record(CELL, CELL_DATA.pack(index, event.row, step, 1)))
+        elif isinstance(event, RowRemoved):
+            if index == 0:
+                records.append(pack_record(REMOVE, REMOVE_DATA.pack(event.row)))
+        elif isinstance(event, (Cleared, Assigned)):
+            mapping = np.asarray(pattern(index), np.uint8)
+            records.append(pack_record(PATTERN, PATTERN_DATA.pack(index, *mapping.shape)
+                                       + np.packbits(mapping != 0, axis=1).tobytes()))
+        else:
+            raise ValueError(f'The event should be saved by the snapshot ({event})')
+    return b''.join(records)
+
+
+def read_journal(path: str) -> Tuple[Optional[Project], List[Tuple[int, bytes]]]:
+    '''\
+    Return the snapshot (None if the journal has no snapshot) and records
+    after it. The damaged tail (the record that is written partly or
+    broken) and all records after it are dropped.
+    '''
+
+    with open(path, 'rb') as file:
+        data = file.read()
+    magic, version = HEADER.unpack_from(data)
+    if magic != MAGIC or version > VERSION:
+        raise ValueError(f'Unsupported journal ({path})')
+
+    records = []
+    offset = HEADER.size
+    while offset + RECORD.size <= len(data):
+        kind, length, crc = RECORD.unpack_from(data, offset)
+        payload = data[offset + RECORD.size:offset + RECORD.size + length]
+        if len(payload) != length or zlib.crc32(payload) != crc:
+            break
+        records.append((kind, payload))
+        offset += RECORD.size + length
+
+    snapshot = None
+    if records and records[0][0] == SNAPSHOT:
+        snapshot = read_buffer(records.pop(0)[1])
+    return snapshot, records
+
+
+def replay(project: Project, records: Iterable[Tuple[int, bytes]]) -> Project:
+    '''\
+    Apply records to the project and return the new one. Records are
+    applied until the first one that doesn't fit the project.
+    '''
+
+    paths = list(project.paths)
+    blobs = list(project.blobs)
+    lengths = [list(pattern_lengths) for pattern_lengths in project.lengths]
+    patterns = [np.array(pattern, np.uint8) for pattern in (project.mapping, *project.patterns)]
+    try:
+        for kind, payload in records:
+            _apply_record(kind, payload, (paths, blobs, lengths), patterns)
+    except (IndexError, ValueError, struct.error):
+        pass
+    return project._replace(paths=paths, mapping=patterns[0], patterns=tuple(patterns[1:]),
+                            blobs=tuple(blobs), lengths=tuple(map(tuple, lengths)))
+
+
+def _apply_record(kind: int, payload: bytes, rows: Tuple[List[str], list, List[List[int]]],
+                  patterns: List[np.ndarray]) -> None:
+    '''\
+    Apply the record, 'rows' are lists of the project that have an item
+    per row: paths, blobs and lengths (of each pattern), they may be empty.
+    '''
+
+    if kind == CELL:
+        index, row, step, value = CELL_DATA.unpack(payload)
+        if row >= len(rows[0]):
+            raise IndexError(row)
+        patterns[index][row, step] = value
+    elif kind in (SOUND, REMOVE):
+        _apply_row(kind, payload, rows, patterns)
+    elif kind == PATTERN:
+        index, rows_n, steps = PATTERN_DATA.unpack_from(payload)
+        packed = np.frombuffer(payload, np.uint8, offset=PATTERN_DATA.size)
+        mapping = np.unpackbits(packed.reshape(rows_n, (steps + 7) // 8), axis=1, count=steps)
+        if mapping.shape != patterns[index].shape:
+            raise ValueError('The pattern should be of the same shape')
+        patterns[index] = mapping
+    else:
+        raise ValueError(f'Unknown record ({kind})')
+
+
+def _apply_row(kind: int, payload: bytes, rows: Tuple[List[str], list, List[List[int]]],
+               patterns: List[np.ndarray]) -> None:
+    '''\
+    Add (SOUND) or remove (REMOVE) the row, read about 'rows' in '_apply_record'.
+    '''
+
+    paths, blobs, lengths = rows
+    if kind == SOUND:
+        paths.append(payload.decode('utf-8'))
+        if blobs:
+            blobs.append(None)
+        for pattern_lengths, pattern in zip(lengths, patterns):
+            pattern_lengths.append(pattern.shape[1])
+        for index, pattern in enumerate(patterns):
+            patterns[index] = np.vstack((pattern, np.zeros((1, pattern.shape[1]), np.uint8)))
+        return
+
+    (row,) = REMOVE_DATA.unpack(payload)
+    del paths[row]
+    if blobs:
+        del blobs[row]
+    for pattern_lengths in lengths:
+        del pattern_lengths[row]
+    for index, pattern in enumerate(patterns):
+        patterns[index] = np.delete(pattern, row, axis=0)
+
+
+class Journal():
+    '''\
+    Write the journal in the thread of writing.
+
+    Word about journal policy:
+    The file is the header, the snapshot of the whole project (it may be
+    missed, then records are applied to the project file) and records of
+    edits after it. Records are written in the order and flushed to the
+    disk at once. 'compact' replaces the file by the new one that has only
+    the snapshot: it is written aside and renamed, so the file is always
+    the old journal or the new one, and records that are appended after
+    'compact' get to the new file. The error of writing is kept in 'error',
+    the thread keeps working, but the journal should be compacted after it,
+    because records after the error may follow the broken one.
+    '''
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.error: Optional[str] = None
+        # Bytes of records after the last snapshot
+        self.size = 0
+
+        self._queue: SimpleQueue = SimpleQueue()
+        self._thread = Thread(target=self._run, name='qb_journal', daemon=True)
+        self._thread.start()
+
+    def append(self, records: bytes) -> None:
+        '''\
+        Append packed records (read about them in 'pack_changes').
+        '''
+
+        self.size += len(records)
+        self._queue.put(('append', records))
+
+    def compact(self, project: Project) -> None:
+        '''\
+        Replace the journal by the snapshot, 'project' shouldn't be changed after.
+        '''
+
+        self.size = 0
+        self._queue.put(('compact', project))
+
+    def close(self) -> None:
+        '''\
+        Write all queued records and stop the thread.
+        '''
+
+        self._queue.put(('close', None))
+        self._thread.join()
+
+    def _run(self) -> None:
+        file = None
+        while True:
+            name, data = self._queue.get()
+            if name == 'close':
+                break
+            try:
+                if name == 'compact':
+                    # The file is closed by the snapshot even if it fails
+                    file, old_file = None, file
+                    self._write_snapshot(old_file, data)
+                else:
+                    file = self._write_records(file, data)
+            except (OSError, ValueError) as error:
+                # The thread always survives, the file is opened again by the next write
+                if file is not None:
+                    with suppress(OSError):
+                        file.close()
+                file = None
+                self.error = str(error)
+        if file is not None:
+            file.close()
+
+    def _write_records(self, file: Optional[BinaryIO], records: bytes) -> BinaryIO:
+        if file is None:
+            file = open(self.path, 'ab')  # pylint: disable=consider-using-with
+            if file.tell() == 0:
+                file.write(HEADER.pack(MAGIC, VERSION))
+        file.write(records)
+        file.flush()
+        os.fsync(file.fileno())
+        return file
+
+    def _write_snapshot(self, file: Optional[BinaryIO], project: Project) -> None:
+        if file is not None:
+            file.close()
+        buffer = BytesIO()
+        write_binary(buffer, project)
+        part_path = self.path + '.part'
+        with open(part_path, 'wb') as part:
+            part.write(HEADER.pack(MAGIC, VERSION))
+            part.write(pack_record(SNAPSHOT, buffer.getvalue()))
+            part.flush()
+            os.fsync(part.fileno())
+        os.replace(part_path, self.path)
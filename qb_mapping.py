@@ -0,0 +1,214 @@
+'''\
+qb_mapping provides storages for the mapping of the Sample.
+'''
+
+
+from itertools import islice
+from typing import Iterable, Iterator, List
+
+import numpy as np
+
+
+class BytesMapping():
+    '''\
+    Store the mapping as the list of bytearrays, one byte per cell.
+
+    Both mapping types implement the same interface and
+    rows are given as zero-copy read-only views.
+    '''
+
+    def __init__(self) -> None:
+        self._length = 0
+        self._lines: List[bytearray] = []
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    def reset(self, rows: int, length: int) -> None:
+        '''\
+        Make 'rows' empty lines of 'length' cells.
+        '''
+
+        self._length = length
+        self._lines = [bytearray(length) for _ in range(rows)]
+
+    def append(self, line: Iterable[int]) -> None:
+        '''\
+        Add the line, it is truncated or padded to the length.
+        '''
+
+        new_line = bytearray(self._length)
+        for i, flag in enumerate(islice(line, self._length)):
+            new_line[i] = flag
+        self._lines.append(new_line)
+
+    def remove(self, row: int) -> None:
+        '''\
+        Remove the line.
+        '''
+
+        del self._lines[row]
+
+    def switch(self, row: int, step: int) -> int:
+        '''\
+        Switch the cell and return its new value.
+        '''
+
+        self._lines[row][step] ^= 1
+        return self._lines[row][step]
+
+    def row(self, row: int) -> memoryview:
+        '''\
+        Return read-only view of the line.
+        '''
+
+        return memoryview(self._lines[row]).toreadonly()
+
+    def rows(self) -> Iterator[memoryview]:
+        '''\
+        Yield read-only views of all lines.
+        '''
+
+        for line in self._lines:
+            yield memoryview(line).toreadonly()
+
+    def hits(self, row: int) -> List[int]:
+        '''\
+        Return steps that are turned on at the line.
+        '''
+
+        return [step for step, flag in enumerate(self._lines[row]) if flag]
+
+    def column(self, step: int) -> List[int]:
+        '''\
+        Return lines that are turned on at the step.
+        '''
+
+        return [row for row, line in enumerate(self._lines) if line[step]]
+
+    def array(self) -> np.ndarray:
+        '''\
+        Return read-only copy of the whole mapping (rows x steps).
+        '''
+
+        data = np.frombuffer(b''.join(self._lines), np.uint8)
+        return data.reshape(len(self._lines), self._length)
+
+    def assign(self, data: np.ndarray) -> None:
+        '''\
+        Replace the mapping by the 2-D array (rows x steps).
+        '''
+
+        self._length = data.shape[1]
+        self._lines = [bytearray(line.tobytes()) for line in data.astype(np.uint8)]
+
+
+class ArrayMapping():
+    '''\
+    Store the mapping as the 2-D uint8 NumPy array.
+
+    Word about memory policy:
+    The array has a capacity of rows that grows twice
+    when it is exceeded, so appending the line doesn't copy
+    the whole mapping. Queries are vectorized.
+    '''
+
+    def __init__(self) -> None:
+        self._rows = 0
+        self._data = np.zeros((0, 0), np.uint8)
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def reset(self, rows: int, length: int) -> None:
+        '''\
+        Make 'rows' empty lines of 'length' cells.
+        '''
+
+        self._rows = rows
+        self._data = np.zeros((rows, length), np.uint8)
+
+    def append(self, line: Iterable[int]) -> None:
+        '''\
+        Add the line, it is truncated or padded to the length.
+        '''
+
+        length = self._data.shape[1]
+        if self._rows == len(self._data):
+            grown = np.zeros((max(2 * self._rows, 4), length), np.uint8)
+            grown[:self._rows] = self._data
+            self._data = grown
+        flags = np.fromiter(islice(line, length), np.uint8)
+        self._data[self._rows] = 0
+        self._data[self._rows, :len(flags)] = flags
+        self._rows += 1
+
+    def remove(self, row: int) -> None:
+        '''\
+        Remove the line.
+        '''
+
+        row = self._index(row)
+        self._data[row:self._rows - 1] = self._data[row + 1:self._rows]
+        self._rows -= 1
+
+    def switch(self, row: int, step: int) -> int:
+        '''\
+        Switch the cell and return its new value.
+        '''
+
+        row = self._index(row)
+        self._data[row, step] ^= 1
+        return int(self._data[row, step])
+
+    def row(self, row: int) -> np.ndarray:
+        '''\
+        Return read-only view of the line.
+        '''
+
+        return self.array()[self._index(row)]
+
+    def rows(self) -> Iterator[np.ndarray]:
+        '''\
+        Yield read-only views of all lines.
+        '''
+
+        yield from self.array()
+
+    def hits(self, row: int) -> List[int]:
+        '''\
+        Return steps that are turned on at the line.
+        '''
+
+        return np.flatnonzero(self._data[self._index(row)]).tolist()
+
+    def column(self, step: int) -> List[int]:
+        '''\
+        Return lines that are turned on at the step.
+        '''
+
+        return np.flatnonzero(self._data[:self._rows, step]).tolist()
+
+    def array(self) -> np.ndarray:
+        '''\
+        Return read-only view of the whole mapping (rows x steps).
+        '''
+
+        view = self._data[:self._rows]
+        view.flags.writeable = False
+        return view
+
+    def assign(self, data: np.ndarray) -> None:
+        '''\
+        Replace the mapping by the 2-D array (rows x steps).
+        '''
+
+        self._rows = len(data)
+        self._data = np.array(data, np.uint8)
+
+    def _index(self, row: int) -> int:
+        if row < 0:
+            row += self._rows
+        if not 0 <= row < self._rows:
+            raise IndexError('mapping row index out of range')
+        return row
@@ -4,115 +4,101 @@ as core implementation for ui.
 '''
 
 
-from time import perf_counter as get_now
-from typing import Iterable, Tuple
+from math import ceil
+from typing import Iterable
 
-from PyQt5.QtCore import QTimer
+from PyQt5.QtCore import QObject, QThread, QTimer, Qt, pyqtSignal, pyqtSlot
 
-from qb_abs_storage import AbstractStorageClient, AbstractSound
-from qb_core import AbstractSampleClient
-from qb_storage import Storage
+from qb_abs_player import AbstractPlayer
+from qb_engine import BeatEngine
+from qb_mapping import ArrayMapping
+from qb_storage import Sound, Storage
 
 
-class Player(AbstractSampleClient, AbstractStorageClient, storage=Storage):
+class AudioWorker(QObject):
     '''\
-    Implementation for ui.
-    '''
-
-    def __init__(self, /, time_sign: Tuple[int] = (4, 8), bpm: int = 90, tact_n: int = 3) -> None:
-        super().__init__(time_sign=time_sign, bpm=bpm, tact_n=tact_n)
-
-        self._volume = 0
-        self._is_turned_on = False
-
-        self._period = 60 / self.bpm / (self.time_sign[1] / 4)
-        self._timer = QTimer()
-        self._timer.timeout.connect(self.play)
-
-    def _install_sound(self, sound: AbstractSound, mapping: Iterable[int]) -> None:
-        self._add_sound(sound, mapping)
-        sound.set_volume(self._volume)
-
-    def _get_view(self) -> Iterable:
-        yield self.view()
-        yield self._sounds
+    Tick the engine in the audio thread by the precise
+    single-shot timer, 'wake' makes the tick out of turn.
 
-    def play(self) -> None:
-        '''\
-        Run and implement playing cycle.
-        '''
-
-        if self._is_turned_on is False:
-            return
-        beat_start = get_now()
-        self._play_beat()
-        self._wait_next_beat(beat_start)
+    Slots are decorated, so PyQt calls them in the thread
+    of the worker, not in the thread of the connection.
+    '''
 
-    def _wait_next_beat(self, beat_start: float) -> None:
-        '''\
-        Preset timer to the next beat time with
-        correction by the actual beat playing time,
-        to avoid slow bpm, because of long play running.
-        '''
+    wake = pyqtSignal()
 
-        time_to_next = self._period - (get_now() - beat_start)
-        time_to_next = max(time_to_next, 0)
-        self._timer.start(int(time_to_next * 1000))
+    def __init__(self, engine: BeatEngine) -> None:
+        super().__init__()
+        self._engine = engine
+        self._timer = None
+        self.wake.connect(self.tick)
 
-    def _play_beat(self) -> None:
+    @pyqtSlot()
+    def start(self) -> None:
         '''\
-        Play all the sounds that should be played at
-        that beat.
+        Make the timer, it should be called in the audio thread.
         '''
 
-        for sound in self._beat():
-            sound.play()
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setTimerType(Qt.PreciseTimer)
+        self._timer.timeout.connect(self.tick)
+        self.tick()
 
-    def set_bpm(self, bpm: int) -> None:
+    @pyqtSlot()
+    def tick(self) -> None:
         '''\
-        Reuse inherited 'set_bpm' and set a '_period'.
+        Read a "Word about timer policy" in docs of the AbstractPlayer.
         '''
 
-        self._set_bpm(bpm)
-        self._period = 60 / self.bpm / (self.time_sign[1] / 4)
+        if self._timer is None:
+            return
+        delay = self._engine.tick()
+        if delay is None:
+            self._timer.stop()
+        else:
+            # The timer shouldn't fire early, the lookahead absorbs the lateness
+            self._timer.start(ceil(delay * 1000))
 
-    def resize(self, time_sign: Tuple[int] = (4, 8), tact_n: int = 3) -> None:
-        '''\
-        Reuse inherited 'resize' and set a '_period'.
-        '''
 
-        self._resize(time_sign, tact_n)
-        self._period = 60 / self.bpm / (self.time_sign[1] / 4)
+class Player(AbstractPlayer, storage=Storage, mapping=ArrayMapping):
+    '''\
+    Implementation for ui.
 
-    def set_volume(self, volume: float) -> None:
-        '''\
-        Update volume of all sounds.
-        '''
+    Word about audio thread policy:
+    The engine is ticked in the separate thread of the time critical
+    priority, so slow slots of the ui never delay beats. Sounds (with all
+    their voices) are moved to that thread when they are installed, after
+    that they are played and their volume is changed only by the engine.
+    The thread should be stopped by 'close'.
+    '''
 
-        for sound in self._sounds:
-            sound.set_volume(volume)
-        self._volume = volume
+    def __init__(self, /, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
 
-    def turn(self) -> None:
-        '''\
-        Method for encapsulation play on/off logic.
-        '''
+        self._thread = QThread()
+        self._worker = AudioWorker(self._engine)
+        self._worker.moveToThread(self._thread)
+        self._thread.started.connect(self._worker.start)
+        self._thread.finished.connect(self._worker.deleteLater)
+        self._thread.start(QThread.TimeCriticalPriority)
 
-        if self._is_turned_on:
-            return self.turn_off()
-        self.turn_on()
+    def _install_sound(self, sound: Sound, mapping: Iterable[int]) -> None:
+        sound.move_to_thread(self._thread)
+        super()._install_sound(sound, mapping)
 
-    def turn_on(self) -> None:
+    def play(self) -> None:
         '''\
-        Start playing.
+        Wake the audio thread to apply messages.
         '''
 
-        self._is_turned_on = True
-        self.play()
+        self._worker.wake.emit()
 
-    def turn_off(self) -> None:
+    def close(self) -> None:
         '''\
-        Turn off, but the playing process must be stopped by itself.
+        Stop playing and the audio thread, wait for pending saves and the journal.
         '''
 
-        self._is_turned_on = False
+        self.turn_off()
+        self._thread.quit()
+        self._thread.wait()
+        self._storage.close()
@@ -0,0 +1,326 @@
+'''\
+qb_render provides offline rendering ("bounce") of the mapping to a wave file.
+'''
+
+
+import wave
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from qb_cache import LRUCache, sound_key
+from qb_core import beat_period
+
+
+def read_wav(path: str) -> Tuple[int, np.ndarray]:
+    '''\
+    Read PCM wave file and return its frame rate and
+    float32 frames (frames x channels) in range [-1, 1].
+    '''
+
+    with wave.open(path, 'rb') as file:
+        rate = file.getframerate()
+        channels = file.getnchannels()
+        width = file.getsampwidth()
+        raw = file.readframes(file.getnframes())
+
+    if width == 1:
+        data = (np.frombuffer(raw, np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        data = np.frombuffer(raw, '<i2').astype(np.float32) / 2 ** 15
+    elif width == 3:
+        # There is no 24-bit dtype, so shift bytes to the top of int32
+        triples = np.frombuffer(raw, np.uint8).reshape(-1, 3).astype(np.int32)
+        data = (triples[:, 0] << 8 | triples[:, 1] << 16 | triples[:, 2] << 24) >> 8
+        data = data.astype(np.float32) / 2 ** 23
+    elif width == 4:
+        data = np.frombuffer(raw, '<i4').astype(np.float32) / 2 ** 31
+    else:
+        raise ValueError(f'Unsupported sample width ({width}) of the {path}')
+    return rate, data.reshape(-1, channels)
+
+
+def write_wav(path: str, frames: np.ndarray, rate: int) -> None:
+    '''\
+    Write float frames (frames x channels) as 16-bit PCM wave file,
+    samples out of range [-1, 1] are clipped.
+    '''
+
+    pcm = (np.clip(frames, -1, 1) * (2 ** 15 - 1)).astype('<i2')
+    with wave.Wave_write(path) as file:
+        file.setnchannels(pcm.shape[1])
+        file.setsampwidth(2)
+        file.setframerate(rate)
+        file.writeframes(pcm.tobytes())
+
+
+def convert(frames: np.ndarray, rate: int, to_rate: int, to_channels: int) -> np.ndarray:
+    '''\
+    Make frames compatible with the output format:
+    channels are duplicated or mixed down, the rate is
+    changed by the linear interpolation.
+    '''
+
+    if frames.shape[1] != to_channels:
+        mono = frames.mean(axis=1, keepdims=True)
+        frames = np.repeat(mono, to_channels, axis=1)
+    if rate != to_rate and len(frames):
+        length = max(round(len(frames) * to_rate / rate), 1)
+        points = np.arange(length) * (rate / to_rate)
+        frames = np.stack([np.interp(points, np.arange(len(frames)), channel)
+                           for channel in frames.T], axis=1)
+    return np.ascontiguousarray(frames, dtype=np.float32)
+
+
+class StepMixer():
+    '''\
+    Mix the set of sounds that are played at the same step to one buffer.
+
+    Word about memoizing policy:
+    Patterns repeat few sets of sounds, so the mixed buffer is cached
+    by the set (keys of sounds, read about them in qb_cache.sound_key)
+    and the volume. The set is sorted, so the order of rows doesn't matter,
+    but the same sound in two rows is mixed twice. Entries depend only on
+    the content, so they never get stale and the cache is bounded by its
+    capacity: edits of the mapping don't touch it. 'forget' drops the set
+    of sounds, 'forget_volume' drops sets of the old volume.
+    '''
+
+    def __init__(self, channels: int = 2, capacity: int = 64 * 2 ** 20) -> None:
+        self.channels = channels
+        self._cache = LRUCache(capacity, lambda frames: frames.nbytes)
+
+    def mix(self, sounds: Iterable[Tuple[Hashable, np.ndarray]], volume: float) -> np.ndarray:
+        '''\
+        Return the buffer of 'sounds' (pairs of the key and frames)
+        multiplied by the 'volume', it shouldn't be changed.
+        '''
+
+        sounds = sorted(sounds, key=lambda sound: sound[0])
+        key = (tuple(key for key, _ in sounds), volume)
+        buffer = self._cache.get(key)
+        if buffer is None:
+            buffer = np.zeros((max((len(frames) for _, frames in sounds), default=0),
+                               self.channels), np.float32)
+            for _, frames in sounds:
+                buffer[:len(frames)] += frames
+            buffer *= volume
+            self._cache.put(key, buffer)
+        return buffer
+
+    def forget(self, keys: Iterable[Hashable]) -> None:
+        '''\
+        Drop buffers of the set of sounds with any volume.
+        '''
+
+        keys = tuple(sorted(keys))
+        for key in [key for key in self._cache if key[0] == keys]:
+            self._cache.discard(key)
+
+    def forget_volume(self, volume: float) -> None:
+        '''\
+        Drop buffers of the 'volume'.
+        '''
+
+        for key in [key for key in self._cache if key[1] == volume]:
+            self._cache.discard(key)
+
+    def stats(self) -> dict:
+        '''\
+        Read about it in qb_cache.LRUCache.stats.
+        '''
+
+        return self._cache.stats()
+
+
+def _metres(patterns: List[List[np.ndarray]],
+            lengths: Iterable[Iterable[int]]) -> List[List[int]]:
+    '''\
+    Return lengths of all lines of patterns, lines without the length are full.
+    '''
+
+    lengths = list(lengths)
+    return [[*(lengths[index] if index < len(lengths) else ()),
+             *(len(line) for line in pattern)][:len(pattern)]
+            for index, pattern in enumerate(patterns)]
+
+
+def _cycle(mapping: List[np.ndarray], lengths: List[int], beats: int) -> List[np.ndarray]:
+    '''\
+    Return the loop of the mapping that starts at the 'beats' from the start,
+    lines that are shorter than the mapping are cycled by their 'lengths'.
+    '''
+
+    return [line if length >= len(line) else np.resize(np.roll(line[:length], -beats), len(line))
+            for line, length in zip(mapping, lengths)]
+
+
+class Renderer():
+    '''\
+    Renderer mixes the mapping offline, much faster than real time.
+
+    Word about mixing policy:
+    Beats are placed by the same period that the Player uses,
+    but offsets are counted from the start of the render, so
+    rounding to frames is never accumulated. The single loop of the
+    mapping is mixed once (with the tail of the longest sound) and
+    then added to the output at each loop offset. Each step adds
+    the one buffer of its sounds, read a "Word about memoizing policy"
+    in docs of the StepMixer.
+
+    Lines may have their own 'lengths' (read a "Word about metre policy"
+    in docs of the qb_core.Sample), they are cycled by them from the start
+    of the render, so such a loop is mixed once per phase of short lines,
+    not once for all.
+    '''
+
+    def __init__(self, rate: int = 44100, channels: int = 2,
+                 cache: Optional[LRUCache] = None) -> None:
+        '''\
+        'cache' keeps decoded sounds by the key of the file, it may be
+        shared by renderers, read about keys in qb_cache.sound_key.
+        '''
+
+        self.rate = rate
+        self.channels = channels
+
+        self._period = beat_period(90, (4, 8))
+        self._volume = 1.0
+        if cache is None:
+            cache = LRUCache(256 * 2 ** 20, lambda frames: frames.nbytes)
+        self._cache = cache
+        self.mixer = StepMixer(channels)
+
+    def set_tempo(self, bpm: int, time_sign: Tuple[int]) -> None:
+        '''\
+        Set the beat period as the Player does it.
+        '''
+
+        self._period = beat_period(bpm, time_sign)
+
+    def set_volume(self, volume: float) -> None:
+        '''\
+        Set the volume of all sounds, buffers of the old volume are dropped.
+        '''
+
+        if volume != self._volume:
+            self.mixer.forget_volume(self._volume)
+        self._volume = volume
+
+    def load(self, source: str) -> np.ndarray:
+        '''\
+        Return the frames of the sound converted to the output format.
+        '''
+
+        return self._load_keyed(source)[1]
+
+    def _load_keyed(self, source: str) -> Tuple[Hashable, np.ndarray]:
+        key = sound_key(source)
+        frames = self._cache.get((key, self.rate, self.channels))
+        if frames is None:
+            rate, frames = read_wav(source)
+            frames = convert(frames, rate, self.rate, self.channels)
+            self._cache.put((key, self.rate, self.channels), frames)
+        return key, frames
+
+    def render(self, mapping: Iterable[Iterable[int]], sources: Iterable[str],
+               loops: int = 1, lengths: Iterable[int] = ()) -> np.ndarray:
+        '''\
+        Mix 'loops' repeats of the mapping and return
+        float frames (frames x channels).
+        '''
+
+        return self.render_song((mapping,), (), sources, loops, lengths=(lengths,))
+
+    def render_song(self, mappings: Iterable[Iterable[Iterable[int]]],
+                    slots: Iterable[Tuple[int, int]], sources: Iterable[str],
+                    loops: int = 1, *, lengths: Iterable[Iterable[int]] = ()) -> np.ndarray:
+        '''\
+        Mix 'loops' repeats of the song: 'mappings' are patterns,
+        'slots' are pairs (pattern index, repeats), read about them in
+        qb_core.AbstractSampleClient, 'lengths' are lengths of lines of
+        each pattern (full by default). Each pattern is mixed once and
+        added at offsets of its repeats, so the song is never expanded.
+        '''
+
+        sounds = [self._load_keyed(source) for source in sources]
+        patterns = [[np.frombuffer(bytes(line), np.uint8) for line in mapping]
+                    for mapping in mappings]
+        metres = _metres(patterns, lengths)
+        slots = list(slots) or [(0, 1)]
+
+        starts, end = self._song_starts(patterns, metres, slots * loops)
+        loops_of: Dict[tuple, np.ndarray] = {}
+        for _, key, beats in starts:
+            if key not in loops_of:
+                loops_of[key] = self._render_loop(_cycle(patterns[key[0]], metres[key[0]], beats),
+                                                  sounds)
+        return self._place(loops_of, starts, end)
+
+    def _place(self, loops_of: Dict[tuple, np.ndarray], starts: List[tuple],
+               end: int) -> np.ndarray:
+        '''\
+        Add mixed loops to the output at their starts, read about them in '_song_starts'.
+        '''
+
+        size = max([end] + [start + len(loops_of[key]) for start, key, _ in starts])
+        output = np.zeros((size, self.channels), np.float32)
+        for start, key, _ in starts:
+            output[start:start + len(loops_of[key])] += loops_of[key]
+        return output
+
+    def _song_starts(self, patterns: List[List[np.ndarray]], metres: List[List[int]],
+                     slots: List[Tuple[int, int]]) -> Tuple[List[tuple], int]:
+        '''\
+        Return (frame, (pattern index, phases of short lines), beat) of each
+        repeat of slots and the end frame.
+        '''
+
+        starts = []
+        beats = 0
+        for index, repeats in slots:
+            length = max((len(line) for line in patterns[index]), default=0)
+            for _ in range(repeats):
+                phase = tuple(beats % line_length for line_length in metres[index]
+                              if line_length < length)
+                starts.append((round(beats * self._period * self.rate), (index, phase), beats))
+                beats += length
+        return starts, round(beats * self._period * self.rate)
+
+    def _render_loop(self, mapping: List[np.ndarray],
+                     sounds: List[Tuple[Hashable, np.ndarray]]) -> np.ndarray:
+        '''\
+        Mix a single loop of the mapping with the tail of sounds.
+        '''
+
+        sample_len = max((len(line) for line in mapping), default=0)
+        offsets = np.rint(np.arange(sample_len) * self._period * self.rate).astype(np.int64)
+        loop_len = round(sample_len * self._period * self.rate)
+        tail = max((len(frames) for _, frames in sounds), default=0)
+
+        steps = [[] for _ in range(sample_len)]
+        for line, sound in zip(mapping, sounds):
+            for step in np.flatnonzero(line):
+                steps[step].append(sound)
+
+        loop = np.zeros((loop_len + tail, self.channels), np.float32)
+        for start, step in zip(offsets, steps):
+            if step:
+                buffer = self.mixer.mix(step, self._volume)
+                loop[start:start + len(buffer)] += buffer
+        return loop
+
+    def bounce(self, path: str, mapping: Iterable[Iterable[int]],
+               sources: Iterable[str], loops: int = 1) -> None:
+        '''\
+        Render the mapping and write it to the wave file.
+        '''
+
+        write_wav(path, self.render(mapping, sources, loops), self.rate)
+
+    def loops_for(self, seconds: float, sample_len: int) -> int:
+        '''\
+        Return the number of loops that covers 'seconds' of the track.
+        '''
+
+        return max(int(np.ceil(seconds / (sample_len * self._period))), 1)
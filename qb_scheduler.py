@@ -0,0 +1,135 @@
+'''\
+qb_scheduler provides beat timing for the Player.
+'''
+
+
+from collections import deque
+from time import perf_counter
+from typing import Callable, Deque, List, Tuple
+
+from qb_telemetry import MISSED, BeatTelemetry
+
+
+class BeatScheduler():
+    '''\
+    Compute beat deadlines and queue the beats in advance.
+
+    Word about timing policy:
+    The deadline of the beat is 'start + n * period' where
+    'start' is a single anchor, so neither timer rounding nor the
+    lateness of one beat is accumulated. Changing the period moves
+    the anchor to the next deadline that is not queued yet.
+
+    Beats whose deadlines fit into the 'lookahead' window are queued
+    with their payload (what should be played), so firing the beat
+    costs only the playing itself. If several beats are due at once
+    (the event loop was stalled), only the latest is fired and others
+    are recorded as missed, read about records in qb_telemetry.
+    '''
+
+    def __init__(self, period: float, /, lookahead: float = 0.05,
+                 clock: Callable[[], float] = perf_counter, history: int = 1024) -> None:
+        '''\
+        'period' - duration of the beat in seconds
+        'lookahead' - how far beats are queued in advance (seconds)
+        'clock' - source of the time in seconds
+        'history' - how many records of beats are reminded
+        '''
+
+        self.lookahead = lookahead
+        self.telemetry = BeatTelemetry(history)
+
+        self._clock = clock
+        self._period = period
+        self._start = 0.0
+        self._next_index = 0
+        self._queue: Deque[Tuple[float, int, object]] = deque()
+
+    def start(self) -> None:
+        '''\
+        Anchor the first beat to the current time.
+        '''
+
+        self._queue.clear()
+        self._start = self._clock()
+        self._next_index = 0
+
+    def stop(self) -> int:
+        '''\
+        Drop all queued beats and return their number.
+        '''
+
+        dropped = len(self._queue)
+        self._queue.clear()
+        return dropped
+
+    def rewind(self) -> int:
+        '''\
+        Drop all queued beats, but keep their deadlines,
+        so they will be queued again with the new payload.
+        Return the number of dropped beats.
+        '''
+
+        if self._queue:
+            self._next_index = self._queue[0][1]
+        return self.stop()
+
+    def set_period(self, period: float) -> None:
+        '''\
+        Read a "Word about timing policy" in the class docs.
+        '''
+
+        shift = self._next_index
+        self._start = self._deadline(shift)
+        self._next_index = 0
+        self._queue = deque((deadline, index - shift, payload)
+                            for deadline, index, payload in self._queue)
+        self._period = period
+
+    def fill(self, fetch: Callable[[], object]) -> None:
+        '''\
+        Queue all beats that are due within the lookahead window,
+        'fetch' is called once per beat to make its payload.
+        '''
+
+        horizon = self._clock() + self.lookahead
+        deadline = self._deadline(self._next_index)
+        while deadline <= horizon:
+            self._queue.append((deadline, self._next_index, fetch()))
+            self._next_index += 1
+            deadline = self._deadline(self._next_index)
+
+    def pop_due(self) -> List[Tuple[float, object]]:
+        '''\
+        Return deadlines and payloads of beats that should be fired now,
+        the caller should record fired beats in the 'telemetry'.
+        '''
+
+        now = self._clock()
+        due = []
+        while self._queue and self._queue[0][0] <= now:
+            deadline, _, payload = self._queue.popleft()
+            if self._queue and self._queue[0][0] <= now:
+                self.telemetry.record(deadline, now, flags=MISSED)
+                continue
+            due.append((deadline, payload))
+        return due
+
+    def time_to_next(self) -> float:
+        '''\
+        Return the time to the next deadline (queued or not),
+        if it is in the past, 0 is returned and the beat is marked as clamped.
+        '''
+
+        if self._queue:
+            deadline = self._queue[0][0]
+        else:
+            deadline = self._deadline(self._next_index)
+        delay = deadline - self._clock()
+        if delay < 0:
+            self.telemetry.clamp()
+            return 0
+        return delay
+
+    def _deadline(self, index: int) -> float:
+        return self._start + index * self._period
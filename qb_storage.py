@@ -2,50 +2,185 @@
 qb_storage implement qb_abs_storage stuff.
 '''
 
-from os import path as ospath
-from typing import Iterable, TextIO, Optional, Tuple, List
+from typing import Callable, Hashable, Iterable, Iterator, List, Optional, Tuple
 
-from PyQt5.QtCore import QUrl
+from PyQt5.QtCore import QObject, QThread, QThreadPool, QUrl, pyqtSignal, pyqtSlot
 from PyQt5.QtMultimedia import QSoundEffect
 
-from qb_abs_storage import AbstractStorage, AbstractSound
+from qb_abs_storage import AbstractSound
+from qb_cache import LRUCache
+from qb_file_storage import FileStorage
+from qb_format import Project
 
 
 class Sound(AbstractSound):
     '''\
-    Implement AbstractSound using QSoundEffect
+    Implement AbstractSound using the pool of QSoundEffect voices.
+
+    Word about voices policy:
+    'sound_obj' is the first voice, it is loaded by the Storage. Other voices
+    are made by 'allocate' with the same source (Qt shares the decoded data
+    of the same source), so hits overlap instead of cutting each other off.
+    The hit is played by the next voice in turn ('round-robin') or by any free
+    voice, and if all voices are playing, by the voice that was started before
+    others ('oldest'). Voices are never made while playing.
     '''
 
+    POLICIES = ('round-robin', 'oldest')
+
     def __init__(self, sound_obj: QSoundEffect) -> None:
         '''\
-        Store 'sound_obejct'.
+        Store 'sound_obejct' as the first voice.
         '''
 
         self.sound_obj = sound_obj
+        self.voices: List[QSoundEffect] = [sound_obj]
+
+        self._policy = self.POLICIES[0]
+        self._next = 0
+        self._hits = 0
+        self._started: List[int] = [0]
+
+    def allocate(self, voices: int, policy: str) -> None:
+        '''\
+        Grow the pool up to 'voices' and set the policy,
+        read a "Word about voices policy" in the class docs.
+        '''
+
+        if policy not in self.POLICIES:
+            raise ValueError(f'Unknown voices policy ({policy})')
+        self._policy = policy
+        while len(self.voices) < voices:
+            voice = QSoundEffect()
+            voice.setSource(self.sound_obj.source())
+            voice.setVolume(self.sound_obj.volume())
+            self.voices.append(voice)
+        self._started = [0] * len(self.voices)
+
+    def move_to_thread(self, thread: QThread) -> None:
+        '''\
+        Move all voices to the thread that will play them.
+        '''
+
+        for voice in self.voices:
+            if voice.thread() is not thread:
+                voice.moveToThread(thread)
 
     def play(self) -> None:
-        self.sound_obj.play()
+        if self._policy == 'oldest':
+            index = self._free_or_oldest()
+        else:
+            index = self._next
+            self._next = (index + 1) % len(self.voices)
+        self._hits += 1
+        self._started[index] = self._hits
+        self.voices[index].play()
+
+    def _free_or_oldest(self) -> int:
+        oldest = 0
+        for index, voice in enumerate(self.voices):
+            if not voice.isPlaying():
+                return index
+            if self._started[index] < self._started[oldest]:
+                oldest = index
+        return oldest
 
     def stop(self) -> None:
-        self.sound_obj.stop()
+        for voice in self.voices:
+            voice.stop()
 
     def set_volume(self, volume: float) -> None:
-        self.sound_obj.setVolume(volume)
+        for voice in self.voices:
+            voice.setVolume(volume)
 
     def source(self) -> str:
         return self.sound_obj.source().path()
 
 
-class Storage(AbstractStorage):
+class SoundBatch():
+    '''\
+    Sounds that are loaded together, in the order of adding.
+    '''
+
+    def __init__(self) -> None:
+        self.sounds: List[Sound] = []
+        self.paths: List[str] = []
+        self.mappings: List[Iterable[int]] = []
+        self.keys: List[Hashable] = []
+        self.rows: List[int] = []
+        self.pending = 0
+        self.song: Optional[tuple] = None
+
+    def __len__(self) -> int:
+        return len(self.sounds)
+
+    def __iter__(self) -> Iterator[Tuple]:
+        return zip(self.sounds, self.paths, self.mappings, self.keys, self.rows)
+
+    def add(self, sound: Sound, sound_path: str,
+            mapping: Iterable[int], key: Hashable, row: int) -> None:
+        '''\
+        Add the sound, it may be shared with other rows,
+        'pending' is counted separately. 'row' is the index
+        of the sound in the given paths.
+        '''
+
+        self.sounds.append(sound)
+        self.paths.append(sound_path)
+        self.mappings.append(mapping)
+        self.keys.append(key)
+        self.rows.append(row)
+
+
+class ProjectSaver(QObject):
+    '''\
+    Run saves in the thread of the pool one by one (in the order),
+    results are reported in the thread where the saver is made.
+
+    The slot is decorated, so PyQt queues 'saved' to the thread
+    of the saver, not calls it in the thread of saving.
+    '''
+
+    saved = pyqtSignal(str)
+
+    def __init__(self, notify: Callable[[str], None]) -> None:
+        super().__init__()
+        self._notify = notify
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(1)
+        self.saved.connect(self._report)
+
+    def save(self, save: Callable[[], str]) -> None:
+        '''\
+        Call 'save' in the thread of saving, it returns the notification.
+        '''
+
+        self._pool.start(lambda: self.saved.emit(save()))
+
+    def wait(self) -> None:
+        '''\
+        Block until all saves are written.
+        '''
+
+        self._pool.waitForDone()
+
+    @pyqtSlot(str)
+    def _report(self, message: str) -> None:
+        self._notify(message)
+
+
+class Storage(FileStorage):
     '''\
-    Implement 'AbstractStorage' interface.
+    Implement 'AbstractStorage' interface using QSoundEffect,
+    projects and the cache are inherited by the FileStorage.
 
     Word about sound's adding policy:
     QSoundEffect load data asynchronously and don't raise the Exceptions.
     Therefore, there is such a complex way to add new sounds.
 
-    Player uses '_load_sound' method to make the sound, sets the source of it,
-    and call the '_store_in_queue' to sound.
+    Player uses 'load_sounds' method to make the batch of sounds: sounds are made,
+    added to the 'SoundBatch' and the '_store_in_queue' is called to each sound.
+    Only after that, sources of all sounds are set, so they are loaded concurrently.
 
     '_store_in_queue' stores the sound in the '_sounds_queue' to avoid deletion
     by the garbage collector, connects sound's status changing to the '_sound_is_loaded'
@@ -53,45 +188,93 @@ class Storage(AbstractStorage):
     and also stores that slot in '_sounds_slots' for disconnection in the future.
 
     '_sound_is_loaded' checks that this sound is truly loaded (maybe with an error),
-    calls the '_remove_out_queue' to sound, and if the sound is ready to play (correct),
-    calls '_apply_callbacks': sound will be added by the '_install_sound' callback,
-    drawn by the '_draw_sound' callback and '_update_view' display mapping.
+    calls the '_remove_out_queue' to sound, and when all sounds of the batch are loaded,
+    calls '_finish_batch': in the order of the batch, each ready sound is passed
+    to '_apply_callbacks' (it will be added by the '_install_sound' callback and
+    drawn by the '_draw_sound' callback), then the song of the batch (if any) is
+    installed by the '_install_song' callback, '_update_view' displays the mapping
+    and '_display_notification' reports the result once for the whole batch.
     (callbacks are inherited by the AbstractStorage)
 
-    '_store_in_queue' stores the sound in the '_sounds_queue' to avoid deletion
-    by the garbage collector, connects sound's status changing to the '_sound_is_loaded'
-    using lambda-slot, because there is no access to the 'sender' in this scope,
-    and also stores that slot in '_sounds_slots' for disconnection in the future.
-
     '_remove_out_queue' removes the sound out the '_sounds_queue',
     disconnects sound's status changing to the lambda-slot and removes it
     out the '_sounds_slots'.
+
+    Word about voices policy:
+    Each loaded sound gets the pool of voices when its batch is finished,
+    read about it in docs of the Sound. The size of the pool and the policy
+    are set by 'set_voices' for sounds that are loaded after it.
+
+    Loaded Sound is cached with its voices, its size is the size of the file,
+    read a "Word about caching policy" in docs of the FileStorage.
+
+    Projects are written by the ProjectSaver, so the slow disk never
+    blocks the ui and playing, read a "Word about saving policy"
+    in docs of the FileStorage. Pending saves are finished by 'close'.
     '''
 
-    def __init__(self) -> None:
-        super().__init__()
+    def __init__(self, cache_capacity: int = 64 * 2 ** 20) -> None:
+        super().__init__(LRUCache(cache_capacity))
         self._sounds_queue = {}
         self._sounds_slots = {}
-        self._mappings = {}
+        self._batches = {}
+        self._voices = 4
+        self._voices_policy = Sound.POLICIES[0]
+        #  The callback may be replaced after, so it is looked up at each call
+        self._saver = ProjectSaver(
+            lambda message: self._display_notification(message))  # pylint: disable=unnecessary-lambda
+
+    def set_voices(self, voices: int, policy: str = 'round-robin') -> None:
+        '''\
+        Read a "Word about voices policy" in the class docs.
+        '''
 
-    def load_sound(self, sound_path: str, mapping: Iterable[int]) -> None:
+        if policy not in Sound.POLICIES:
+            raise ValueError(f'Unknown voices policy ({policy})')
+        self._voices = max(voices, 1)
+        self._voices_policy = policy
+
+    def close(self) -> None:
         '''\
-        Read a "Word about sound's adding policy" in the class docs.
+        Wait for pending saves and stop journaling.
         '''
 
-        if sound_path == '':
-            return
-        self._load_sound(sound_path, mapping)
+        self._saver.wait()
+        self.close_journal()
+
+    def _write_project(self, pjpath: str, project: Project, embed: bool) -> None:
+        self._saver.save(lambda: self._save(pjpath, project, embed))
 
-    def _load_sound(self, sound_path: str, mapping: Iterable[int]) -> None:
+    def load_sounds(self, sound_paths: Iterable[str], mappings: Iterable[Iterable[int]],
+                    song: Optional[tuple] = None) -> None:
         '''\
         Read a "Word about sound's adding policy" in the class docs.
         '''
 
-        sound = QSoundEffect()
-        self._mappings[id(sound)] = mapping
-        self._store_in_queue(sound)
-        sound.setSource(QUrl.fromLocalFile(sound_path))
+        batch = SoundBatch()
+        batch.song = song
+        loading = {}
+        for row, (sound_path, mapping) in enumerate(zip(sound_paths, mappings)):
+            if sound_path == '':
+                continue
+            key = self._cache_key(sound_path)
+            if key in loading:
+                sound = loading[key][0]
+            else:
+                sound = self._cache.get(key)
+            if sound is None:
+                sound = Sound(QSoundEffect())
+                loading[key] = sound, sound_path
+                self._batches[id(sound.sound_obj)] = batch
+                self._store_in_queue(sound.sound_obj)
+                batch.pending += 1
+            batch.add(sound, sound_path, mapping, key, row)
+
+        if len(batch) and batch.pending == 0:
+            return self._finish_batch(batch)
+        for sound, sound_path in loading.values():
+            sound.sound_obj.setSource(QUrl.fromLocalFile(sound_path))
+        return None
 
     def _sound_is_loaded(self, sound: QSoundEffect) -> None:
         '''\
@@ -101,20 +284,38 @@ class Storage(AbstractStorage):
         if sound.status() < 2: #  Sound is not loaded
             return
         self._remove_out_queue(sound)
-        mapping = self._mappings.pop(id(sound))
-        if sound.status() == 2: #  Sound is corect
-            return self._apply_callbacks(sound, mapping)
-        self._display_notification(f'Error of loading the sound ({sound.source().path()})!')
+        batch = self._batches.pop(id(sound))
+        batch.pending -= 1
+        if batch.pending == 0:
+            self._finish_batch(batch)
 
-    def _apply_callbacks(self, sound: QSoundEffect, mapping: Iterable[int]) -> None:
+    def _finish_batch(self, batch: SoundBatch) -> None:
+        '''\
+        Read a "Word about sound's adding policy" in the class docs.
+        '''
+
+        failed = []
+        rows = []
+        for sound, sound_path, mapping, key, row in batch:
+            if sound.sound_obj.status() == 2: #  Sound is corect
+                if key not in self._cache:
+                    sound.allocate(self._voices, self._voices_policy)
+                self._cache.put(key, sound, key[2] if isinstance(key, tuple) else 0)
+                self._apply_callbacks(sound, mapping)
+                rows.append(row)
+            else:
+                failed.append(sound_path)
+        self._finish_song(batch.song, rows)
+        self._update_view()
+        self._report_batch(len(batch), failed)
+
+    def _apply_callbacks(self, sound: Sound, mapping: Iterable[int]) -> None:
         '''\
         Read about callbacks in docs of the AbstractStorage.
         '''
 
-        sound = Sound(sound)
         self._install_sound(sound, mapping)
         self._draw_sound(sound)
-        self._update_view()
 
     def _store_in_queue(self, sound: QSoundEffect) -> None:
         '''\
@@ -133,64 +334,3 @@ class Storage(AbstractStorage):
         del self._sounds_queue[id(sound)]
         sound.statusChanged.disconnect(self._sounds_slots[id(sound)])
         del self._sounds_slots[id(sound)]
-
-    def upload_project(self, pjpath: str) -> None:
-        '''\
-        Load project from the 'path'.
-        '''
-
-        paths, mapping = self._upload_data(pjpath)
-        if paths is None:
-            return
-        for sound_path, mapping_line in zip(paths, mapping):
-            self.load_sound(sound_path, mapping_line)
-
-    def _upload_data(self, pjpath: str) -> Tuple[Optional[Iterable]]:
-        '''\
-        Upload data that is loaded by unload and return it.
-        '''
-
-        try:
-            paths, mapping = self.__extract_file(pjpath)
-        except:
-            self._display_notification(f'Error of loading the project ({pjpath})!')
-            return None, None
-        return paths, mapping
-
-    def __extract_file(self, pjpath: str) -> Iterable[Iterable]:
-        file = open(pjpath, 'r', encoding='utf-8')
-        lines = file.readlines()
-        yield self.__extract_paths(lines)
-        yield self.__extract_mapping(lines)
-        file.close()
-
-    def __extract_paths(self, lines: List[str]) -> Iterable[str]:
-        for i in range(0, len(lines), 2):
-            yield lines[i].strip('\n')
-
-    def __extract_mapping(self, lines: List[str]) -> Iterable[Iterable[int]]:
-        for i in range(1, len(lines), 2):
-            line = lines[i].strip('\n')
-            yield bytes(int(char) for char in line)
-
-    def unload_project(self, pjpath: str, mapping: Iterable[Iterable[int]],
-                       sounds: List[AbstractSound]) -> None:
-        '''\
-        Save project to the 'path'.
-        '''
-
-        try:
-            file = open(pjpath, 'w', encoding='utf-8')
-            self.__write_data(file, mapping, sounds)
-            file.close()
-        except:
-            return self._display_notification(f'Error of saving the project ({pjpath})!')
-        return
-
-    def __write_data(self, file: TextIO, mapping: Iterable[Iterable[int]],
-                     sounds: List[AbstractSound]) -> None:
-        for sound, mapping_line in zip(sounds, mapping):
-            file.write(ospath.abspath(sound.source()))
-            file.write('\n')
-            file.write(''.join(map(str, mapping_line)))
-            file.write('\n')
@@ -0,0 +1,148 @@
+'''\
+qb_telemetry provides recording of the beat timing.
+'''
+
+
+import csv
+import json
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+
+MISSED = 1
+CLAMPED = 2
+
+RECORD = np.dtype([('scheduled', 'f8'), ('fired', 'f8'), ('duration', 'f8'), ('flags', 'u1')])
+
+
+class BeatTelemetry():
+    '''\
+    Store records of beats in the ring buffer of the fixed capacity,
+    the oldest records are overwritten.
+
+    The record is: the scheduled time (deadline), the actual time of firing,
+    how long the beat was played and flags:
+        <*> MISSED - the beat was skipped, because the next one was due too.
+        <*> CLAMPED - the timer of the beat was preset to 0, because the
+            deadline was in the past (the previous beat was late).
+    Times are in seconds. Counters of flags are not limited by the capacity.
+    '''
+
+    def __init__(self, capacity: int = 4096) -> None:
+        self.missed = 0
+        self.clamped = 0
+
+        self._data = np.zeros(capacity, RECORD)
+        self._next = 0
+        self._count = 0
+        self._pending_flags = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def record(self, scheduled: float, fired: float, duration: float = 0.0,
+               flags: int = 0) -> None:
+        '''\
+        Add the record of the beat.
+        '''
+
+        flags |= self._pending_flags
+        self._pending_flags = 0
+        if flags & MISSED:
+            self.missed += 1
+        self._data[self._next] = (scheduled, fired, duration, flags)
+        self._next = (self._next + 1) % len(self._data)
+        self._count = min(self._count + 1, len(self._data))
+
+    def clamp(self) -> None:
+        '''\
+        Mark the next record as CLAMPED.
+        '''
+
+        self.clamped += 1
+        self._pending_flags |= CLAMPED
+
+    def clear(self) -> None:
+        '''\
+        Forget all records and counters.
+        '''
+
+        self.missed = self.clamped = 0
+        self._next = self._count = self._pending_flags = 0
+
+    def records(self) -> np.ndarray:
+        '''\
+        Return a copy of records from the oldest to the latest.
+        '''
+
+        if self._count < len(self._data):
+            return self._data[:self._count].copy()
+        return np.roll(self._data, -self._next)
+
+    def lateness(self) -> np.ndarray:
+        '''\
+        Return how late beats were fired, missed beats are excluded.
+        '''
+
+        records = self.records()
+        records = records[records['flags'] & MISSED == 0]
+        return records['fired'] - records['scheduled']
+
+    def _field(self, field: str) -> np.ndarray:
+        if field == 'lateness':
+            return self.lateness()
+        return self.records()[field]
+
+    def percentiles(self, field: str = 'lateness',
+                    quantiles: Iterable[float] = (50, 90, 99, 99.9)) -> Dict[float, float]:
+        '''\
+        Return percentiles of the 'field' ('lateness', 'duration'),
+        they are NaN if there are no records.
+        '''
+
+        values = self._field(field)
+        quantiles = tuple(quantiles)
+        if len(values) == 0:
+            return {quantile: float('nan') for quantile in quantiles}
+        return dict(zip(quantiles, np.percentile(values, quantiles).tolist()))
+
+    def histogram(self, field: str = 'lateness',
+                  bins: Iterable[float] = (0, 1e-3, 2e-3, 5e-3, 1e-2, 2e-2, 5e-2, np.inf)
+                  ) -> Tuple[np.ndarray, np.ndarray]:
+        '''\
+        Return counts and edges of bins of the 'field'.
+        '''
+
+        return np.histogram(self._field(field), np.asarray(bins, np.float64))
+
+    def summary(self) -> Dict[str, object]:
+        '''\
+        Return counters and percentiles of lateness and duration.
+        '''
+
+        return {'beats': self._count, 'missed': self.missed, 'clamped': self.clamped,
+                'lateness': self.percentiles('lateness'),
+                'duration': self.percentiles('duration')}
+
+    def export(self, path: str, fmt: Optional[str] = None) -> None:
+        '''\
+        Write records to the file, 'fmt' is 'csv' or 'json',
+        it is taken from the extension of the 'path' by default.
+        JSON contains the summary too.
+        '''
+
+        fmt = fmt or path.rsplit('.', 1)[-1].lower()
+        records = self.records()
+        if fmt == 'csv':
+            with open(path, 'w', newline='', encoding='utf-8') as file:
+                writer = csv.writer(file)
+                writer.writerow(RECORD.names)
+                writer.writerows(records.tolist())
+        elif fmt == 'json':
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump({'summary': self.summary(),
+                           'fields': RECORD.names,
+                           'records': records.tolist()}, file)
+        else:
+            raise ValueError(f'Unsupported format of the telemetry ({fmt})')
@@ -3,16 +3,20 @@ qb_ui provide ui templates.
 '''
 
 
-from typing import Iterator
+from typing import Iterable, List, Optional, Tuple
 
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QIcon
+from PyQt5.QtCore import Qt, QPoint, QRect, QSize, pyqtSignal
+from PyQt5.QtGui import QColor, QIcon, QMouseEvent, QPainter, QPaintEvent
 from PyQt5.QtWidgets import (
-    QWidget, QGridLayout, QDialog,
+    QWidget, QHBoxLayout, QDialog, QSizePolicy,
     QPushButton, QLabel, QSpinBox, QSlider, QLineEdit, QComboBox
 )
 
 
+# Height of the row of the pattern in pixels
+ROW_HEIGHT = 24
+
+
 class ConfigWindow(QDialog):
     '''\
     Used to set time signature and number of tacts.
@@ -23,7 +27,7 @@ class ConfigWindow(QDialog):
         self.setModal(True)
         self.setWindowTitle('config')
         self.setWindowIcon(QIcon('icons/icon.png'))
-        self.setFixedSize(300, 60)
+        self.setFixedSize(300, 90)
 
         self._metre = QLabel(' Metre', self)
         self._metre.setGeometry(0, 0, 100, 30)
@@ -44,70 +48,274 @@ class ConfigWindow(QDialog):
         self.tacts.setGeometry(250, 5, 50, 20)
         self.tacts.setRange(2, 5)
 
+        self._mode = QLabel(' Pattern', self)
+        self._mode.setGeometry(0, 60, 100, 30)
+        self.mode = QComboBox(self)
+        self.mode.addItems(('clear', 'keep', 'quantize'))
+        self.mode.setGeometry(100, 65, 100, 20)
+
         self.ok_btn = QPushButton('OK', self)
         self.ok_btn.setGeometry(250, 31, 50, 28)
 
 
-class ColoredButton(QPushButton):
+class PatternGrid(QWidget):
     '''\
-    Implement color policy of the button.
+    Paint the whole mapping as a grid of cells.
+
+    Word about painting policy:
+    The grid is a single widget, cells are not widgets. The cell of
+    the click is found arithmetically. Pressing the cell switches it and
+    moving with the pressed button paints other cells to the same state,
+    each switched cell is reported by the 'cell_switched' signal.
+    A fast drag skips cells between two move events, so the steps
+    between the previous and the current cell of the row are painted too.
+    Only changed cells are repainted, the full painting fills the
+    background, tact accents and turned on cells, then draws the gaps,
+    so it doesn't depend on the number of turned off cells.
+    Cells after the length of the row (read a "Word about metre policy"
+    in docs of the qb_core.Sample) are dimmed and can't be switched.
     '''
 
-    def __init__(self, *args) -> None:
+    cell_switched = pyqtSignal(int, int)
+
+    _default = QColor('#aab4ab')
+    _clicked = QColor('#fe7c00')
+    _uniq_default = QColor('#ffb4ab')
+    _uniq_clicked = QColor('#fe7cff')
+    _unused = QColor('#dde2dd')
+
+    def __init__(self, *args, tact_l: int, tact_n: int) -> None:
         super().__init__(*args)
-        self.state = False
-        self.clicked.connect(self.change_color)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+        self.setMinimumWidth(200)
+
+        self._tact_l = tact_l
+        self._tact_n = tact_n
+        self._cells: List[bytearray] = []
+        self._lengths: List[int] = []
+        # State that is painted by the moving with pressed button
+        self._paint_state: Optional[int] = None
+        # Cell of the previous painting event
+        self._paint_cell: Optional[Tuple[int]] = None
+        self._update_height()
+
+    def sizeHint(self) -> QSize:  # pylint: disable=invalid-name
+        '''\
+        Qt method: preferred size of the grid.
+        '''
+
+        return QSize(self._steps() * 30, len(self._cells) * ROW_HEIGHT)
+
+    def add_row(self) -> None:
+        '''\
+        Add empty row to the end.
+        '''
+
+        self._cells.append(bytearray(self._steps()))
+        self._lengths.append(self._steps())
+        self._update_height()
+
+    def remove_row(self, row: int) -> None:
+        '''\
+        Remove the row, rows below are moved up.
+        '''
+
+        del self._cells[row]
+        del self._lengths[row]
+        self._update_height()
+        self.update()
+
+    def reshape(self, tact_l: int, tact_n: int) -> None:
+        '''\
+        Truncate or pad rows and move tact accents.
+        '''
+
+        old_steps = self._steps()
+        self._tact_l = tact_l
+        self._tact_n = tact_n
+        steps = self._steps()
+        for row, line in enumerate(self._cells):
+            self._cells[row] = line[:steps] + bytearray(max(steps - len(line), 0))
+        self._lengths = [steps if length == old_steps else min(length, steps)
+                         for length in self._lengths]
+        self.updateGeometry()
+        self.update()
+
+    def clear(self) -> None:
+        '''\
+        Turn off all cells.
+        '''
+
+        for row, line in enumerate(self._cells):
+            self._cells[row] = bytearray(len(line))
+        self.update()
+
+    def show_mapping(self, mapping: Iterable[Iterable[int]]) -> None:
+        '''\
+        Display the mapping, only changed cells are repainted.
+        '''
+
+        for row, (line, new_line) in enumerate(zip(self._cells, mapping)):
+            new_line = bytes(new_line)[:len(line)]
+            if line.startswith(new_line):
+                continue
+            for step, (flag, new_flag) in enumerate(zip(line, new_line)):
+                if bool(flag) != bool(new_flag):
+                    line[step] = bool(new_flag)
+                    self.update(self._cell_rect(row, step))
+
+    def get_steps(self) -> int:
+        '''\
+        Return the number of steps of rows.
+        '''
+
+        return self._steps()
+
+    def set_lengths(self, lengths: Iterable[int]) -> None:
+        '''\
+        Display lengths of rows, rows without the length are full.
+        '''
+
+        lengths = list(lengths)[:len(self._cells)]
+        lengths += [self._steps()] * (len(self._cells) - len(lengths))
+        if lengths != self._lengths:
+            self._lengths = lengths
+            self.update()
+
+    def set_cell(self, row: int, step: int, value: int) -> None:
+        '''\
+        Display the single cell, it is repainted only if it is changed.
+        '''
 
-        self._default = 'background-color: #aab4ab'
-        self._clicked = 'background-color: #fe7c00'
-        self._set_color()
+        if 0 <= row < len(self._cells) and 0 <= step < len(self._cells[row]):
+            if self._cells[row][step] != bool(value):
+                self._cells[row][step] = bool(value)
+                self.update(self._cell_rect(row, step))
 
-    def reset(self) -> None:
+    def mousePressEvent(self, event: QMouseEvent) -> None:  # pylint: disable=invalid-name
         '''\
-        Set to default color.
+        Qt method: switch the cell and start painting.
         '''
 
-        self.state = False
-        self._set_color()
+        cell = self._cell_at(event.pos())
+        if cell is None or event.button() != Qt.LeftButton:
+            return
+        row, step = cell
+        self._paint_state = not self._cells[row][step]
+        self._paint_cell = cell
+        self._switch(row, step)
 
-    def _set_color(self) -> None:
-        if self.state:
-            self.setStyleSheet(self._clicked)
-        else:
-            self.setStyleSheet(self._default)
+    def mouseMoveEvent(self, event: QMouseEvent) -> None:  # pylint: disable=invalid-name
+        '''\
+        Qt method: paint cells from the previous one to the cursor.
+        '''
 
-    def change_color(self) -> None:
+        cell = self._cell_at(event.pos())
+        if cell is None or self._paint_state is None:
+            return
+        row, step = cell
+        first = step
+        if self._paint_cell is not None and self._paint_cell[0] == row:
+            first = self._paint_cell[1]
+        for painted in range(min(first, step), max(first, step) + 1):
+            if self._cells[row][painted] != self._paint_state:
+                self._switch(row, painted)
+        self._paint_cell = cell
+
+    def mouseReleaseEvent(self, event: QMouseEvent) -> None:  # pylint: disable=invalid-name
         '''\
-        Switch button color, 'change_color' is used on click.
+        Qt method: stop painting.
         '''
 
-        self.state = not self.state
-        self._set_color()
+        self._paint_state = None
+        self._paint_cell = None
+        super().mouseReleaseEvent(event)
 
-    def set_uniq(self) -> None:
+    def paintEvent(self, event: QPaintEvent) -> None:  # pylint: disable=invalid-name
         '''\
-        On uncommon colors to make button different.
+        Qt method: paint the grid, read a "Word about painting policy".
         '''
 
-        self._default = 'background-color: #ffb4ab'
-        self._clicked = 'background-color: #fe7cff'
-        self._set_color()
+        painter = QPainter(self)
+        steps = self._steps()
+        height = len(self._cells) * ROW_HEIGHT
+        painter.fillRect(0, 0, self.width(), height, self._default)
+        for step in range(0, steps, self._tact_l):
+            painter.fillRect(self._column_x(step), 0, self._column_x(step + 1)
+                             - self._column_x(step), height, self._uniq_default)
+        for row, line in enumerate(self._cells):
+            for step, flag in enumerate(line):
+                if flag:
+                    color = self._uniq_clicked if step % self._tact_l == 0 else self._clicked
+                    painter.fillRect(self._cell_rect(row, step), color)
+            if self._lengths[row] < steps:
+                left = self._column_x(self._lengths[row])
+                painter.fillRect(left, row * ROW_HEIGHT, self._column_x(steps) - left,
+                                 ROW_HEIGHT, self._unused)
+
+        painter.setPen(self.palette().color(self.backgroundRole()))
+        for step in range(steps + 1):
+            painter.drawLine(self._column_x(step), 0, self._column_x(step), height)
+        for row in range(len(self._cells) + 1):
+            painter.drawLine(0, row * ROW_HEIGHT, self.width(), row * ROW_HEIGHT)
+        painter.end()
+        super().paintEvent(event)
+
+    def _switch(self, row: int, step: int) -> None:
+        self._cells[row][step] ^= 1
+        self.update(self._cell_rect(row, step))
+        self.cell_switched.emit(row, step)
+
+    def _steps(self) -> int:
+        return self._tact_l * self._tact_n
+
+    def _update_height(self) -> None:
+        self.setFixedHeight(len(self._cells) * ROW_HEIGHT + 1)
+
+    def _column_x(self, step: int) -> int:
+        return step * (self.width() - 1) // max(self._steps(), 1)
+
+    def _cell_rect(self, row: int, step: int) -> QRect:
+        left = self._column_x(step)
+        return QRect(left, row * ROW_HEIGHT, self._column_x(step + 1) - left, ROW_HEIGHT)
+
+    def _cell_at(self, pos: QPoint) -> Optional[Tuple[int]]:
+        row = pos.y() // ROW_HEIGHT
+        step = pos.x() * self._steps() // max(self.width() - 1, 1)
+        if 0 <= row < len(self._cells) and 0 <= step < self._lengths[row] and pos.x() >= 0:
+            return row, step
+        return None
 
 
 class SoundHeader(QWidget):
     '''\
-    Store sound title and remove button.
+    Store sound title, length of the row and remove button.
+
+    'row' is the index of the row of the header, it is kept
+    actual by the PatternView, so the click on the remove
+    button (and the change of the length) is reported with
+    the row without any search.
     '''
 
-    def __init__(self, *args) -> None:
+    remove_clicked = pyqtSignal(int)
+    length_changed = pyqtSignal(int, int)
+
+    def __init__(self, *args, row: int = 0) -> None:
         super().__init__(*args)
+        self.row = row
+        self.setFixedSize(200, ROW_HEIGHT)
         self.label = QLineEdit(self)
         self.label.setGeometry(0, 0, 100, 20)
+        self.length = QSpinBox(self)
+        self.length.setGeometry(100, 0, 45, 20)
+        self.length.setToolTip('Length of the row in steps')
         self.btn = QPushButton(self)
         self.btn.setText('remove')
-        self.btn.setGeometry(100, 0, 100, 20)
+        self.btn.setGeometry(145, 0, 55, 20)
 
         self.delbtn = self.btn
+        self.delbtn.clicked.connect(lambda: self.remove_clicked.emit(self.row))
+        self.length.valueChanged.connect(lambda length: self.length_changed.emit(self.row, length))
 
     def set_title(self, title: str) -> None:
         '''\
@@ -116,60 +324,92 @@ class SoundHeader(QWidget):
 
         self.label.setText(title)
 
+    def set_row(self, row: int) -> None:
+        '''\
+        Move the header to the row.
+        '''
+
+        self.row = row
+        self.move(0, row * ROW_HEIGHT)
+
+    def set_length(self, length: int, steps: int) -> None:
+        '''\
+        Display the length of the row (up to 'steps'), it isn't reported back.
+        '''
+
+        self.length.blockSignals(True)
+        self.length.setRange(1, max(steps, 1))
+        self.length.setValue(length)
+        self.length.blockSignals(False)
 
-class SoundLine(QWidget):
+
+class PatternView(QWidget):
     '''\
-    Use layout to display beat buttons.
+    Display headers of sounds at the left of the grid.
+
+    'headers' maps the row to the header and the 'row' of the header
+    maps it back, so both cells of the grid and rows are resolved in
+    constant time. Click on the remove button of the header is
+    reported by the 'row_removing' signal with the row, the change
+    of the length is reported by the 'length_changing' signal.
     '''
 
+    row_removing = pyqtSignal(int)
+    length_changing = pyqtSignal(int, int)
+
     def __init__(self, *args, tact_l: int, tact_n: int) -> None:
         super().__init__(*args)
-        self.layout = QGridLayout(self)
-
-        self.header = SoundHeader()
-        self.delbtn = self.header.delbtn
-        self.layout.addWidget(self.header, 0, 0)
-        self.layout.setColumnMinimumWidth(0, 200)
-
-        self.btns = []
-        for i in range(tact_l * tact_n):
-            btn = ColoredButton()
-            if not i % tact_l:
-                btn.set_uniq()
-            self.btns.append(btn)
-            self.layout.addWidget(btn, 0, i + 1)
-            self.layout.setColumnStretch(i + 1, 1)
-
-    def __iter__(self) -> Iterator:
-        return iter(self.btns)
+        self.layout = QHBoxLayout(self)
+        self.layout.setContentsMargins(0, 0, 0, 0)
+        self.layout.setSpacing(0)
 
-    def clear(self) -> None:
-        '''\
-        'Off' all buttons.
-        '''
+        self._headers_box = QWidget()
+        self._headers_box.setFixedSize(200, 0)
+        self.layout.addWidget(self._headers_box, 0, Qt.AlignTop)
+        self.grid = PatternGrid(tact_l=tact_l, tact_n=tact_n)
+        self.layout.addWidget(self.grid, 1, Qt.AlignTop)
 
-        for btn in self.btns:
-            btn.reset()
+        self.headers: List[SoundHeader] = []
 
-    def set_title(self, title: str) -> None:
+    def add_row(self, title: str) -> SoundHeader:
         '''\
-        Facade of SoundHeader.
+        Add header and grid row for the new sound.
         '''
-        self.header.set_title(title)
 
-    def getbtn(self, i: int) -> ColoredButton:
+        header = SoundHeader(self._headers_box, row=len(self.headers))
+        header.set_title(title)
+        header.set_row(header.row)
+        header.remove_clicked.connect(self.row_removing)
+        header.length_changed.connect(self.length_changing)
+        header.show()
+        self.headers.append(header)
+        self._headers_box.setFixedHeight(len(self.headers) * ROW_HEIGHT)
+        self.grid.add_row()
+        header.set_length(self.grid.get_steps(), self.grid.get_steps())
+        return header
+
+    def remove_row(self, row: int) -> None:
         '''\
-        'getbtn' is used to bind click.
+        Remove header and grid row, rows below are moved up.
         '''
 
-        return self.btns[i]
+        header = self.headers.pop(row)
+        header.hide()
+        header.deleteLater()
+        for i in range(row, len(self.headers)):
+            self.headers[i].set_row(i)
+        self._headers_box.setFixedHeight(len(self.headers) * ROW_HEIGHT)
+        self.grid.remove_row(row)
 
-    def findbtn(self, btn: QPushButton) -> int:
+    def set_lengths(self, lengths: Iterable[int], steps: int) -> None:
         '''\
-        'getbtn' is used to bind click.
+        Display lengths of rows in headers and the grid.
         '''
 
-        return self.layout.indexOf(btn)
+        lengths = tuple(lengths)
+        for header, length in zip(self.headers, lengths):
+            header.set_length(length, steps)
+        self.grid.set_lengths(lengths)
 
 
 class OptionsLine(QWidget):
@@ -4,14 +4,16 @@
 
 
 import sys
-from typing import Tuple
+from os import path as ospath
+from typing import NamedTuple, Tuple
 
-from PyQt5.QtGui import QIcon
+from PyQt5.QtGui import QCloseEvent, QIcon
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout
 )
 
 from qb_abs_storage import AbstractSound
+from qb_core import CellToggled, Resized
 import qb_player as qb
 import qb_ui as ui
 
@@ -36,79 +38,32 @@ class DrumMachineWindowComposer(QWidget):
         self.options = ui.OptionsLine()
         self.layout.addWidget(self.options)
 
-        # Sound line id: sound line
-        self._sound_lines_book = {}
-        # Button id: sound line id
-        self._del_btns_book = {}
-
-        # Button id: sound line id
-        self._sound_btns_book = {}
-        # Sound line id: set(sound button id)
-        self._sound_btns_by_lines_book = {}
+        self.pattern = ui.PatternView(tact_l=4, tact_n=3)
+        self.layout.addWidget(self.pattern)
+        self.layout.addStretch(1)
+        self.pattern.grid.cell_switched.connect(self._cell_switched_slot)
+        self.pattern.row_removing.connect(self._del_sound_line_slot)
+        self.pattern.length_changing.connect(self._length_changed_slot)
 
     def _clear(self) -> None:
-        for sound_line_id in frozenset(self._sound_lines_book):
-            self._del_sound_line(sound_line_id)
-
-    def _hide_sound_lines(self) -> None:
-        for sound_line in self._sound_lines_book.values():
-            sound_line.hide()
-
-    def _add_sound_line(self, title: str, tact_l: int, tact_n: int) -> None:
-        sound_line = ui.SoundLine(tact_l=tact_l, tact_n=tact_n)
-        sound_line.set_title(title)
-        self.layout.addWidget(sound_line, 1)
-        sound_line_id = id(sound_line)
-        self._sound_lines_book[sound_line_id] = sound_line
-        self._book_sound_line_btns(sound_line_id)
-
-        self.layout.addWidget(sound_line, 1)
-        self._del_btns_book[id(sound_line.delbtn)] = sound_line_id
-        sound_line.delbtn.clicked.connect(self._del_sound_line_slot)
-
-    def _book_sound_line_btns(self, sound_line_id: int) -> None:
-        sound_line = self._sound_lines_book[sound_line_id]
-        self._sound_btns_by_lines_book[sound_line_id] = set()
-        for btn in sound_line:
-            btn.clicked.connect(self._sound_btn_clicked_slot)
-            btn_id = id(btn)
-            self._sound_btns_book[btn_id] = sound_line_id
-            self._sound_btns_by_lines_book[sound_line_id].add(btn_id)
-
-
-    def _del_sound_line_slot(self) -> int:
-        delbtn = self.sender()
-        sound_line_id = self._del_btns_book[id(delbtn)]
-        sound_line = self._sound_lines_book[sound_line_id]
-        index_of_sound_line = self.layout.indexOf(sound_line)
-
-        self._del_sound_line(sound_line_id)
-        return index_of_sound_line - 1
-
-    def _del_sound_line(self, sound_line_id: int) -> None:
-        sound_line = self._sound_lines_book[sound_line_id]
-        self.layout.removeWidget(sound_line)
-        sound_line.hide()
-        self._unbook_sound_line(sound_line_id)
-
-    def _unbook_sound_line(self, sound_line_id: int) -> None:
-        for btn_id in self._sound_btns_by_lines_book[sound_line_id]:
-            del self._sound_btns_book[btn_id]
-        del self._sound_btns_by_lines_book[sound_line_id]
-        delbtn = self._sound_lines_book[sound_line_id].delbtn
-        delbtn_id = id(delbtn)
-        del self._del_btns_book[delbtn_id]
-        del self._sound_lines_book[sound_line_id]
-
-    def _sound_btn_clicked_slot(self) -> Tuple[int]:
-        btn = self.sender()
-        btn_id = id(btn)
-        sound_line_id = self._sound_btns_book[btn_id]
-        sound_line = self._sound_lines_book[sound_line_id]
-
-        sound_line_index = self.layout.indexOf(sound_line)
-        sound_btn_index = sound_line.findbtn(btn)
-        return sound_line_index - 1, sound_btn_index - 1
+        for sound_line_index in reversed(range(len(self.pattern.headers))):
+            self.pattern.remove_row(sound_line_index)
+
+    def _add_sound_line(self, title: str) -> None:
+        self.pattern.add_row(title)
+
+    def _reshape_sound_lines(self, tact_l: int, tact_n: int) -> None:
+        self.pattern.grid.reshape(tact_l, tact_n)
+
+    def _del_sound_line_slot(self, sound_line_index: int) -> int:
+        self.pattern.remove_row(sound_line_index)
+        return sound_line_index
+
+    def _cell_switched_slot(self, sound_line_index: int, beat_index: int) -> Tuple[int]:
+        return sound_line_index, beat_index
+
+    def _length_changed_slot(self, sound_line_index: int, length: int) -> Tuple[int]:
+        return sound_line_index, length
 
 
 class DrumMachine(DrumMachineWindowComposer):
@@ -119,6 +74,7 @@ class DrumMachine(DrumMachineWindowComposer):
     def __init__(self):
         super().__init__()
         self.player = qb.Player()
+        self._reshape_sound_lines(self.player.get_tact_l(), self.player.get_tact_n())
         self._load_basic_sounds()
         self._set_volume()
         self._set_bpm()
@@ -126,6 +82,7 @@ class DrumMachine(DrumMachineWindowComposer):
         self.options.add_sound.clicked.connect(self._add_sound_clicked)
         self.player.set_draw_sound_callback(self._display_new_sound)
         self.player.set_redraw_mapping_callback(self._redraw_mapping)
+        self.player.subscribe(self._mapping_changed)
         self.player.set_notification_callback(self.options.notification_line.setText)
 
         self.options.play_btn.clicked.connect(self._play_clicked)
@@ -139,21 +96,55 @@ class DrumMachine(DrumMachineWindowComposer):
         self.options.pjload.clicked.connect(self._pjload_clicked)
         self.options.pjstore.clicked.connect(self._pjstore_clicked)
 
+    def closeEvent(self, event: QCloseEvent) -> None:  # pylint: disable=invalid-name
+        '''\
+        Stop the audio thread of the player.
+        '''
+
+        self.player.close()
+        super().closeEvent(event)
+
     def _redraw_mapping(self) -> None:
-        for mapping_line, sound_line in zip(self.player.view(),
-                                            self._sound_lines_book.values()):
-            for flag, btn in zip(mapping_line, sound_line):
-                btn.reset()
-                if flag:
-                    btn.change_color()
+        self.options.bpm_value.setValue(self.player.bpm)
+        self.pattern.grid.show_mapping(self.player.view())
+        self.pattern.set_lengths(self.player.get_lengths(),
+                                 self.player.get_tact_l() * self.player.get_tact_n())
+
+    def _mapping_changed(self, changes: Tuple[Tuple[int, NamedTuple]]) -> None:
+        active = self.player.get_pattern()
+        events = [event for index, event in changes if index == active]
+        if any(isinstance(event, Resized) for event in events):
+            # The loaded project may have its own size
+            self._reshape_sound_lines(self.player.get_tact_l(), self.player.get_tact_n())
+        if not all(isinstance(event, CellToggled) for event in events):
+            self._redraw_mapping()
+            return
+        for event in events:
+            self.pattern.grid.set_cell(event.row, event.step, event.value)
 
     def _pjload_clicked(self) -> None:
         pjpath = self.options.pjload_path.text()
-        self.player.load_pj(pjpath)
+        if not ospath.exists(pjpath):
+            self.options.notification_line.setText(f'There is no project ({pjpath})!')
+            return
+        self._close_project()
+        # Changes of the interrupted session are recovered from the journal
+        self.player.recover_pj(pjpath)
+        self.player.autosave(pjpath)
+
+    def _close_project(self) -> None:
+        # The loaded project replaces the current one, its journal has all rows
+        self.player.autosave(None)
+        for sound_line_index in reversed(range(len(self.pattern.headers))):
+            self._del_sound_line_slot(sound_line_index)
+        for pattern_index in reversed(range(1, self.player.get_patterns_n())):
+            self.player.remove_pattern(pattern_index)
+        self.player.set_song(())
 
     def _pjstore_clicked(self) -> None:
         pjpath = self.options.pjstore_path.text()
         self.player.store_pj(pjpath)
+        self.player.autosave(pjpath)
 
     def _make_config_window(self) -> None:
         self.cf_window = ui.ConfigWindow()
@@ -164,28 +155,15 @@ class DrumMachine(DrumMachineWindowComposer):
     def _reconfig(self) -> None:
         time_sign = (self.cf_window.metre.value(), int(self.cf_window.length.currentText()))
         tact_n = self.cf_window.tacts.value()
-        self.player.resize(time_sign, tact_n)
-        self._redraw_lines()
+        mode = self.cf_window.mode.currentText()
+        self.player.resize(time_sign, tact_n, mode)
+        self._reshape_sound_lines(self.player.get_tact_l(), self.player.get_tact_n())
+        self._redraw_mapping()
         self.cf_window.hide()
         del self.cf_window
 
-    def _clear_field(self) -> None:
-        titles = list('' for _ in range(len(self._sound_lines_book)))
-        for line_index in range(len(self._sound_lines_book)):
-            sound_line = self.layout.itemAt(1).widget()
-            line_id = id(sound_line)
-            titles[line_index] = sound_line.header.label.text()
-            self._del_sound_line(line_id)
-        return titles
-
-    def _redraw_lines(self) -> None:
-        titles = self._clear_field()
-        for title in titles:
-            self._add_sound_line(title, self.player.get_tact_l(), self.player.get_tact_n())
-
     def _clear(self) -> None:
-        for sound_line in self._sound_lines_book.values():
-            sound_line.clear()
+        self.pattern.grid.clear()
         self.player.clear()
 
     def _set_bpm(self) -> None:
@@ -209,15 +187,16 @@ class DrumMachine(DrumMachineWindowComposer):
         self.player.add_sound(sound_path)
 
     def _display_new_sound(self, sound: AbstractSound) -> None:
-        self._add_sound_line(sound.source(), self.player.get_tact_l(), self.player.get_tact_n())
+        self._add_sound_line(sound.source())
+
+    def _del_sound_line_slot(self, sound_line_index: int) -> None:
+        self.player.rem_sound(super()._del_sound_line_slot(sound_line_index))
 
-    def _del_sound_line_slot(self) -> None:
-        sound_line_index = super()._del_sound_line_slot()
-        self.player.rem_sound(sound_line_index)
+    def _cell_switched_slot(self, sound_line_index: int, beat_index: int) -> None:
+        self.player.switch(*super()._cell_switched_slot(sound_line_index, beat_index))
 
-    def _sound_btn_clicked_slot(self) -> None:
-        sound_line_index, sound_btn_index = super()._sound_btn_clicked_slot()
-        self.player.switch(sound_line_index, sound_btn_index)
+    def _length_changed_slot(self, sound_line_index: int, length: int) -> None:
+        self.player.set_length(*super()._length_changed_slot(sound_line_index, length))
 
     def _load_basic_sounds(self) -> None:
         self.player.load_pj('basic.qbp')
@@ -0,0 +1,391 @@
+'''\
+Tests of the core without ui: the playing cycle by the simulated
+clock, project files of all versions, the autosave journal and bulk
+operations on the mapping and the telemetry of beats.
+
+Run them by pytest:
+    python -m pytest -q
+'''
+
+
+from os import path as ospath
+
+import numpy as np
+import pytest
+
+import qb_edit
+from qb_core import Sample
+from qb_format import (COUNTS, HEADER, LENGTH, MAGIC, SLOT, SONG, Project,
+                       read_project, write_project)
+from qb_headless import HeadlessPlayer, RecordingSink
+from qb_journal import journal_path, read_journal
+from qb_mapping import ArrayMapping, BytesMapping
+from qb_telemetry import CLAMPED, MISSED, BeatTelemetry
+from qb_render import write_wav
+
+
+def make_wave(path: str) -> str:
+    '''\
+    Write the short silent wave file and return its path.
+    '''
+
+    write_wav(path, np.zeros((100, 1)), 44100)
+    return path
+
+
+def make_player(tmp_path, sink=None) -> HeadlessPlayer:
+    '''\
+    Return the player of one tact 4/4 at 120 bpm (the beat is 0.5 s)
+    with sounds 'kick' and 'hat'.
+    '''
+
+    player = HeadlessPlayer(time_sign=(4, 4), bpm=120, tact_n=1, sink=sink)
+    player.set_notification_callback(lambda message: None)
+    player.set_draw_sound_callback(lambda sound: None)
+    for name in ('kick', 'hat'):
+        player.add_sound(make_wave(str(tmp_path / f'{name}.wav')))
+    return player
+
+
+def make_sample(mapping_type: type) -> Sample:
+    '''\
+    Return the sample of two tacts 4/4 with 'kick' and 'hat',
+    the 'hat' is of 6 steps.
+    '''
+
+    sample = Sample([], tact_l=4, tact_n=2, mapping_type=mapping_type)
+    sample.append('kick', [1, 0, 1, 0, 0, 1, 0, 1])
+    sample.append('hat', [1, 0, 0, 1, 0, 1, 0, 0])
+    sample.set_length(1, 6)
+    return sample
+
+
+def cells(sample: Sample) -> list:
+    '''\
+    Return the mapping as lists, the index of beats is checked too.
+    '''
+
+    mapping = [[int(cell) for cell in line] for line in sample.view()]
+    assert list(sample.masks()) == [sum(line[step] << row for row, line in enumerate(mapping))
+                                    for step in range(sample.tact_l * sample.tact_n)]
+    return mapping
+
+
+def pack_legacy(version: int, paths: list, mapping: np.ndarray, song: bytes = b'') -> bytes:
+    '''\
+    Return the binary project of the old version (2 or 3), the song
+    section is written only since the version 3.
+    '''
+
+    table = b''.join(LENGTH.pack(len(path)) + path.encode('utf-8') for path in paths)
+    packed = np.packbits(mapping, axis=1).tobytes()
+    paths_offset = HEADER.size + (SONG.size if version >= 3 else 0)
+    mapping_offset = paths_offset + len(table)
+    song_offset = mapping_offset + len(packed) if song else 0
+    header = HEADER.pack(MAGIC, version, 0, *mapping.shape, 4, 2, 100, 4, paths_offset,
+                         mapping_offset, mapping_offset + len(packed) + len(song))
+    return header + (SONG.pack(song_offset) if version >= 3 else b'') + table + packed + song
+
+
+def test_beats_are_played_in_time(tmp_path):
+    '''\
+    Sounds are played at their beats, the short row goes against the pattern.
+    '''
+
+    sink = RecordingSink()
+    player = make_player(tmp_path, sink)
+    kick, hat = (str(tmp_path / f'{name}.wav') for name in ('kick', 'hat'))
+    player.switch(0, 0)
+    player.switch(0, 2)
+    player.switch(1, 1)
+    player.set_length(1, 3)
+    player.set_volume(1)
+
+    player.turn_on()
+    player.run(4.0)
+    player.turn_off()
+
+    assert sink.times(kick) == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert sink.times(hat) == [0.5, 2.0, 3.5]
+    assert max(player.get_lateness()) == 0.0
+
+
+def test_stopped_player_is_silent(tmp_path):
+    '''\
+    Nothing is played after 'turn_off', 'goto_start' plays from the start.
+    '''
+
+    sink = RecordingSink()
+    player = make_player(tmp_path, sink)
+    player.switch(0, 1)
+    player.turn_on()
+    player.run(1.0)
+    player.turn_off()
+    player.run(10.0)
+    assert sink.times() == [0.5]
+
+    player.goto_start()
+    player.turn_on()
+    player.run(2.0)
+    assert sink.times() == [0.5, 11.5]
+
+
+def test_project_round_trip(tmp_path):
+    '''\
+    The project is read back as it was written.
+    '''
+
+    mapping = np.array([[1, 0, 0, 1, 0, 1], [0, 1, 0, 0, 0, 0]], np.uint8)
+    pattern = np.array([[0, 0, 1, 0, 0, 0], [1, 0, 0, 0, 0, 0]], np.uint8)
+    project = Project(['kick.wav', 'hat.wav'], mapping, (3, 8), 2, 140, (b'RIFF', None),
+                      (pattern,), ((0, 2), (1, 1)), ((6, 5), (4, 6)))
+    pjpath = str(tmp_path / 'project.qbp')
+    write_project(pjpath, project)
+
+    loaded = read_project(pjpath)
+    assert loaded.paths == project.paths
+    assert (loaded.mapping == mapping).all()
+    assert (loaded.time_sign, loaded.tact_n, loaded.bpm) == ((3, 8), 2, 140)
+    assert loaded.blobs == (b'RIFF', None)
+    assert len(loaded.patterns) == 1 and (loaded.patterns[0] == pattern).all()
+    assert loaded.song == ((0, 2), (1, 1))
+    assert loaded.lengths == ((6, 5), (4, 6))
+    assert not ospath.exists(pjpath + '.part')
+
+
+def test_old_versions_are_read(tmp_path):
+    '''\
+    Text projects and binary projects of versions 2 and 3 are read.
+    '''
+
+    mapping = np.array([[1, 0, 1, 0, 0, 0, 0, 0], [0, 0, 0, 1, 0, 0, 0, 1]], np.uint8)
+    text = tmp_path / 'text.qbp'
+    text.write_text('kick.wav\n10100000\nhat.wav\n00010001\n')
+    legacy = read_project(str(text))
+    assert legacy.paths == ['kick.wav', 'hat.wav'] and (legacy.mapping == mapping).all()
+    assert (legacy.bpm, legacy.patterns, legacy.lengths) == (0, (), ())
+
+    version_2 = tmp_path / 'v2.qbp'
+    version_2.write_bytes(pack_legacy(2, ['kick.wav', 'hat.wav'], mapping))
+    legacy = read_project(str(version_2))
+    assert legacy.paths == ['kick.wav', 'hat.wav'] and (legacy.mapping == mapping).all()
+    assert (legacy.time_sign, legacy.tact_n, legacy.bpm) == ((4, 4), 2, 100)
+    assert (legacy.song, legacy.lengths) == ((), ())
+
+    pattern = mapping[::-1]
+    song = (COUNTS.pack(1, 2) + np.packbits(pattern, axis=1).tobytes()
+            + SLOT.pack(0, 1) + SLOT.pack(1, 3))
+    version_3 = tmp_path / 'v3.qbp'
+    version_3.write_bytes(pack_legacy(3, ['kick.wav', 'hat.wav'], mapping, song))
+    legacy = read_project(str(version_3))
+    assert (legacy.mapping == mapping).all() and (legacy.patterns[0] == pattern).all()
+    assert (legacy.song, legacy.lengths) == (((0, 1), (1, 3)), ())
+
+
+def test_journal_is_replayed(tmp_path):
+    '''\
+    Changes after the last save are recovered from the journal,
+    the record that is written partly is dropped.
+    '''
+
+    pjpath = str(tmp_path / 'project.qbp')
+    player = make_player(tmp_path)
+    player.switch(0, 0)
+    player.store_pj(pjpath)
+    player.autosave(pjpath)
+    # The song and lengths are journaled by snapshots, cells by records
+    player.set_song([(0, 1), (player.add_pattern(), 2)])
+    player.set_length(1, 3)
+    player.switch(0, 2)
+    player.switch(1, 1)
+    player.autosave(None)
+    expected = [bytes(line) for line in player.view()]
+
+    with open(journal_path(pjpath), 'ab') as journal:
+        journal.write(b'\x01\x00')
+    snapshot, records = read_journal(journal_path(pjpath))
+    assert snapshot is not None and len(records) == 2
+
+    recovered = make_player(tmp_path)
+    recovered.clear()
+    recovered.recover_pj(pjpath)
+    lines = [bytes(line) for line in recovered.view()][2:]
+    assert lines == expected
+    assert recovered.get_lengths()[2:] == (4, 3)
+    assert recovered.get_patterns_n() == 2
+    assert recovered.get_song() == ((0, 1), (1, 2))
+
+
+@pytest.mark.parametrize('mapping_type', (BytesMapping, ArrayMapping))
+def test_edit_operations(mapping_type):
+    '''\
+    Operations edit rows within their lengths on both storages of the mapping.
+    '''
+
+    sample = make_sample(mapping_type)
+
+    def edit(operation, *args, **kwargs):
+        sample.assign(operation(sample.array(), *args, lengths=sample.lengths(), **kwargs))
+        return cells(sample)
+
+    assert edit(qb_edit.rotate, 1) == [[1, 1, 0, 1, 0, 0, 1, 0], [1, 1, 0, 0, 1, 0, 0, 0]]
+    assert edit(qb_edit.rotate, -1) == [[1, 0, 1, 0, 0, 1, 0, 1], [1, 0, 0, 1, 0, 1, 0, 0]]
+    assert edit(qb_edit.invert, rows=[1]) == [[1, 0, 1, 0, 0, 1, 0, 1],
+                                              [0, 1, 1, 0, 1, 0, 0, 0]]
+    assert edit(qb_edit.euclidean, 3) == [[1, 0, 0, 1, 0, 0, 1, 0], [1, 0, 1, 0, 1, 0, 0, 0]]
+    assert edit(qb_edit.euclidean, 1, 4, 1, rows=[0]) == [[0, 1, 0, 0, 0, 1, 0, 0],
+                                                          [1, 0, 1, 0, 1, 0, 0, 0]]
+    assert edit(qb_edit.fill_every, 3, 2) == [[0, 1, 1, 0, 0, 1, 0, 0], [1, 0, 1, 0, 1, 1, 0, 0]]
+    assert edit(qb_edit.copy_tact, 4, 0) == [[0, 1, 1, 0, 0, 1, 1, 0], [1, 0, 1, 0, 1, 0, 0, 0]]
+    assert edit(qb_edit.random_fill, 1.0, rows=[1]) == [[0, 1, 1, 0, 0, 1, 1, 0],
+                                                        [1, 1, 1, 1, 1, 1, 0, 0]]
+    assert (qb_edit.random_fill(sample.array(), 0.5, 7)
+            == qb_edit.random_fill(sample.array(), 0.5, 7)).all()
+    assert qb_edit.euclid(3, 8).tolist() == [1, 0, 0, 1, 0, 0, 1, 0]
+
+
+@pytest.mark.parametrize('operation, args, kwargs', (
+    (qb_edit.fill_every, (0,), {}),
+    (qb_edit.copy_tact, (3, 0), {}),
+    (qb_edit.copy_tact, (0, 0), {}),
+    (qb_edit.copy_tact, (4, 2), {}),
+    (qb_edit.copy_tact, (4, 0, [-1]), {}),
+    (qb_edit.euclidean, (3, -1), {}),
+    (qb_edit.rotate, (1,), {'rows': [2]}),
+    (qb_edit.invert, (), {'rows': [-1]}),
+))
+def test_edit_rejects_wrong_arguments(operation, args, kwargs):
+    '''\
+    Wrong arguments raise ValueError, the mapping isn't changed.
+    '''
+
+    mapping = make_sample(ArrayMapping).array()
+    before = mapping.copy()
+    with pytest.raises(ValueError):
+        operation(mapping, *args, **kwargs)
+    assert (mapping == before).all()
+
+
+@pytest.mark.parametrize('tact_l, tact_n, mapping, lengths', (
+    (4, 3, [[0] * 12, [0] * 12], (12, 6)),
+    (3, 1, [[0] * 3, [0] * 3], (3, 3)),
+))
+def test_resize_clears(tact_l, tact_n, mapping, lengths):
+    '''\
+    'clear' empties the mapping, full rows keep the full length.
+    '''
+
+    sample = make_sample(ArrayMapping)
+    sample.resize(tact_l, tact_n, 'clear')
+    assert cells(sample) == mapping
+    assert sample.lengths() == lengths
+
+
+@pytest.mark.parametrize('tact_l, tact_n, mapping, lengths', (
+    # More tacts: new tacts are empty
+    (4, 3, [[1, 0, 1, 0, 0, 1, 0, 1, 0, 0, 0, 0],
+            [1, 0, 0, 1, 0, 1, 0, 0, 0, 0, 0, 0]], (12, 6)),
+    # Longer tacts: beats are padded
+    (5, 2, [[1, 0, 1, 0, 0, 0, 1, 0, 1, 0],
+            [1, 0, 0, 1, 0, 0, 0, 0, 0, 0]], (10, 6)),
+    # Shorter tacts: beats are truncated, the short row becomes full
+    (3, 2, [[1, 0, 1, 0, 1, 0],
+            [1, 0, 0, 0, 1, 0]], (6, 6)),
+    # Less tacts: the short row is truncated
+    (4, 1, [[1, 0, 1, 0],
+            [1, 0, 0, 1]], (4, 4)),
+))
+def test_resize_keeps(tact_l, tact_n, mapping, lengths):
+    '''\
+    'keep' truncates or pads tacts and beats in tacts.
+    '''
+
+    sample = make_sample(ArrayMapping)
+    sample.resize(tact_l, tact_n, 'keep')
+    assert cells(sample) == mapping
+    assert sample.lengths() == lengths
+
+
+@pytest.mark.parametrize('tact_l, tact_n, mapping, lengths', (
+    # Beats are spread, cells after the short row are turned off
+    (8, 2, [[1, 0, 0, 0, 1, 0, 0, 0, 0, 0, 1, 0, 0, 0, 1, 0],
+            [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]], (16, 6)),
+    # Beats are moved to the nearest ones, neighbours are merged
+    (3, 2, [[1, 0, 1, 0, 1, 1],
+            [1, 0, 1, 0, 1, 0]], (6, 6)),
+    (3, 1, [[1, 0, 1],
+            [1, 0, 1]], (3, 3)),
+))
+def test_resize_quantizes(tact_l, tact_n, mapping, lengths):
+    '''\
+    'quantize' moves beats to the nearest beats of the new metre.
+    '''
+
+    sample = make_sample(BytesMapping)
+    sample.resize(tact_l, tact_n, 'quantize')
+    assert cells(sample) == mapping
+    assert sample.lengths() == lengths
+
+
+def test_resize_rejects_unknown_mode():
+    '''\
+    The unknown mode raises ValueError, the sample isn't changed.
+    '''
+
+    sample = make_sample(ArrayMapping)
+    with pytest.raises(ValueError):
+        sample.resize(3, 2, 'stretch')
+    assert cells(sample) == [[1, 0, 1, 0, 0, 1, 0, 1], [1, 0, 0, 1, 0, 1, 0, 0]]
+    assert sample.lengths() == (8, 6)
+
+
+def test_telemetry_ring_wraps():
+    '''\
+    The oldest records are overwritten, records are returned in the order.
+    '''
+
+    telemetry = BeatTelemetry(capacity=4)
+    for beat in range(3):
+        telemetry.record(beat, beat + 0.5)
+    assert telemetry.records()['scheduled'].tolist() == [0, 1, 2]
+    for beat in range(3, 6):
+        telemetry.record(beat, beat + 0.5)
+    assert len(telemetry) == 4
+    assert telemetry.records()['scheduled'].tolist() == [2, 3, 4, 5]
+    assert telemetry.lateness().tolist() == [0.5] * 4
+
+
+def test_telemetry_flags():
+    '''\
+    Missed beats aren't late, 'clamp' marks only the next record.
+    '''
+
+    telemetry = BeatTelemetry()
+    telemetry.record(0.0, 0.001)
+    telemetry.record(1.0, 3.0, flags=MISSED)
+    telemetry.clamp()
+    telemetry.record(2.0, 3.0)
+    telemetry.record(3.0, 3.002)
+    assert telemetry.lateness().tolist() == pytest.approx([0.001, 1.0, 0.002])
+    assert telemetry.records()['flags'].tolist() == [0, MISSED, CLAMPED, 0]
+    assert (telemetry.missed, telemetry.clamped) == (1, 1)
+
+    telemetry.clamp()
+    telemetry.clear()
+    telemetry.record(4.0, 4.0)
+    assert len(telemetry) == 1 and (telemetry.missed, telemetry.clamped) == (0, 0)
+    assert telemetry.records()['flags'].tolist() == [0]
+
+
+def test_telemetry_without_records():
+    '''\
+    Percentiles of no records are NaN.
+    '''
+
+    telemetry = BeatTelemetry()
+    percentiles = telemetry.percentiles(quantiles=(50, 99))
+    assert list(percentiles) == [50, 99]
+    assert all(np.isnan(value) for value in percentiles.values())
+    assert all(np.isnan(value) for value in telemetry.summary()['duration'].values())
+    telemetry.record(0.0, 0.004)
+    assert telemetry.percentiles(quantiles=(50,))[50] == pytest.approx(0.004)